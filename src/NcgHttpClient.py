@@ -0,0 +1,90 @@
+"""
+Pooled HTTP clients singleton
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class NcgHttpClient(object):
+    _instance = None
+    _lock = threading.Lock()
+
+    # Default settings for all clients
+    # - connect_timeout, read_timeout: timeouts in seconds
+    # - pool_connections: number of per-host connection pools kept
+    # - pool_maxsize: maximum number of connections to a single host, requests wait for a free connection
+    # - retries: retries for connection errors and 429/5xx replies, with exponential backoff_factor (in seconds)
+    defaults = {'connect_timeout': 5, 'read_timeout': 30, 'pool_connections': 32, 'pool_maxsize': 8,
+                'retries': 3, 'backoff_factor': 0.5}
+
+    # Settings for each client. Key is the client name (ie. "sourceoftruth"), value is the settings dict
+    settings = {}
+
+    # Pooled sessions. Key is the client name, value is the requests Session
+    sessions = {}
+
+    def __new__(cls, clients: dict = {}):
+        if cls._instance is None:
+            for name, clientSettings in clients.items():
+                cls.settings[name] = {**cls.defaults, **(clientSettings or {})}
+
+            cls._instance = super(cls, NcgHttpClient).__new__(cls)
+
+        return cls._instance
+
+    # Returns the settings for the given client, defaults are used for clients not configured
+    @classmethod
+    def getSettings(cls, name: str):
+        return cls.settings.get(name, cls.defaults)
+
+    # Returns the pooled session for the given client, creating it if needed
+    @classmethod
+    def getSession(cls, name: str):
+        session = cls.sessions.get(name)
+
+        if session is None:
+            with cls._lock:
+                session = cls.sessions.get(name)
+
+                if session is None:
+                    session = cls.__newSession__(cls.getSettings(name))
+                    cls.sessions[name] = session
+
+        return session
+
+    # Returns a new pooled session using the given client settings. Used by clients that need a dedicated session,
+    # ie. for each control plane endpoint and credentials
+    @classmethod
+    def newSession(cls, name: str):
+        return cls.__newSession__(cls.getSettings(name))
+
+    # Returns the (connect, read) timeout tuple for the given client
+    @classmethod
+    def getTimeout(cls, name: str):
+        settings = cls.getSettings(name)
+
+        return settings['connect_timeout'], settings['read_timeout']
+
+    # Sends a GET request using the given client pooled session
+    @classmethod
+    def get(cls, name: str, url: str, **kwargs):
+        return cls.getSession(name).get(url=url, timeout=cls.getTimeout(name), **kwargs)
+
+    @staticmethod
+    def __newSession__(settings: dict):
+        retry = Retry(total=settings['retries'], backoff_factor=settings['backoff_factor'],
+                      status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET', 'HEAD'],
+                      respect_retry_after_header=True, raise_on_status=False)
+
+        adapter = HTTPAdapter(pool_connections=settings['pool_connections'], pool_maxsize=settings['pool_maxsize'],
+                              pool_block=True, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
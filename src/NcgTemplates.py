@@ -0,0 +1,244 @@
+"""
+Jinja2 templates registry singleton
+"""
+
+import base64
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, TemplateError
+
+import v5_6.MiscUtils
+from v5_6.LRUCache import LRUCache
+
+from NcgConfig import NcgConfig
+
+
+class NcgTemplates(object):
+    _instance = None
+    _lock = threading.Lock()
+
+    # Templates root directory and optional bytecode cache directory
+    rootDir = ""
+    bytecodeCache = None
+
+    # Compiled jinja2 environments
+    # For each entry key is the API version (ie. "v5.6"), value is the jinja2 Environment
+    environments = {}
+
+    # Rendered config fragments cache, content-addressed by template identity and rendering context
+    fragmentCache = None
+    _ncgConfigDigest = None
+
+    # Optional thread or process pool used to render queued templates in parallel
+    renderExecutor = None
+    renderWorkers = 0
+
+    def __new__(cls, rootDir, bytecodeCacheDir: str = "", fragmentCacheSize: int = 0, renderWorkers: int = 0,
+                renderPool: str = "thread", apiVersions: list = None):
+        if cls._instance is None:
+            cls.rootDir = rootDir
+
+            if fragmentCacheSize > 0:
+                cls.fragmentCache = LRUCache(maxBytes=fragmentCacheSize)
+
+            if renderWorkers > 1:
+                cls.renderWorkers = renderWorkers
+
+                if renderPool == "process":
+                    cls.renderExecutor = ProcessPoolExecutor(max_workers=renderWorkers, initializer=cls._initWorker,
+                                                             initargs=(NcgConfig.config, rootDir))
+                else:
+                    cls.renderExecutor = ThreadPoolExecutor(max_workers=renderWorkers,
+                                                            thread_name_prefix="ncg-render")
+
+                print(f"Rendering templates using {renderWorkers} {renderPool} workers")
+
+            if bytecodeCacheDir:
+                try:
+                    os.makedirs(bytecodeCacheDir, exist_ok=True)
+                    cls.bytecodeCache = FileSystemBytecodeCache(directory=bytecodeCacheDir)
+                    print(f"Using templates bytecode cache at {bytecodeCacheDir}")
+                except OSError as e:
+                    print(f"Cannot use templates bytecode cache at {bytecodeCacheDir} : {e}")
+
+            cls._instance = super(cls, NcgTemplates).__new__(cls)
+
+            # Build and precompile environments for all known API versions
+            for apiVersion in apiVersions or []:
+                cls.precompile(apiVersion)
+
+        return cls._instance
+
+    # Returns the jinja2 environment for the given API version, creating it if needed.
+    # Compiled templates are kept in memory and only reloaded when the template file changes on disk
+    @classmethod
+    def getEnvironment(cls, apiVersion: str):
+        j2_env = cls.environments.get(apiVersion)
+
+        if j2_env is None:
+            with cls._lock:
+                j2_env = cls.environments.get(apiVersion)
+
+                if j2_env is None:
+                    rootDir = cls.rootDir if cls.rootDir else NcgConfig.config['templates']['root_dir']
+
+                    j2_env = Environment(loader=FileSystemLoader(rootDir + '/' + apiVersion),
+                                         trim_blocks=True, extensions=["jinja2_base64_filters.Base64Filters"],
+                                         bytecode_cache=cls.bytecodeCache, auto_reload=True, cache_size=-1)
+                    j2_env.filters['regex_replace'] = v5_6.MiscUtils.regex_replace
+
+                    cls.environments[apiVersion] = j2_env
+
+        return j2_env
+
+    # Returns the compiled template for the given API version
+    @classmethod
+    def getTemplate(cls, apiVersion: str, templateName: str):
+        return cls.getEnvironment(apiVersion).get_template(templateName)
+
+    # Compiles all templates for the given API version ahead of time
+    # Returns the number of templates compiled
+    @classmethod
+    def precompile(cls, apiVersion: str):
+        j2_env = cls.getEnvironment(apiVersion)
+
+        compiled = 0
+        for templateName in j2_env.list_templates(filter_func=lambda t: t.endswith(('.tmpl', '.conf'))):
+            try:
+                j2_env.get_template(templateName)
+                compiled += 1
+            except TemplateError as e:
+                print(f"Cannot compile template {apiVersion}/{templateName} : {e}")
+
+        print(f"Precompiled {compiled} templates for API {apiVersion}")
+
+        return compiled
+
+    # Process pool workers initialization
+    @classmethod
+    def _initWorker(cls, config: dict, rootDir: str):
+        NcgConfig.config = config
+        cls.rootDir = rootDir
+
+    # Returns the NGINX Declarative API configuration digest, ncgconfig is available to all templates
+    @classmethod
+    def configDigest(cls):
+        if cls._ncgConfigDigest is None:
+            cls._ncgConfigDigest = v5_6.MiscUtils.digest(NcgConfig.config)
+
+        return cls._ncgConfigDigest
+
+    # Returns the digest of all templates for the given API version and of the configuration they are rendered with.
+    # The digest changes when a template is added, removed or updated on disk
+    @classmethod
+    def templatesDigest(cls, apiVersion: str):
+        j2_env = cls.getEnvironment(apiVersion)
+
+        templates = {}
+        for templateName in j2_env.list_templates():
+            try:
+                fileStat = os.stat(os.path.join(j2_env.loader.searchpath[0], templateName))
+                templates[templateName] = (fileStat.st_mtime_ns, fileStat.st_size)
+            except OSError:
+                templates[templateName] = None
+
+        return v5_6.MiscUtils.digest({'templates': templates, 'ncgconfig': cls.configDigest()})
+
+    # Returns the fragments cache key for the given render, or None if the fragments cache is disabled
+    @classmethod
+    def _fragmentKey(cls, apiVersion: str, templateName: str, sharedContext: dict, sharedDigest: str, context: dict):
+        if cls.fragmentCache is None:
+            return None
+
+        if sharedContext and not sharedDigest:
+            sharedDigest = v5_6.MiscUtils.digest(sharedContext)
+
+        template = cls.getTemplate(apiVersion, templateName)
+
+        return (apiVersion, templateName, os.path.getmtime(template.filename), cls.configDigest(),
+                sharedDigest, v5_6.MiscUtils.digest(context))
+
+    # Renders a template with the given context, returns the base64-encoded output
+    @classmethod
+    def _render(cls, apiVersion: str, templateName: str, context: dict):
+        rendered = cls.getTemplate(apiVersion, templateName).render(**context, ncgconfig=NcgConfig.config)
+
+        return base64.b64encode(bytes(rendered, 'utf-8')).decode('utf-8')
+
+    @classmethod
+    def _renderJob(cls, job: tuple):
+        return cls._render(*job)
+
+    # Renders a template and returns its base64-encoded output.
+    # If the fragments cache is enabled the output is reused when template and rendering context are unchanged.
+    # sharedContext holds large read-only variables whose digest (sharedDigest) has been precomputed by the caller
+    # and is the same across multiple renders. ncgconfig is always made available to templates
+    @classmethod
+    def renderB64(cls, apiVersion: str, templateName: str, sharedContext: dict = None, sharedDigest: str = "",
+                  **context):
+        sharedContext = sharedContext or {}
+        cacheKey = cls._fragmentKey(apiVersion, templateName, sharedContext, sharedDigest, context)
+
+        if cacheKey is not None:
+            b64Rendered = cls.fragmentCache.get(cacheKey)
+            if b64Rendered is not None:
+                return b64Rendered
+
+        b64Rendered = cls._render(apiVersion, templateName, {**sharedContext, **context})
+
+        if cacheKey is not None:
+            cls.fragmentCache.put(cacheKey, b64Rendered)
+
+        return b64Rendered
+
+    # Adds a staged configuration file whose contents are rendered later on by renderQueued.
+    # The file is appended to files['files'] right away so that files order does not depend on rendering order
+    @staticmethod
+    def queueRender(renderQueue: list, files: dict, fileName: str, apiVersion: str, templateName: str,
+                    sharedContext: dict = None, sharedDigest: str = "", **context):
+        stagedFile = {'contents': None, 'name': fileName}
+        files['files'].append(stagedFile)
+
+        renderQueue.append((stagedFile, (apiVersion, templateName, sharedContext or {}, sharedDigest, context)))
+
+    # Renders all queued templates filling in the contents of their staged configuration files.
+    # Templates not found in the fragments cache are rendered by the render pool, if configured
+    # Returns the number of templates rendered
+    @classmethod
+    def renderQueued(cls, renderQueue: list):
+        cacheKeys = []
+        pendingFiles = []
+        pendingJobs = []
+
+        for stagedFile, (apiVersion, templateName, sharedContext, sharedDigest, context) in renderQueue:
+            cacheKey = cls._fragmentKey(apiVersion, templateName, sharedContext, sharedDigest, context)
+
+            if cacheKey is not None:
+                b64Rendered = cls.fragmentCache.get(cacheKey)
+                if b64Rendered is not None:
+                    stagedFile['contents'] = b64Rendered
+                    continue
+
+            cacheKeys.append(cacheKey)
+            pendingFiles.append(stagedFile)
+            pendingJobs.append((apiVersion, templateName, {**sharedContext, **context}))
+
+        if cls.renderExecutor is not None and len(pendingJobs) > 1:
+            # Chunking keeps shared context objects pickled once per chunk when using a process pool
+            chunkSize = max(1, len(pendingJobs) // (cls.renderWorkers * 4))
+            allRendered = cls.renderExecutor.map(cls._renderJob, pendingJobs, chunksize=chunkSize)
+        else:
+            allRendered = map(cls._renderJob, pendingJobs)
+
+        for stagedFile, cacheKey, b64Rendered in zip(pendingFiles, cacheKeys, allRendered):
+            stagedFile['contents'] = b64Rendered
+
+            if cacheKey is not None:
+                cls.fragmentCache.put(cacheKey, b64Rendered)
+
+        renderQueue.clear()
+
+        return len(pendingJobs)
@@ -10,17 +10,21 @@ from urllib.parse import urlparse
 import requests
 import schedule
 from fastapi.responses import Response, JSONResponse
-from jinja2 import Environment, FileSystemLoader
 from pydantic import ValidationError
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
 import v5_6.APIGateway
 import v5_6.DevPortal
 import v5_6.DeclarationPatcher
+import v5_6.DeclarationValidator
+import v5_6.DependencyGraph
 import v5_6.GitOps
 import v5_6.MiscUtils
 import v5_6.NIMOutput
 import v5_6.NGINXOneOutput
+import v5_6.PipelineStats
+import v5_6.Rollout
+import v5_6.StagedConfig
 
 # F5 WAF for NGINX helper functions
 import v5_6.NIMNAPUtils
@@ -29,6 +33,7 @@ import v5_6.NIMUtils
 # NGINX Declarative API modules
 from NcgConfig import NcgConfig
 from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
 
 # pydantic models
 from V5_6_NginxConfigDeclaration import *
@@ -47,15 +52,74 @@ def configautosync(configUid):
         declaration = pickle.loads(declFromRedis)
     apiversion = NcgRedis.redis.get(f'ncg.apiversion.{configUid}').decode()
 
-    createconfig(declaration=declaration, apiversion=apiversion, runfromautosync=True, configUid=configUid)
+    if v5_6.Rollout.isRollingOut(configUid):
+        print("Autosyncing configuid [" + configUid + "]: previous deployment in progress")
+        return
+
+    # Objects fetched to fingerprint the declaration sources are reused when creating the configuration
+    v5_6.GitOps.beginFetchSession()
+
+    try:
+        # Nothing is rendered nor published if the declaration and its remote objects are unchanged
+        # since the last successful run
+        d = declaration.model_dump()
+        fingerprint = v5_6.GitOps.sourcesFingerprint(d=d,
+                                                     workers=NcgConfig.config.get('sourceoftruth', {}).get('prefetch_workers', 1),
+                                                     apiVersion=apiversion)
+
+        if NcgRedis.redis.get(f'ncg.autosyncfingerprint.{configUid}') == fingerprint.encode('utf-8'):
+            print("Autosyncing configuid [" + configUid + "]: no changes")
+            return
+
+        reply = __createconfig__(declaration=declaration, apiversion=apiversion, runfromautosync=True,
+                                 configUid=configUid, dryrun=False, incremental=None, d=d,
+                                 autosyncFingerprint=fingerprint)
+
+        # Deployments tracked in the background store the fingerprint once completed
+        if reply['status_code'] != 202:
+            autosyncCompleted(configUid=configUid, fingerprint=fingerprint, statusCode=reply['status_code'])
+    finally:
+        v5_6.GitOps.endFetchSession()
+
+
+# Stores the autosync fingerprint of a declaration once it has been successfully published, see configautosync
+# After a failure the fingerprint is removed and the next autosync run publishes the declaration again
+def autosyncCompleted(configUid: str, fingerprint: str, statusCode: int):
+    if fingerprint is None:
+        return
+
+    if statusCode == 200:
+        NcgRedis.redis.set(f'ncg.autosyncfingerprint.{configUid}', fingerprint)
+    else:
+        NcgRedis.redis.delete(f'ncg.autosyncfingerprint.{configUid}')
 
 
 # Create the given declarative configuration
+# If dryrun is True the staged configuration manifest is returned and nothing is published
+# incremental is set by patch_config to reuse objects not affected by the PATCH, see __incrementalState__
 # Return a JSON string:
 # { "status_code": nnn, "headers": {}, "message": {} }
-def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosync: bool = False, configUid: str = ""):
+def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosync: bool = False, configUid: str = "",
+                 dryrun: bool = False, incremental: dict = None):
+    # Each remote object is fetched once while processing the declaration
+    v5_6.GitOps.beginFetchSession()
+
+    try:
+        return __createconfig__(declaration=declaration, apiversion=apiversion, runfromautosync=runfromautosync,
+                                configUid=configUid, dryrun=dryrun, incremental=incremental)
+    finally:
+        v5_6.GitOps.endFetchSession()
+
+
+# d is the declaration model dump, if already available. autosyncFingerprint is set by configautosync and stored
+# once the declaration has been published, see autosyncCompleted
+def __createconfig__(declaration: ConfigDeclaration, apiversion: str, runfromautosync: bool, configUid: str,
+                     dryrun: bool, incremental: dict, d: dict = None, autosyncFingerprint: str = None):
     # Building NGINX configuration for the given declaration
 
+    # Wall-time, objects and bytes for each pipeline stage
+    pipeline = v5_6.PipelineStats.PipelineStats()
+
     # NGINX configuration files for staged config
     configFiles = {'files': []}
 
@@ -65,113 +129,294 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
     # Extra manifests to be returned to the caller
     extraOutputManifests = []
 
-    try:
-        # Pydantic JSON validation
-        ConfigDeclaration(**declaration.model_dump())
-    except ValidationError as e:
-        print(f"Invalid declaration {e}")
+    ### Validate stage
+    with pipeline.stage('validate') as stage:
+        # The declaration model has already been validated by the caller: this is the only dict copy of it
+        if d is None:
+            d = declaration.model_dump()
+        decltype = d['output']['type']
+
+        if dryrun:
+            d['output']['dryrun'] = True
+
+        if incremental is not None:
+            # Objects not affected by the update are reused as fetched by the previous run
+            v5_6.DependencyGraph.reuseNodes(d=d, previous=incremental['declaration'], affected=incremental['affected'])
+
+        # Check all cross-references before fetching remote objects and rendering
+        invalidReferences = v5_6.DeclarationValidator.validateReferences(d)
+        stage.add(objects=1)
+
+    if invalidReferences:
+        return {"status_code": 422,
+                "message": {"status_code": 422, "message": {"code": 422, "content": invalidReferences}}}
+
+    ### Fetch stage
+    with pipeline.stage('fetch') as stage:
+        # All remote objects are fetched concurrently upfront, then used as needed
+        v5_6.GitOps.prefetchObjects(d=d, workers=NcgConfig.config.get('sourceoftruth', {}).get('prefetch_workers', 1))
+
+        fetchReply, fetched = __fetchObjects__(d=d, auxFiles=auxFiles, stage=stage)
+
+    if fetchReply is not None:
+        if runfromautosync:
+            # The source of truth failure is the latest status of the autosync declaration
+            NcgRedis.redis.set(f'ncg.status.{configUid}', json.dumps(
+                {'code': fetchReply['message']['status_code'], 'content': fetchReply['message']['message'],
+                 'configUid': configUid, 'pipeline': pipeline.toDict()}))
+
+        return fetchReply
+
+    ### Render stage
+    with pipeline.stage('render') as stage:
+        httpConf, streamConf = __renderConfig__(d=d, apiversion=apiversion, fetched=fetched, configFiles=configFiles,
+                                                extraOutputManifests=extraOutputManifests, stage=stage,
+                                                incremental=incremental)
+
+    ### Encode stage
+    with pipeline.stage('encode') as stage:
+        b64HttpConf = str(base64.b64encode(httpConf.encode("utf-8")), "utf-8")
+        b64StreamConf = str(base64.b64encode(streamConf.encode("utf-8")), "utf-8")
+        stage.add(objects=2, bytes=len(b64HttpConf) + len(b64StreamConf))
+
+    ### Diff and publish stages are run by the output modules
+    if decltype.lower() == 'nms':
+        # Output to NGINX Instance Manager
 
-    d = declaration.model_dump()
-    decltype = d['output']['type']
+        # NGINX configuration files for staged config
+        configFiles['rootDir'] = NcgConfig.config['nms']['config_dir']
 
-    j2_env = Environment(loader=FileSystemLoader(NcgConfig.config['templates']['root_dir'] + '/' + apiversion),
-                         trim_blocks=True, extensions=["jinja2_base64_filters.Base64Filters"])
-    j2_env.filters['regex_replace'] = v5_6.MiscUtils.regex_replace
+        # NGINX auxiliary files for staged config
+        auxFiles['rootDir'] = NcgConfig.config['nms']['config_dir']
 
-    # Check resolver profiles validity and creates resolver config files
-    if 'resolvers' in d['declaration']:
-        all_resolver_profiles = []
+        finalReply = v5_6.NIMOutput.NIMOutput(d = d, declaration = declaration, apiversion = apiversion,
+                                 b64HttpConf = b64HttpConf, b64StreamConf = b64StreamConf,
+                                 configFiles = configFiles,
+                                 auxFiles = auxFiles,
+                                 runfromautosync = runfromautosync, configUid = configUid,
+                                 pipeline = pipeline, autosyncFingerprint = autosyncFingerprint )
 
-        d_resolver_profiles = v5_6.MiscUtils.getDictKey(d, 'declaration.resolvers')
-        if d_resolver_profiles is not None:
-            # Render all resolver profiles
-            for i in range(len(d_resolver_profiles)):
-                resolver_profile = d_resolver_profiles[i]
+        if finalReply['status_code'] in [200, 202]:
+            if len(extraOutputManifests) > 0:
+                finalReply['message']['message']['content']['manifests'] = extraOutputManifests
 
-                # Add the rendered resolver configuration snippet as a config file in the staged configuration
-                templateName = NcgConfig.config['templates']['resolver']
-                renderedResolverProfile = j2_env.get_template(templateName).render(
-                    resolverprofile=resolver_profile, ncgconfig=NcgConfig.config)
+        return finalReply
 
-                b64renderedResolverProfile = base64.b64encode(bytes(renderedResolverProfile, 'utf-8')).decode(
-                    'utf-8')
-                configFileName = NcgConfig.config['nms']['resolver_dir'] + '/' + resolver_profile['name'].replace(' ',
-                                                                                                                  '_') + ".conf"
-                resolverProfileConfigFile = {'contents': b64renderedResolverProfile,
-                                             'name': configFileName}
+    elif decltype.lower() == 'nginxone':
+        # Output to NGINX One Console
+
+        # NGINX configuration files for staged config
+        configFiles['name'] = NcgConfig.config['nms']['config_dir']
+
+        # NGINX auxiliary files for staged config
+        auxFiles['name'] = NcgConfig.config['nms']['config_dir']
+
+        finalReply =  v5_6.NGINXOneOutput.NGINXOneOutput(d = d, declaration = declaration, apiversion = apiversion,
+                                 b64HttpConf = b64HttpConf, b64StreamConf = b64StreamConf,
+                                 configFiles = configFiles,
+                                 auxFiles = auxFiles,
+                                 runfromautosync = runfromautosync, configUid = configUid,
+                                 pipeline = pipeline, autosyncFingerprint = autosyncFingerprint )
+
+        if finalReply['status_code'] in [200, 202]:
+            if len(extraOutputManifests) > 0:
+                finalReply['message']['message']['content']['manifests'] = extraOutputManifests
+
+        return finalReply
+    else:
+        return {"status_code": 422, "message": {"status_code": 422, "message": f"output type {decltype} unknown"}}
 
-                all_resolver_profiles.append(resolver_profile['name'])
-                configFiles['files'].append(resolverProfileConfigFile)
+
+# Fetches all objects referenced by the declaration from the source of truth. Snippets are updated in place in d,
+# NGINX Javascript files and Developer Portal pages are added to auxFiles.
+# API Gateway objects are returned in the fetched dict, keyed by (server index, location index)
+# Return is a tuple: reply, fetched. reply is None if all objects were successfully fetched
+def __fetchObjects__(d: dict, auxFiles: dict, stage: v5_6.PipelineStats.PipelineStage):
+    fetched = {'apigateway': {}}
 
     if 'http' in d['declaration']:
         if 'snippet' in d['declaration']['http']:
-            status, snippet = v5_6.GitOps.getObjectFromRepo(object = d['declaration']['http']['snippet'], authProfiles = d['declaration']['http']['authentication'])
+            status, snippet = v5_6.GitOps.getObjectFromRepo(object = d['declaration']['http']['snippet'], authProfiles = d['declaration']['http']['authentication'], pipelineStage = stage)
 
             if status != 200:
-                return {"status_code": 422, "message": {"status_code": status, "message": snippet}}
+                return {"status_code": 422, "message": {"status_code": status, "message": snippet}}, fetched
 
             d['declaration']['http']['snippet'] = snippet
 
-        # Check HTTP upstreams validity
-        all_upstreams = []
+        # HTTP upstreams
         http = d['declaration']['http']
 
         if 'upstreams' in http:
             for i in range(len(http['upstreams'])):
                 upstream = http['upstreams'][i]
 
-                if upstream['resolver'] and upstream['resolver']  not in all_resolver_profiles:
-                    return {"status_code": 422,
-                            "message": {"status_code": status, "message":
-                                {"code": status,
-                                 "content": f"invalid resolver profile [{upstream['resolver']}] in HTTP upstream [{upstream['name']}], must be one of {all_resolver_profiles}"}}}
-
                 if upstream['snippet']:
-                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = upstream['snippet'], authProfiles = d['declaration']['http']['authentication'])
+                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = upstream['snippet'], authProfiles = d['declaration']['http']['authentication'], pipelineStage = stage)
 
                     if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}
+                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}, fetched
 
                     d['declaration']['http']['upstreams'][i]['snippet'] = snippet
 
-                # Add the rendered upstream configuration snippet as a config file in the staged configuration
-                templateName = NcgConfig.config['templates']['upstream_http']
-                renderedUpstreamProfile = j2_env.get_template(templateName).render(
-                    u=upstream, ncgconfig=NcgConfig.config)
+        # NGINX Javascript profiles
+        d_njs_files = v5_6.MiscUtils.getDictKey(d, 'declaration.http.njs_profiles')
+        if d_njs_files is not None:
+            for i in range(len(d_njs_files)):
+                njs_file = d_njs_files[i]
+                njs_filename = njs_file['name'].replace(' ','_')
 
-                b64renderedUpstreamProfile = base64.b64encode(bytes(renderedUpstreamProfile, 'utf-8')).decode(
-                    'utf-8')
-                configFileName = NcgConfig.config['nms']['upstream_http_dir'] + '/' + upstream['name'].replace(' ', '_') + ".conf"
-                upstreamProfileConfigFile = {'contents': b64renderedUpstreamProfile,
-                                         'name': configFileName}
+                status, content = v5_6.GitOps.getObjectFromRepo(object=njs_file['file'],
+                                                                authProfiles=d['declaration']['http'][
+                                                                    'authentication'],
+                                                                pipelineStage=stage)
 
-                configFiles['files'].append(upstreamProfileConfigFile)
-                all_upstreams.append(http['upstreams'][i]['name'])
+                if status != 200:
+                    return {"status_code": 422, "message": {"status_code": status, "message": content}}, fetched
 
-        http = d['declaration']['http']
+                njsAuxFile = {'contents': content['content'],
+                              'name': NcgConfig.config['nms']['njs_dir'] + '/' + njs_filename + '.js'}
+                auxFiles['files'].append(njsAuxFile)
+
+        # HTTP servers
+        d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.servers')
+        if d_servers is not None:
+            for serverIndex, server in enumerate(d_servers):
+                if server['snippet']:
+                    status, serverSnippet = v5_6.GitOps.getObjectFromRepo(object = server['snippet'], authProfiles = d['declaration']['http']['authentication'], base64Encode = False, pipelineStage = stage)
+
+                    if status != 200:
+                        return {"status_code": 422, "message": {"status_code": status, "message": serverSnippet}}, fetched
+
+                    serverSnippet = serverSnippet['content']
+                    server['snippet']['content'] = base64.b64encode(bytes(serverSnippet, 'utf-8')).decode('utf-8')
 
-        # Check HTTP rate_limit profiles validity
-        all_ratelimits = []
+                for locIndex, loc in enumerate(server['locations']):
+                    if loc['snippet']:
+                        status, snippet = v5_6.GitOps.getObjectFromRepo(object = loc['snippet'], authProfiles = d['declaration']['http']['authentication'], pipelineStage = stage)
 
-        d_rate_limit = v5_6.MiscUtils.getDictKey(d, 'declaration.http.rate_limit')
-        if d_rate_limit is not None:
-            for i in range(len(d_rate_limit)):
-                all_ratelimits.append(d_rate_limit[i]['name'])
+                        if status != 200:
+                            return {"status_code": 422, "message": {"status_code": status, "message": snippet}}, fetched
 
-        # Check HTTP cache profiles validity
-        all_cache_profiles = []
+                        loc['snippet'] = snippet
 
-        d_cache_profiles = v5_6.MiscUtils.getDictKey(d, 'declaration.http.cache')
-        if d_cache_profiles is not None:
-            for i in range(len(d_cache_profiles)):
-                all_cache_profiles.append(d_cache_profiles[i]['name'])
+                    # API Gateway OpenAPI schema
+                    if loc['apigateway'] and loc['apigateway']['api_gateway'] and loc['apigateway']['api_gateway']['enabled'] and loc['apigateway']['api_gateway']['enabled'] == True:
 
-        # Check authentication profiles validity and creates authentication config files
+                        status, apiGatewayConfigDeclaration, openAPISchemaJSON = v5_6.APIGateway.createAPIGateway(locationDeclaration = loc, authProfiles = d['declaration']['http']['authentication'])
 
-        # List of all auth client & server profile names
-        all_auth_client_profiles = []
-        all_auth_server_profiles = []
+                        if status!=200:
+                            return {"status_code": 412,
+                                    "message": {"status_code": status, "message":
+                                        {"code": status,
+                                         "content": f"OpenAPI schema fetch failed for {loc['apigateway']['openapi_schema']['content']}"}}}, fetched
 
+                        stage.add(objects=1, bytes=len(openAPISchemaJSON))
+                        fetched['apigateway'][(serverIndex, locIndex)] = (apiGatewayConfigDeclaration, openAPISchemaJSON)
+
+                    # API Gateway Developer portal provisioning
+                    if loc['apigateway'] and loc['apigateway']['developer_portal'] and 'enabled' in loc['apigateway']['developer_portal'] and loc['apigateway']['developer_portal']['enabled'] == True:
+
+                        if loc['apigateway']['developer_portal']['type'].lower() == 'redocly':
+                            ### Redocly developer portal - Add optional API Developer portal HTML files
+                            status, devPortalHTML = v5_6.DevPortal.createDevPortal(locationDeclaration=loc,
+                                                                                   authProfiles=
+                                                                                   d['declaration']['http'][
+                                                                                       'authentication'])
+
+                            if status != 200:
+                                return {"status_code": 412,
+                                        "message": {"status_code": status, "message":
+                                            {"code": status,
+                                             "content": f"Developer Portal creation failed for {loc['uri']}"}}}, fetched
+
+                            stage.add(objects=1, bytes=len(devPortalHTML))
+
+                            newAuxFile = {'contents': devPortalHTML, 'name': NcgConfig.config['nms']['devportal_dir'] +
+                                                                               loc['apigateway']['developer_portal']['redocly']['uri']}
+                            auxFiles['files'].append(newAuxFile)
+
+                            ### / Redocly developer portal - Add optional API Developer portal HTML files
+
+    if 'layer4' in d['declaration']:
+        # Layer4/stream upstreams
+        d_upstreams = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.upstreams')
+        if d_upstreams is not None:
+            for i in range(len(d_upstreams)):
+                upstream = d_upstreams[i]
+
+                if upstream['snippet']:
+                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = upstream['snippet'], authProfiles = d['declaration']['http']['authentication'], pipelineStage = stage)
+
+                    if status != 200:
+                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}, fetched
+
+                    d['declaration']['layer4']['upstreams'][i]['snippet'] = snippet
+
+        d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.servers')
+        if d_servers is not None:
+            for server in d_servers:
+
+                if server['snippet']:
+                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = server['snippet'], authProfiles = d['declaration']['http']['authentication'], pipelineStage = stage)
+
+                    if status != 200:
+                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}, fetched
+
+                    server['snippet'] = snippet
+
+    return None, fetched
+
+
+# Adds a staged configuration file generated for the given declaration node. Files of nodes not affected by
+# a PATCH are reused from the previously published staged configuration, all other files are queued for rendering
+def __stageFile__(renderQueue: list, configFiles: dict, incremental: dict, node: tuple, fileName: str, apiversion: str,
+                  templateName: str, sharedContext: dict = {}, sharedDigest: str = "", **context):
+    if incremental is not None and node not in incremental['affected'] and fileName in incremental['files']:
+        configFiles['files'].append({'contents': incremental['files'][fileName], 'name': fileName})
+    else:
+        NcgTemplates.queueRender(renderQueue, configFiles, fileName, apiversion, templateName,
+                                 sharedContext=sharedContext, sharedDigest=sharedDigest, **context)
+
+
+# Renders all staged configuration files for the given declaration, once all remote objects have been fetched
+# Rendered files are added to configFiles, Backstage manifests to extraOutputManifests
+# Return is a tuple: httpConf, streamConf
+def __renderConfig__(d: dict, apiversion: str, fetched: dict, configFiles: dict, extraOutputManifests: list,
+                     stage: v5_6.PipelineStats.PipelineStage, incremental: dict = None):
+    # Precompiled templates for the given API version
+    j2_env = NcgTemplates.getEnvironment(apiversion)
+
+    # Templates to be rendered into staged configuration files once all declaration objects have been processed
+    renderQueue = []
+
+    # Create resolver config files
+    if 'resolvers' in d['declaration']:
+        d_resolver_profiles = v5_6.MiscUtils.getDictKey(d, 'declaration.resolvers')
+        if d_resolver_profiles is not None:
+            # Render all resolver profiles
+            for i in range(len(d_resolver_profiles)):
+                resolver_profile = d_resolver_profiles[i]
+
+                # Add the rendered resolver configuration snippet as a config file in the staged configuration
+                templateName = NcgConfig.config['templates']['resolver']
+                configFileName = NcgConfig.config['nms']['resolver_dir'] + '/' + resolver_profile['name'].replace(' ',
+                                                                                                                  '_') + ".conf"
+                __stageFile__(renderQueue, configFiles, incremental, ('resolver', resolver_profile['name']), configFileName, apiversion, templateName, resolverprofile=resolver_profile)
+
+    if 'http' in d['declaration']:
+        # HTTP upstreams
+        http = d['declaration']['http']
+
+        if 'upstreams' in http:
+            for i in range(len(http['upstreams'])):
+                upstream = http['upstreams'][i]
+
+                # Add the rendered upstream configuration snippet as a config file in the staged configuration
+                templateName = NcgConfig.config['templates']['upstream_http']
+                configFileName = NcgConfig.config['nms']['upstream_http_dir'] + '/' + upstream['name'].replace(' ', '_') + ".conf"
+                __stageFile__(renderQueue, configFiles, incremental, ('http_upstream', upstream['name']), configFileName, apiversion, templateName, u=upstream)
+
+        # Create authentication config files
         d_auth_profiles = v5_6.MiscUtils.getDictKey(d, 'declaration.http.authentication')
         if d_auth_profiles is not None:
             if 'client' in d_auth_profiles:
@@ -185,60 +430,27 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
                         case 'jwt':
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - jwt template
                             templateName = NcgConfig.config['templates']['auth_client_root']+"/jwt.tmpl"
-                            renderedClientAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedClientAuthProfile = base64.b64encode(bytes(renderedClientAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_client_dir'] + '/'+auth_profile['name'].replace(' ','_')+".conf"
-                            authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                              'name': configFileName }
-
-                            all_auth_client_profiles.append(auth_profile['name'])
-                            configFiles['files'].append(authProfileConfigFile)
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_client', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - jwks template
                             templateName = NcgConfig.config['templates']['auth_client_root']+"/jwks.tmpl"
-                            renderedClientAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedClientAuthProfile = base64.b64encode(bytes(renderedClientAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_client_dir'] + '/jwks_'+auth_profile['name'].replace(' ','_')+".conf"
-                            authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                              'name': configFileName }
-
-                            configFiles['files'].append(authProfileConfigFile)
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_client', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
                         case 'mtls':
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - mTLS template
                             templateName = NcgConfig.config['templates']['auth_client_root'] + "/mtls.tmpl"
-                            renderedClientAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedClientAuthProfile = base64.b64encode(
-                                bytes(renderedClientAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_client_dir'] + '/' + auth_profile[
                                 'name'].replace(' ', '_') + ".conf"
-                            authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                                     'name': configFileName}
-
-                            all_auth_client_profiles.append(auth_profile['name'])
-                            configFiles['files'].append(authProfileConfigFile)
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_client', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
                         case 'oidc':
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - OpenID Connect template
                             templateName = NcgConfig.config['templates']['auth_client_root'] + "/oidc.tmpl"
-                            renderedClientAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedClientAuthProfile = base64.b64encode(
-                                bytes(renderedClientAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_client_dir'] + '/oidc/' + auth_profile[
                                 'name'].replace(' ', '_') + ".conf"
-                            authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                                     'name': configFileName}
-
-                            all_auth_client_profiles.append(auth_profile['name'])
-                            configFiles['files'].append(authProfileConfigFile)
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_client', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
             if 'server' in d_auth_profiles:
                 # Render all server authentication profiles
@@ -251,39 +463,18 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
                         case 'token':
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - token template
                             templateName = NcgConfig.config['templates']['auth_server_root']+"/token.tmpl"
-                            renderedServerAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedServerAuthProfile = base64.b64encode(bytes(renderedServerAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_server_dir'] + '/'+auth_profile['name'].replace(' ','_')+".conf"
-                            authProfileConfigFile = {'contents': b64renderedServerAuthProfile,
-                                              'name': configFileName }
-
-                            all_auth_server_profiles.append(auth_profile['name'])
-                            configFiles['files'].append(authProfileConfigFile)
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_server', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
                         case 'mtls':
                             # Add the rendered authentication configuration snippet as a config file in the staged configuration - mTLS template
                             templateName = NcgConfig.config['templates']['auth_server_root'] + "/mtls.tmpl"
-                            renderedServerAuthProfile = j2_env.get_template(templateName).render(
-                                authprofile=auth_profile, ncgconfig=NcgConfig.config)
-
-                            b64renderedServerAuthProfile = base64.b64encode(
-                                bytes(renderedServerAuthProfile, 'utf-8')).decode('utf-8')
                             configFileName = NcgConfig.config['nms']['auth_server_dir'] + '/' + auth_profile[
                                 'name'].replace(' ', '_') + ".conf"
-                            authProfileConfigFile = {'contents': b64renderedServerAuthProfile,
-                                                     'name': configFileName}
+                            __stageFile__(renderQueue, configFiles, incremental, ('auth_server', auth_profile['name']), configFileName, apiversion, templateName, authprofile=auth_profile)
 
-                            all_auth_server_profiles.append(auth_profile['name'])
-                            configFiles['files'].append(authProfileConfigFile)
-
-
-        # Check authorization profiles validity and creates authorization config files
-
-        # List of all authorization client profile names
-        all_authz_client_profiles = []
 
+        # Create authorization config files
         d_authz_profiles = v5_6.MiscUtils.getDictKey(d, 'declaration.http.authorization')
         if d_authz_profiles is not None:
             # Render all client authorization profiles
@@ -295,54 +486,17 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
                     case 'jwt':
                         # Add the rendered authorization configuration snippet as a config file in the staged configuration - jwt authZ maps template
                         templateName = NcgConfig.config['templates']['authz_client_root']+"/jwt-authz-map.tmpl"
-                        renderedClientAuthZProfile = j2_env.get_template(templateName).render(
-                            authprofile=authz_profile, ncgconfig=NcgConfig.config)
-
-                        b64renderedClientAuthProfile = base64.b64encode(bytes(renderedClientAuthZProfile, 'utf-8')).decode('utf-8')
                         configFileName = NcgConfig.config['nms']['authz_client_dir'] + '/'+authz_profile['name'].replace(' ','_')+".maps.conf"
-                        authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                          'name': configFileName }
-
-                        all_authz_client_profiles.append(authz_profile['name'])
-                        configFiles['files'].append(authProfileConfigFile)
+                        __stageFile__(renderQueue, configFiles, incremental, ('authz', authz_profile['name']), configFileName, apiversion, templateName, authprofile=authz_profile)
 
                         # Add the rendered authorization configuration snippet as a config file in the staged configuration - jwt template
                         templateName = NcgConfig.config['templates']['authz_client_root'] + "/jwt.tmpl"
-                        renderedClientAuthZProfile = j2_env.get_template(templateName).render(
-                            authprofile=authz_profile, ncgconfig=NcgConfig.config)
-
-                        b64renderedClientAuthProfile = base64.b64encode(bytes(renderedClientAuthZProfile, 'utf-8')).decode(
-                            'utf-8')
                         configFileName = NcgConfig.config['nms']['authz_client_dir'] + '/' + authz_profile['name'].replace(' ',
                                                                                                                            '_') + ".conf"
-                        authProfileConfigFile = {'contents': b64renderedClientAuthProfile,
-                                                 'name': configFileName}
-
-                        configFiles['files'].append(authProfileConfigFile)
-
-        # NGINX Javascript profiles
-        all_njs_profiles = []
-        d_njs_files = v5_6.MiscUtils.getDictKey(d, 'declaration.http.njs_profiles')
-        if d_njs_files is not None:
-            for i in range(len(d_njs_files)):
-                njs_file = d_njs_files[i]
-                njs_filename = njs_file['name'].replace(' ','_')
-
-                status, content = v5_6.GitOps.getObjectFromRepo(object=njs_file['file'],
-                                                                authProfiles=d['declaration']['http'][
-                                                                    'authentication'])
-
-                if status != 200:
-                    return {"status_code": 422, "message": {"status_code": status, "message": content}}
-
-                njsAuxFile = {'contents': content['content'],
-                              'name': NcgConfig.config['nms']['njs_dir'] + '/' + njs_filename + '.js'}
-                auxFiles['files'].append(njsAuxFile)
-                all_njs_profiles.append(njs_filename)
+                        __stageFile__(renderQueue, configFiles, incremental, ('authz', authz_profile['name']), configFileName, apiversion, templateName, authprofile=authz_profile)
 
         # NGINX ACME issuer profiles
         d_acme_issuers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.acme_issuers')
-        all_acme_issuers = []
         if d_acme_issuers is not None:
             # Render all ACME issuer profiles
             for i in range(len(d_acme_issuers)):
@@ -350,175 +504,26 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
 
                 # Add the rendered resolver configuration snippet as a config file in the staged configuration
                 templateName = NcgConfig.config['templates']['acme_issuer']
-                renderedAcmeIssuerProfile = j2_env.get_template(templateName).render(
-                    acmeprofile=acme_issuer, ncgconfig=NcgConfig.config)
-
-                b64renderedAcmeProfile = base64.b64encode(bytes(renderedAcmeIssuerProfile, 'utf-8')).decode(
-                    'utf-8')
                 configFileName = NcgConfig.config['nms']['acme_dir'] + '/' + acme_issuer['name'].replace(
                     ' ','_') + ".conf"
-                acmeProfileConfigFile = {'contents': b64renderedAcmeProfile,
-                                             'name': configFileName}
-
-                all_acme_issuers.append(acme_issuer['name'])
-                configFiles['files'].append(acmeProfileConfigFile)
-
-        # HTTP level Javascript hooks
-        d_http_njs_hooks = v5_6.MiscUtils.getDictKey(d, 'declaration.http.njs')
-        if d_http_njs_hooks is not None:
-            for i in range(len(d_http_njs_hooks)):
-                if d_http_njs_hooks[i]['profile'] not in all_njs_profiles:
-                    return {"status_code": 422,
-                            "message": {"status_code": status, "message":
-                                {"code": status,
-                                 "content": f"invalid njs profile [{d_http_njs_hooks[i]['profile']}] in HTTP declaration, must be one of {all_njs_profiles}"}}}
-
-        # HTTP level resolver validity check
-        d_http_resolver = v5_6.MiscUtils.getDictKey(d, 'declaration.http.resolver')
-        if d_http_resolver:
-            if d_http_resolver not in all_resolver_profiles:
-                return {"status_code": 422,
-                        "message": {"status_code": status, "message":
-                            {"code": status,
-                             "content": f"invalid resolver profile [{d_http_resolver}] in HTTP context, must be one of {all_resolver_profiles}"}}}
+                __stageFile__(renderQueue, configFiles, incremental, ('acme', acme_issuer['name']), configFileName, apiversion, templateName, acmeprofile=acme_issuer)
 
         # Parse HTTP servers
         d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.servers')
         if d_servers is not None:
-            for server in d_servers:
-                serverSnippet = ''
-
-                # Server level resolver name validity check
-                if server['resolver']:
-                    if server['resolver'] not in all_resolver_profiles:
-                        return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid resolver profile [{server['resolver']}] in HTTP server [{server['name']}], must be one of {all_resolver_profiles}"}}}
-
-                # Server level cache profile name validity
-                if server['cache']:
-                    if server['cache']['profile'] not in all_cache_profiles and server['cache']['profile'] != "":
-                        return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid cache profile [{server['cache']['profile']}] in HTTP server [{server['name']}], must be one of {all_cache_profiles}"}}}
-
-                # Server level Javascript hooks
-                if server['njs']:
-                    for i in range(len(server['njs'])):
-                        if server['njs'][i]['profile'] not in all_njs_profiles:
-                            return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid njs profile [{server['njs'][i]['profile']}] in server [{server['name']}], must be one of {all_njs_profiles}"}}}
-
-                # Server client authentication name validity check
-                if 'authentication' in server and server['authentication']:
-                    serverAuthClientProfiles = server['authentication']['client']
-
-                    for authClientProfile in serverAuthClientProfiles:
-                        if authClientProfile['profile'] not in all_auth_client_profiles:
-                            return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid client authentication profile [{authClientProfile['profile']}] in server [{server['name']}] must be one of {all_auth_client_profiles}"}}}
-
-                # Server client authorization name validity check
-                if 'authorization' in server and server['authorization']:
-                    if server['authorization']['profile'] and server['authorization']['profile'] not in all_authz_client_profiles:
-                        return {"status_code": 422,
-                                "message": {"status_code": status, "message":
-                                    {"code": status,
-                                     "content": f"invalid client authorization profile [{server['authorization']['profile']}] in server [{server['name']}] must be one of {all_authz_client_profiles}"}}}
-
-                # mTLS client authentication name validity check
-                if 'authentication' in server['listen']['tls']:
-                    if 'client' in server['listen']['tls']['authentication']:
-                        tlsAuthProfiles = server['listen']['tls']['authentication']['client']
-                        for mtlsClientProfile in tlsAuthProfiles:
-                            if mtlsClientProfile['profile'] not in all_auth_client_profiles:
-                                return {"status_code": 422,
-                                        "message": {"status_code": status, "message":
-                                            {"code": status,
-                                             "content": f"invalid client authentication profile [{mtlsClientProfile['profile']}] in server [{server['name']}] must be one of {all_auth_client_profiles}"}}}
-
-                # ACME issuers name validity check
-                if 'acme_issuer' in server['listen']['tls']:
-                    acmeIssuer = server['listen']['tls']['acme_issuer']
-                    if acmeIssuer and acmeIssuer not in all_acme_issuers:
-                        return {"status_code": 422,
-                                "message": {"status_code": status, "message":
-                                    {"code": status,
-                                     "content": f"invalid ACME issuer [{acmeIssuer}] in server [{server['name']}] must be one of {all_acme_issuers}"}}}
-
-                if server['snippet']:
-                    status, serverSnippet = v5_6.GitOps.getObjectFromRepo(object = server['snippet'], authProfiles = d['declaration']['http']['authentication'], base64Encode = False)
-
-                    if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": serverSnippet}}
-
-                    serverSnippet = serverSnippet['content']
+            # HTTP servers are rendered one per file: the digest of the shared HTTP declaration is computed once
+            # and does not include the servers themselves
+            httpDigest = v5_6.MiscUtils.digest({k: v for k, v in d['declaration']['http'].items() if k != 'servers'})
 
+            for serverIndex, server in enumerate(d_servers):
                 # Create HTTP server configuration file
-                httpServerConf = j2_env.get_template(NcgConfig.config['templates']['server_http']).render(declaration=d['declaration']['http'], s=server, ncgconfig=NcgConfig.config)
-                httpServerConfb64 = base64.b64encode(bytes(httpServerConf, 'utf-8')).decode('utf-8')
-                newHttpServerAuxFile = {'contents': httpServerConfb64, 'name': NcgConfig.config['nms']['server_http_dir'] +
-                                                                        '/' + server['name'].replace(' ', '_') + ".conf"}
-                configFiles['files'].append(newHttpServerAuxFile)
-
-                for loc in server['locations']:
-
-                    # Location level Javascript hooks
-                    if loc['njs']:
-                        for i in range(len(loc['njs'])):
-                            if loc['njs'][i]['profile'] not in all_njs_profiles:
-                                return {"status_code": 422,
-                                        "message": {"status_code": status, "message":
-                                            {"code": status,
-                                             "content": f"invalid njs profile [{loc['njs'][i]['profile']}] in location [{loc['uri']}], must be one of {all_njs_profiles}"}}}
-
-                    if loc['snippet']:
-                        status, snippet = v5_6.GitOps.getObjectFromRepo(object = loc['snippet'], authProfiles = d['declaration']['http']['authentication'])
-
-                        if status != 200:
-                            return {"status_code": 422, "message": {"status_code": status, "message": snippet}}
-
-                        loc['snippet'] = snippet
-
-                    # Location upstream name validity check
-                    if 'upstream' in loc and loc['upstream'] and urlparse(loc['upstream']).netloc not in all_upstreams:
-                        return {"status_code": 422,
-                                "message": {"status_code": status, "message":
-                                    {"code": status, "content": f"invalid HTTP upstream [{loc['upstream']}]"}}}
-
-                    # Location client authentication name validity check
-                    if 'authentication' in loc and loc['authentication']:
-                        locAuthClientProfiles = loc['authentication']['client']
-
-                        for authClientProfile in locAuthClientProfiles:
-                            if authClientProfile['profile'] not in all_auth_client_profiles:
-                                return {"status_code": 422,
-                                        "message": {"status_code": status, "message":
-                                            {"code": status, "content": f"invalid client authentication profile [{authClientProfile['profile']}] in location [{loc['uri']}] must be one of {all_auth_client_profiles}"}}}
-
-                    # Location client authorization name validity check
-                    if 'authorization' in loc and loc['authorization']:
-                        if loc['authorization']['profile'] and loc['authorization']['profile'] not in all_authz_client_profiles:
-                            return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status, "content": f"invalid client authorization profile [{loc['authorization']['profile']}] in location [{loc['uri']}] must be one of {all_authz_client_profiles}"}}}
-
-                    # Location server authentication name validity check
-                    if 'authentication' in loc and loc['authentication']:
-                        locAuthServerProfiles = loc['authentication']['server']
-
-                        for authServerProfile in locAuthServerProfiles:
-                            if authServerProfile['profile'] not in all_auth_server_profiles:
-                                return {"status_code": 422,
-                                        "message": {"status_code": status, "message":
-                                            {"code": status, "content": f"invalid server authentication profile [{authServerProfile['profile']}] in location [{loc['uri']}]"}}}
+                __stageFile__(renderQueue, configFiles, incremental, ('http_server', server['name']),
+                              NcgConfig.config['nms']['server_http_dir'] + '/' + server['name'].replace(' ', '_') + ".conf",
+                              apiversion, NcgConfig.config['templates']['server_http'],
+                              sharedContext={'declaration': d['declaration']['http']}, sharedDigest=httpDigest,
+                              s=server)
 
+                for locIndex, loc in enumerate(server['locations']):
                     # API Gateway visualization integrations
                     apiGwVisibilityIntegrations = {}
 
@@ -536,232 +541,67 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
                                     # Add the rendered Moesif visibility configuration snippet as a config file in the staged configuration - HTTP context
                                     templateName = NcgConfig.config['templates'][
                                                        'visibility_root'] + "/moesif/http.tmpl"
-                                    renderedMoesifHTTP = j2_env.get_template(templateName).render(
-                                        vis=vis, loc=loc, ncgconfig=NcgConfig.config)
-
-                                    b64renderedMoesifHTTP = base64.b64encode(
-                                        bytes(renderedMoesifHTTP, 'utf-8')).decode(
-                                        'utf-8')
-                                    moesifHTTPConfigFile = {'contents': b64renderedMoesifHTTP,
-                                                            'name': NcgConfig.config['nms'][
-                                                                        'visibility_dir'] +
-                                                                    loc['uri'] + "-moesif-http.conf"}
-
-                                    configFiles['files'].append(moesifHTTPConfigFile)
+                                    __stageFile__(renderQueue, configFiles, incremental, ('http_server', server['name']),
+                                                  NcgConfig.config['nms']['visibility_dir'] + loc['uri'] + "-moesif-http.conf",
+                                                  apiversion, templateName, vis=vis, loc=loc)
 
                                     # Add the rendered Moesif visibility configuration snippet as a config file in the staged configuration - server context
                                     templateName = NcgConfig.config['templates'][
                                                        'visibility_root'] + "/moesif/server.tmpl"
-                                    renderedMoesifServer = j2_env.get_template(templateName).render(
-                                        vis=vis, loc=loc, ncgconfig=NcgConfig.config)
-
-                                    b64renderedMoesifServer = base64.b64encode(
-                                        bytes(renderedMoesifServer, 'utf-8')).decode(
-                                        'utf-8')
-                                    moesifServerConfigFile = {'contents': b64renderedMoesifServer,
-                                                              'name': NcgConfig.config['nms'][
-                                                                          'visibility_dir'] +
-                                                                      loc['uri'] + "-moesif-server.conf"}
-
-                                    configFiles['files'].append(moesifServerConfigFile)
-
-                    # API Gateway provisioning
-                    if loc['apigateway'] and loc['apigateway']['api_gateway'] and loc['apigateway']['api_gateway']['enabled'] and loc['apigateway']['api_gateway']['enabled'] == True:
-
-                        # API Gateway authentication profile names validity check
-                        if loc['apigateway']['authentication'] and loc['apigateway']['authentication']['client']:
-                            apigw_authn_profiles = loc['apigateway']['authentication']['client']
-                            for i in range(len(apigw_authn_profiles)):
-                                if apigw_authn_profiles[i]['profile'] not in all_auth_client_profiles:
-                                    return {"status_code": 422,
-                                            "message": {"status_code": status, "message":
-                                                {"code": status,
-                                                 "content": f"invalid API Gateway authentication profile [{apigw_authn_profiles[i]['profile']}] for OpenAPI schema [{loc['apigateway']['openapi_schema']['content']}] must be one of {all_auth_client_profiles}"}}}
-
-                        # API Gateway authorization profile names validity check
-                        if loc['apigateway']['authorization']:
-                            apigw_authz_profiles = loc['apigateway']['authorization']
-                            for i in range(len(apigw_authz_profiles)):
-                                if apigw_authz_profiles[i]['profile'] not in all_authz_client_profiles:
-                                    return {"status_code": 422,
-                                            "message": {"status_code": status, "message":
-                                                {"code": status,
-                                                 "content": f"invalid API Gateway authorization profile [{apigw_authz_profiles[i]['profile']}] for OpenAPI schema [{loc['apigateway']['openapi_schema']['content']}] must be one of {all_authz_client_profiles}"}}}
-
-                        # API Gateway rate limiting profile names validity check
-                        if loc['apigateway']['rate_limit']:
-                            apigw_rl_profiles = loc['apigateway']['rate_limit']
-                            for i in range(len(apigw_rl_profiles)):
-                                if apigw_rl_profiles[i]['profile'] not in all_ratelimits:
-                                    return {"status_code": 422,
-                                            "message": {"status_code": status, "message":
-                                                {"code": status,
-                                                 "content": f"invalid API Gateway rate limit profile [{apigw_authz_profiles[i]['profile']}] for OpenAPI schema [{loc['apigateway']['openapi_schema']['content']}] must be one of {all_ratelimits}"}}}
-
-                        openApiAuthProfile = loc['apigateway']['openapi_schema']['authentication']
-                        if openApiAuthProfile and openApiAuthProfile[0]['profile'] not in all_auth_server_profiles:
-                            return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid server authentication profile [{openApiAuthProfile[0]['profile']}] for OpenAPI schema [{loc['apigateway']['openapi_schema']['content']}]"}}}
-
-                        status, apiGatewayConfigDeclaration, openAPISchemaJSON = v5_6.APIGateway.createAPIGateway(locationDeclaration = loc, authProfiles = loc['apigateway']['openapi_schema']['authentication'])
-
-                        if status!=200:
-                            return {"status_code": 412,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"OpenAPI schema fetch failed for {loc['apigateway']['openapi_schema']['content']}"}}}
-
-                        # API Gateway configuration template rendering
-                        if apiGatewayConfigDeclaration:
-                            # API Gateway server / locations file
-                            apiGatewaySnippet = j2_env.get_template(NcgConfig.config['templates']['apigwconf']).render(
-                                declaration=apiGatewayConfigDeclaration, server=server['names'][0], enabledVisibility=apiGwVisibilityIntegrations, ncgconfig=NcgConfig.config)
-                            apiGatewaySnippetb64 = base64.b64encode(bytes(apiGatewaySnippet, 'utf-8')).decode('utf-8')
-
-                            newAuxFile = {'contents': apiGatewaySnippetb64, 'name': NcgConfig.config['nms']['apigw_dir'] +
-                                                                            '/' + server['names'][0] +
-                                                                            loc['uri'] + ".conf" }
-                            configFiles['files'].append(newAuxFile)
-
-                            # API Gateway maps file for parameters enforcement
-                            apiGatewayMapsSnippet = j2_env.get_template(NcgConfig.config['templates']['apigwmapsconf']).render(
-                                declaration=apiGatewayConfigDeclaration, server=server['names'][0], ncgconfig=NcgConfig.config)
-                            apiGatewayMapsSnippetb64 = base64.b64encode(bytes(apiGatewayMapsSnippet, 'utf-8')).decode('utf-8')
-
-                            newAuxFile = {'contents': apiGatewayMapsSnippetb64, 'name': NcgConfig.config['nms']['apigw_maps_dir'] +
-                                                                            '/' + server['names'][0] +
-                                                                            loc['uri'].replace('/', '_') + ".conf" }
-                            configFiles['files'].append(newAuxFile)
-
-                    # API Gateway Developer portal provisioning
-                    if loc['apigateway'] and loc['apigateway']['developer_portal'] and 'enabled' in loc['apigateway']['developer_portal'] and loc['apigateway']['developer_portal']['enabled'] == True:
-
-                        if loc['apigateway']['developer_portal']['type'].lower() == 'redocly':
-                            ### Redocly developer portal - Add optional API Developer portal HTML files
-                            status, devPortalHTML = v5_6.DevPortal.createDevPortal(locationDeclaration=loc,
-                                                                                   authProfiles=
-                                                                                   d['declaration']['http'][
-                                                                                       'authentication'])
-
-                            if status != 200:
-                                return {"status_code": 412,
-                                        "message": {"status_code": status, "message":
-                                            {"code": status,
-                                             "content": f"Developer Portal creation failed for {loc['uri']}"}}}
-
-                            newAuxFile = {'contents': devPortalHTML, 'name': NcgConfig.config['nms']['devportal_dir'] +
-                                                                               loc['apigateway']['developer_portal']['redocly']['uri']}
-                            auxFiles['files'].append(newAuxFile)
-
-                            ### / Redocly developer portal - Add optional API Developer portal HTML files
-                        elif loc['apigateway']['developer_portal']['type'].lower() == 'backstage':
-                            ### Backstage developer portal - Create Kubernetes Backstage manifest
-                            backstageManifest = j2_env.get_template(f"{NcgConfig.config['templates']['devportal_root']}/backstage.tmpl").render(
-                                declaration=loc['apigateway']['developer_portal']['backstage'], openAPISchema = v5_6.MiscUtils.json_to_yaml(openAPISchemaJSON), ncgconfig=NcgConfig.config)
-
-                            extraOutputManifests.append(backstageManifest)
-                            ### / Backstage developer portal - Create Kubernetes Backstage manifest
-
-                    # Check location-level rate limit profile name validity
-                    if loc['rate_limit'] is not None:
-                        if 'profile' in loc['rate_limit'] and loc['rate_limit']['profile'] and loc['rate_limit'][
-                            'profile'] not in all_ratelimits:
-                            return {"status_code": 422,
-                                    "message": {
-                                        "status_code": status,
-                                        "message":
-                                            {"code": status,
-                                             "content":
-                                                 f"invalid rate_limit profile [{loc['rate_limit']['profile']}]"}}}
-
-                    # Check location-level cache profile name validity
-                    if loc['cache'] is not None:
-                        if 'profile' in loc['cache'] and loc['cache']['profile'] and loc['cache'][
-                                    'profile'] not in all_cache_profiles and loc['cache'][
-                                    'profile'] != "":
-                            return {"status_code": 422,
-                                    "message": {
-                                        "status_code": status,
-                                        "message":
-                                            {"code": status,
-                                             "content":
-                                                 f"invalid cache profile [{loc['cache']['profile']}]"}}}
-
-            server['snippet']['content'] = base64.b64encode(bytes(serverSnippet, 'utf-8')).decode('utf-8')
+                                    __stageFile__(renderQueue, configFiles, incremental, ('http_server', server['name']),
+                                                  NcgConfig.config['nms']['visibility_dir'] + loc['uri'] + "-moesif-server.conf",
+                                                  apiversion, templateName, vis=vis, loc=loc)
+
+                    # API Gateway objects fetched for this location
+                    apiGatewayConfigDeclaration, openAPISchemaJSON = fetched['apigateway'].get((serverIndex, locIndex), (None, None))
+
+                    # API Gateway configuration template rendering
+                    if apiGatewayConfigDeclaration:
+                        # API Gateway server / locations file
+                        __stageFile__(renderQueue, configFiles, incremental, ('http_server', server['name']),
+                                      NcgConfig.config['nms']['apigw_dir'] + '/' + server['names'][0] + loc['uri'] + ".conf",
+                                      apiversion, NcgConfig.config['templates']['apigwconf'],
+                                      declaration=apiGatewayConfigDeclaration, server=server['names'][0],
+                                      enabledVisibility=apiGwVisibilityIntegrations)
+
+                        # API Gateway maps file for parameters enforcement
+                        __stageFile__(renderQueue, configFiles, incremental, ('http_server', server['name']),
+                                      NcgConfig.config['nms']['apigw_maps_dir'] + '/' + server['names'][0] + loc['uri'].replace('/', '_') + ".conf",
+                                      apiversion, NcgConfig.config['templates']['apigwmapsconf'],
+                                      declaration=apiGatewayConfigDeclaration, server=server['names'][0])
+
+                    # Backstage developer portal - Create Kubernetes Backstage manifest
+                    if loc['apigateway'] and loc['apigateway']['developer_portal'] and 'enabled' in loc['apigateway']['developer_portal'] and loc['apigateway']['developer_portal']['enabled'] == True \
+                            and loc['apigateway']['developer_portal']['type'].lower() == 'backstage':
+                        backstageManifest = j2_env.get_template(f"{NcgConfig.config['templates']['devportal_root']}/backstage.tmpl").render(
+                            declaration=loc['apigateway']['developer_portal']['backstage'], openAPISchema = v5_6.MiscUtils.json_to_yaml(openAPISchemaJSON), ncgconfig=NcgConfig.config)
+
+                        extraOutputManifests.append(backstageManifest)
+                        stage.add(objects=1, bytes=len(backstageManifest))
 
     if 'layer4' in d['declaration']:
-        # Check Layer4/stream upstreams validity
-        all_upstreams = []
-
+        # Layer4/stream upstreams
         d_upstreams = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.upstreams')
         if d_upstreams is not None:
             for i in range(len(d_upstreams)):
                 upstream = d_upstreams[i]
 
-                if upstream['resolver'] and upstream['resolver']  not in all_resolver_profiles:
-                    return {"status_code": 422,
-                            "message": {"status_code": status, "message":
-                                {"code": status,
-                                 "content": f"invalid resolver profile [{upstream['resolver']}] in stream upstream [{upstream['name']}], must be one of {all_resolver_profiles}"}}}
-
-                if upstream['snippet']:
-                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = upstream['snippet'], authProfiles = d['declaration']['http']['authentication'])
-
-                    if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}
-
-                    d['declaration']['layer4']['upstreams'][i]['snippet'] = snippet
-
                 # Add the rendered upstream configuration snippet as a config file in the staged configuration
                 templateName = NcgConfig.config['templates']['upstream_stream']
-                renderedUpstreamProfile = j2_env.get_template(templateName).render(
-                    u=upstream, ncgconfig=NcgConfig.config)
-
-                b64renderedUpstreamProfile = base64.b64encode(bytes(renderedUpstreamProfile, 'utf-8')).decode(
-                    'utf-8')
                 configFileName = NcgConfig.config['nms']['upstream_stream_dir'] + '/' + upstream['name'].replace(' ', '_') + ".conf"
-                upstreamProfileConfigFile = {'contents': b64renderedUpstreamProfile,
-                                         'name': configFileName}
-
-                configFiles['files'].append(upstreamProfileConfigFile)
-
-                all_upstreams.append(d_upstreams[i]['name'])
+                __stageFile__(renderQueue, configFiles, incremental, ('stream_upstream', upstream['name']), configFileName, apiversion, templateName, u=upstream)
 
         d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.servers')
         if d_servers is not None:
             for server in d_servers:
-
-                # Server level resolver name validity check
-                if server['resolver']:
-                    if server['resolver'] not in all_resolver_profiles:
-                        return {"status_code": 422,
-                                    "message": {"status_code": status, "message":
-                                        {"code": status,
-                                         "content": f"invalid resolver profile [{server['resolver'] }] in stream server [{server['name']}], must be one of {all_resolver_profiles}"}}}
-
-                if server['snippet']:
-                    status, snippet = v5_6.GitOps.getObjectFromRepo(object = server['snippet'], authProfiles = d['declaration']['http']['authentication'])
-
-                    if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": snippet}}
-
-                    server['snippet'] = snippet
-
-                if 'upstream' in server and server['upstream'] and server['upstream'] not in all_upstreams:
-                    return {"status_code": 422,
-                            "message": {
-                                "status_code": status,
-                                "message":
-                                    {"code": status, "content": f"invalid Layer4 upstream {server['upstream']}"}}}
-
                 # Create Stream server configuration file
-                streamServerConf = j2_env.get_template(NcgConfig.config['templates']['server_stream']).render(s=server, ncgconfig=NcgConfig.config)
-                streamServerConfb64 = base64.b64encode(bytes(streamServerConf, 'utf-8')).decode('utf-8')
-                newStreamServerAuxFile = {'contents': streamServerConfb64, 'name': NcgConfig.config['nms']['server_stream_dir'] +
-                                                                        '/' + server['name'].replace(' ', '_') + ".conf"}
-                configFiles['files'].append(newStreamServerAuxFile)
+                __stageFile__(renderQueue, configFiles, incremental, ('stream_server', server['name']),
+                              NcgConfig.config['nms']['server_stream_dir'] + '/' + server['name'].replace(' ', '_') + ".conf",
+                              apiversion, NcgConfig.config['templates']['server_stream'], s=server)
+
+    # Render all staged configuration files
+    stagedFiles = len(renderQueue)
+    NcgTemplates.renderQueued(renderQueue)
 
     # HTTP configuration template rendering
     httpConf = j2_env.get_template(NcgConfig.config['templates']['httpconf']).render(
@@ -771,52 +611,10 @@ def createconfig(declaration: ConfigDeclaration, apiversion: str, runfromautosyn
     streamConf = j2_env.get_template(NcgConfig.config['templates']['streamconf']).render(
         declaration=d['declaration']['layer4'], ncgconfig=NcgConfig.config) if 'layer4' in d['declaration'] else ''
 
-    b64HttpConf = str(base64.b64encode(httpConf.encode("utf-8")), "utf-8")
-    b64StreamConf = str(base64.b64encode(streamConf.encode("utf-8")), "utf-8")
-
-    if decltype.lower() == 'nms':
-        # Output to NGINX Instance Manager
-
-        # NGINX configuration files for staged config
-        configFiles['rootDir'] = NcgConfig.config['nms']['config_dir']
+    stage.add(objects=stagedFiles + 2,
+              bytes=sum(len(f['contents']) for f in configFiles['files']) + len(httpConf) + len(streamConf))
 
-        # NGINX auxiliary files for staged config
-        auxFiles['rootDir'] = NcgConfig.config['nms']['config_dir']
-
-        finalReply = v5_6.NIMOutput.NIMOutput(d = d, declaration = declaration, apiversion = apiversion,
-                                 b64HttpConf = b64HttpConf, b64StreamConf = b64StreamConf,
-                                 configFiles = configFiles,
-                                 auxFiles = auxFiles,
-                                 runfromautosync = runfromautosync, configUid = configUid )
-
-        if finalReply['status_code'] == 200:
-            if len(extraOutputManifests) > 0:
-                finalReply['message']['message']['content']['manifests'] = extraOutputManifests
-
-        return finalReply
-
-    elif decltype.lower() == 'nginxone':
-        # Output to NGINX One Console
-
-        # NGINX configuration files for staged config
-        configFiles['name'] = NcgConfig.config['nms']['config_dir']
-
-        # NGINX auxiliary files for staged config
-        auxFiles['name'] = NcgConfig.config['nms']['config_dir']
-
-        finalReply =  v5_6.NGINXOneOutput.NGINXOneOutput(d = d, declaration = declaration, apiversion = apiversion,
-                                 b64HttpConf = b64HttpConf, b64StreamConf = b64StreamConf,
-                                 configFiles = configFiles,
-                                 auxFiles = auxFiles,
-                                 runfromautosync = runfromautosync, configUid = configUid )
-
-        if finalReply['status_code'] == 200:
-            if len(extraOutputManifests) > 0:
-                finalReply['message']['message']['content']['manifests'] = extraOutputManifests
-
-        return finalReply
-    else:
-        return {"status_code": 422, "message": {"status_code": 422, "message": f"output type {decltype} unknown"}}
+    return httpConf, streamConf
 
 
 def patch_config(declaration: ConfigDeclaration, configUid: str, apiversion: str):
@@ -828,12 +626,24 @@ def patch_config(declaration: ConfigDeclaration, configUid: str, apiversion: str
             headers={'Content-Type': 'application/json'}
         )
 
+    # The declaration being deployed is not patched, the update would be lost once the deployment completes
+    if v5_6.Rollout.isRollingOut(configUid):
+        return JSONResponse(
+            status_code=409,
+            content={'code': 409, 'details': {'message': f'declaration {configUid} deployment in progress'},
+                     'configUid': configUid},
+            headers={'Content-Type': 'application/json'}
+        )
+
     # The declaration sections to be patched
     declarationToPatch = declaration.model_dump()
 
     # The currently applied declaration
     status_code, currentDeclaration = get_declaration(configUid=configUid)
 
+    # Digests of all declaration objects before patching
+    previousDigests = v5_6.DependencyGraph.nodeDigests(currentDeclaration)
+
     # Handle policy updates
     d_policies = v5_6.MiscUtils.getDictKey(declarationToPatch, 'declaration.http.policies')
     if d_policies is not None:
@@ -882,16 +692,28 @@ def patch_config(declaration: ConfigDeclaration, configUid: str, apiversion: str
                 currentDeclaration = v5_6.DeclarationPatcher.patchStreamServer(
                     sourceDeclaration=currentDeclaration, patchedStreamServer=s)
 
+    # Validate the updated declaration
+    try:
+        configDeclaration = ConfigDeclaration.model_validate(v5_6.MiscUtils.removeEmptyDicts(currentDeclaration))
+    except ValidationError as e:
+        return JSONResponse(
+            status_code=422,
+            content={'code': 422, 'details': {'message': e.errors(include_url=False, include_context=False)},
+                     'configUid': configUid},
+            headers={'Content-Type': 'application/json'}
+        )
+
     # Apply the updated declaration
-    configDeclaration = ConfigDeclaration.model_validate_json(json.dumps(currentDeclaration))
 
     r = createconfig(declaration=configDeclaration, apiversion=apiversion,
-                     runfromautosync=True, configUid=configUid)
+                     runfromautosync=True, configUid=configUid,
+                     incremental=__incrementalState__(configUid=configUid, previousDigests=previousDigests,
+                                                      patchedDeclaration=currentDeclaration))
 
     # Return the updated declaration
     message = r['message']
 
-    if r['status_code'] != 200:
+    if r['status_code'] not in [200, 202]:
         currentDeclaration = {}
         # message = f'declaration {configUid} update failed';
 
@@ -905,6 +727,35 @@ def patch_config(declaration: ConfigDeclaration, configUid: str, apiversion: str
     )
 
 
+# Returns the state needed to re-fetch and re-render only the declaration objects affected by a PATCH:
+# - affected: ids of the dependency graph nodes changed by the PATCH and of all nodes depending on them
+# - declaration: the previously rendered declaration, holding objects already fetched from the source of truth
+# - files: the previously published staged configuration files contents, keyed by file name. Files no longer stored
+#   are rendered again
+# Returns None if the previous run state is not available and a full render is needed
+def __incrementalState__(configUid: str, previousDigests: dict, patchedDeclaration: dict):
+    previousRendered = NcgRedis.redis.get(f'ncg.declarationrendered.{configUid}')
+    previousManifest = NcgRedis.redis.get(f'ncg.stagedmanifest.{configUid}')
+
+    if previousRendered is None or previousManifest is None:
+        return None
+
+    changed = v5_6.DependencyGraph.changedNodes(previousDigests, v5_6.DependencyGraph.nodeDigests(patchedDeclaration))
+    affected = v5_6.DependencyGraph.affectedNodes(v5_6.DependencyGraph.buildGraph(patchedDeclaration), changed)
+
+    # API Gateway and Developer Portal objects are built from the OpenAPI schema at every run
+    for server in v5_6.MiscUtils.getDictKey(patchedDeclaration, 'declaration.http.servers') or []:
+        for loc in server['locations'] or []:
+            if loc['apigateway'] and (v5_6.MiscUtils.getDictKey(loc, 'apigateway.api_gateway.enabled')
+                                      or v5_6.MiscUtils.getDictKey(loc, 'apigateway.developer_portal.enabled')):
+                affected.add(('http_server', server['name']))
+
+    print(f'Declaration [{configUid}] patch affects {len(affected)} objects')
+
+    return {'affected': affected, 'declaration': json.loads(previousRendered),
+            'files': v5_6.StagedConfig.loadFiles(json.loads(previousManifest))}
+
+
 # Gets the given declaration. Returns status_code and body
 def get_declaration(configUid: str):
     cfg = NcgRedis.redis.get('ncg.declaration.' + configUid)
@@ -106,18 +106,52 @@ class OutputNMS(BaseModel, extra="forbid"):
     username: str = ""
     password: str = ""
     instancegroup: str = ""
+    instancegroups: Optional[List[str]] = []
+    wavesize: Optional[int] = 0
     synctime: Optional[int] = 0
     modules: Optional[List[str]] = []
 
+    @model_validator(mode='after')
+    def check_type(self) -> 'OutputNMS':
+        instancegroup, instancegroups, wavesize = self.instancegroup, self.instancegroups, self.wavesize
+
+        if instancegroup and instancegroups:
+            raise ValueError("instancegroup and instancegroups are mutually exclusive")
+
+        if instancegroups and len(set(instancegroups)) != len(instancegroups):
+            raise ValueError(f"Duplicated instance groups in {str(instancegroups)}")
+
+        if wavesize and wavesize < 0:
+            raise ValueError("wavesize must be >= 0")
+
+        return self
+
 
 class OutputNGINXOne(BaseModel, extra="forbid"):
     url: str = ""
     namespace: str = ""
     token: str = ""
     configsyncgroup: str = ""
+    configsyncgroups: Optional[List[str]] = []
+    wavesize: Optional[int] = 0
     synctime: Optional[int] = 0
     modules: Optional[List[str]] = []
 
+    @model_validator(mode='after')
+    def check_type(self) -> 'OutputNGINXOne':
+        configsyncgroup, configsyncgroups, wavesize = self.configsyncgroup, self.configsyncgroups, self.wavesize
+
+        if configsyncgroup and configsyncgroups:
+            raise ValueError("configsyncgroup and configsyncgroups are mutually exclusive")
+
+        if configsyncgroups and len(set(configsyncgroups)) != len(configsyncgroups):
+            raise ValueError(f"Duplicated config sync groups in {str(configsyncgroups)}")
+
+        if wavesize and wavesize < 0:
+            raise ValueError("wavesize must be >= 0")
+
+        return self
+
 
 class License(BaseModel, extra="forbid"):
     endpoint: Optional[str] = "product.connect.nginx.com"
@@ -132,6 +166,7 @@ class License(BaseModel, extra="forbid"):
 class Output(BaseModel, extra="forbid"):
     type: str
     synchronous: bool = True
+    dryrun: bool = False
     license: Optional[License] = {}
     nms: Optional[OutputNMS] = {}
     nginxone: Optional[OutputNGINXOne] = {}
@@ -14,7 +14,9 @@ from fastapi.responses import PlainTextResponse, Response, JSONResponse
 
 # NGINX Declarative API modules
 import NcgConfig
+from NcgHttpClient import NcgHttpClient
 from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
 
 import V5_5_CreateConfig
 import V5_5_NginxConfigDeclaration
@@ -23,9 +25,19 @@ import v5_5.Asynchronous
 import V5_6_CreateConfig
 import V5_6_NginxConfigDeclaration
 import v5_6.Asynchronous
+import v5_6.CircuitBreaker
+import v5_6.NGINXOneClient
+import v5_6.NIMClient
 
 cfg = NcgConfig.NcgConfig(configFile="../etc/config.yaml")
 redis = NcgRedis(host=cfg.config['redis']['host'], port=cfg.config['redis']['port'])
+templates = NcgTemplates(rootDir=cfg.config['templates']['root_dir'],
+                         bytecodeCacheDir=cfg.config['templates'].get('bytecode_cache_dir', ''),
+                         fragmentCacheSize=cfg.config['templates'].get('fragment_cache_size', 0),
+                         renderWorkers=cfg.config['templates'].get('render_workers', 0),
+                         renderPool=cfg.config['templates'].get('render_pool', 'thread'),
+                         apiVersions=['v5.6'])
+httpClients = NcgHttpClient(clients=cfg.config.get('http_clients', {}))
 
 app = FastAPI(
     title=cfg.config['main']['banner'],
@@ -54,10 +66,9 @@ def runAsynchronousWorker():
 
         if item['apiVersion'] == 'v5.5':
             response = V5_5_CreateConfig.patch_config(declaration = declaration, configUid = item['configUid'], apiversion = item['apiVersion'])
+            NcgRedis.redis.set(f"ncg.async.submission.{item['submissionUid']}", response.body.decode("utf-8"))
         elif item['apiVersion'] == 'v5.6':
-            response = V5_6_CreateConfig.patch_config(declaration = declaration, configUid = item['configUid'], apiversion = item['apiVersion'])
-
-        NcgRedis.redis.set(f"ncg.async.submission.{item['submissionUid']}", response.body.decode("utf-8"))
+            v5_6.Asynchronous.processSubmission(item)
 
         redis.asyncQueue.task_done()
 
@@ -98,6 +109,24 @@ def post_config_v5_6(d: V5_6_NginxConfigDeclaration.ConfigDeclaration, response:
     return JSONResponse(content=response, status_code=output['status_code'], headers=headers)
 
 
+# Render declaration using v5.6 API without publishing it
+@app.post("/v5.6/config/render", status_code=200, response_class=PlainTextResponse)
+def post_config_render_v5_6(d: V5_6_NginxConfigDeclaration.ConfigDeclaration, response: Response):
+    output = V5_6_CreateConfig.createconfig(declaration=d, apiversion='v5.6', dryrun=True)
+
+    headers = output['message']['headers'] if 'headers' in output['message'] else {'Content-Type': 'application/json'}
+
+    if 'message' in output:
+        if 'message' in output['message']:
+            response = output['message']['message']
+        else:
+            response = output['message']
+    else:
+        response = output
+
+    return JSONResponse(content=response, status_code=output['status_code'], headers=headers)
+
+
 # Modify declaration using v5.5 API
 @app.patch("/v5.5/config/{configuid}", status_code=200, response_class=PlainTextResponse)
 def patch_config_v5_5(d: V5_5_NginxConfigDeclaration.ConfigDeclaration, response: Response, configuid: str):
@@ -253,6 +282,9 @@ def delete_config(configuid: str = ""):
     redis.redis.delete('ncg.apiversion.' + configuid)
     redis.redis.delete('ncg.status.' + configuid)
     redis.redis.delete('ncg.basestagedconfig.' + configuid)
+    redis.redis.delete('ncg.stagedmanifest.' + configuid)
+    redis.redis.delete('ncg.publishedgroups.' + configuid)
+    redis.redis.delete('ncg.autosyncfingerprint.' + configuid)
 
     if job != "static":
         # Kills autosync GitOps config thread
@@ -268,6 +300,26 @@ def delete_config(configuid: str = ""):
     )
 
 
+# Get source of truth circuit breakers state
+@app.get("/v5.6/sourceoftruth/circuitbreakers", status_code=200)
+def get_circuit_breakers():
+    return JSONResponse(
+        status_code=200,
+        content=v5_6.CircuitBreaker.stats(),
+        headers={'Content-Type': 'application/json'}
+    )
+
+
+# Get control plane clients request metrics
+@app.get("/v5.6/controlplane/metrics", status_code=200)
+def get_controlplane_metrics():
+    return JSONResponse(
+        status_code=200,
+        content={'nim': v5_6.NIMClient.stats(), 'nginxone': v5_6.NGINXOneClient.stats()},
+        headers={'Content-Type': 'application/json'}
+    )
+
+
 # Get JSON schema for the v5.5 ConfigDeclaration - used by the Web UI editor for IntelliSense
 @app.get("/v5.5/schema", status_code=200)
 def get_schema_v5_5():
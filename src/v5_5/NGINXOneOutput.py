@@ -55,7 +55,7 @@ def NGINXOneOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpCo
                 "headers": {'Content-Type': 'application/json'}}
 
     # DNS resolution check
-    dnsOutcome, dnsReply = v5_5.MiscUtils.resolveFQDN(urlCheck.netloc)
+    dnsOutcome, dnsReply = v5_5.MiscUtils.resolveFQDN(urlCheck.hostname)
     if not dnsOutcome:
         return {"status_code": 400,
                 "message": {"status_code": 400, "message": {"code": 400,
@@ -19,7 +19,7 @@ def createAPIGateway(locationDeclaration: dict, authProfiles: Authentication={})
 
     if locationDeclaration['apigateway']['openapi_schema']:
         status, apiSchemaString = v5_6.GitOps.getObjectFromRepo(object=locationDeclaration['apigateway']['openapi_schema'],
-                                                                authProfiles = authProfiles['server'] if 'server' in authProfiles else {}, base64Encode=False)
+                                                                authProfiles = authProfiles, base64Encode=False)
 
         if status != 200:
             return status,"",""
@@ -4,7 +4,10 @@ Asynchronous declarations support
 import json
 import pickle
 
+import V5_6_CreateConfig
+
 import v5_6.MiscUtils
+import v5_6.Rollout
 from NcgRedis import NcgRedis
 
 # pydantic models
@@ -14,9 +17,7 @@ from V5_6_NginxConfigDeclaration import ConfigDeclaration
 # Check if the incoming request is asynchronous
 #
 def checkIfAsynch(declaration: ConfigDeclaration, method: str, apiVersion: str, configUid: str):
-    djson = declaration.model_dump()
-
-    if djson['output']['synchronous']:
+    if declaration.output.synchronous:
         # Synchronous declaration, normal processing
         return None, None
 
@@ -33,4 +34,21 @@ def checkIfAsynch(declaration: ConfigDeclaration, method: str, apiVersion: str,
 
     NcgRedis.redis.set(f'ncg.async.submission.{submissionUid}', json.dumps(response))
 
-    return 202, response
\ No newline at end of file
+    return 202, response
+
+
+#
+# Process an asynchronous submission. Declarations being deployed can't be patched: the submission is processed
+# once the deployment completes, the update would otherwise be rejected
+#
+def processSubmission(item: dict):
+    while True:
+        v5_6.Rollout.waitRollout(item['configUid'])
+        response = V5_6_CreateConfig.patch_config(declaration = item['declaration'], configUid = item['configUid'], apiversion = item['apiVersion'])
+
+        if response.status_code != 409:
+            break
+
+    NcgRedis.redis.set(f"ncg.async.submission.{item['submissionUid']}", response.body.decode("utf-8"))
+
+    return response
@@ -0,0 +1,106 @@
+"""
+Per-host circuit breakers for source of truth fetches
+
+A circuit opens after failure_threshold consecutive failures: requests to the host then fail fast for
+reset_timeout seconds. After that a single probe request is allowed (half-open): the circuit is closed if it
+succeeds and opened again if it fails
+"""
+
+import threading
+import time
+
+from NcgConfig import NcgConfig
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Circuit breakers, key is the host
+__breakers__ = {}
+__breakersLock__ = threading.Lock()
+
+
+class CircuitBreaker:
+    def __init__(self, failureThreshold: int, resetTimeout: float):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = CLOSED
+        self.failures = 0
+        self.openedAt = 0.0
+        self.totalFailures = 0
+        self.rejected = 0
+
+        self._probing = False
+        self._lock = threading.Lock()
+
+    # Returns True if a request can be made. When the circuit is half-open only one probe request is allowed
+    def allow(self):
+        if self.failureThreshold <= 0:
+            return True
+
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.openedAt >= self.resetTimeout:
+                self.state = HALF_OPEN
+
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                return True
+
+            self.rejected += 1
+            return False
+
+    def recordSuccess(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def recordFailure(self):
+        with self._lock:
+            self.failures += 1
+            self.totalFailures += 1
+            self._probing = False
+
+            if self.state == HALF_OPEN or (self.failureThreshold > 0 and self.failures >= self.failureThreshold):
+                self.state = OPEN
+                self.openedAt = time.monotonic()
+
+    # Returns the number of seconds before a probe request is allowed, 0 if the circuit is not open
+    def retryIn(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+
+            return max(0.0, self.resetTimeout - (time.monotonic() - self.openedAt))
+
+    # Returns the circuit breaker state
+    def stats(self):
+        return {'state': self.state, 'consecutive_failures': self.failures, 'failures': self.totalFailures,
+                'rejected': self.rejected, 'retry_in': round(self.retryIn(), 1)}
+
+
+# Returns the circuit breaker for the given host, created using the sourceoftruth.circuit_breaker settings
+def getBreaker(host: str):
+    with __breakersLock__:
+        if host not in __breakers__:
+            settings = NcgConfig.config.get('sourceoftruth', {}).get('circuit_breaker', {})
+            __breakers__[host] = CircuitBreaker(failureThreshold=settings.get('failure_threshold', 0),
+                                                resetTimeout=settings.get('reset_timeout', 30))
+
+        return __breakers__[host]
+
+
+# Returns True if the circuit breaker for the given host is open
+def isOpen(host: str):
+    with __breakersLock__:
+        breaker = __breakers__.get(host)
+
+    return breaker is not None and breaker.state == OPEN
+
+
+# Returns the state of all circuit breakers, keyed by host
+def stats():
+    with __breakersLock__:
+        breakers = dict(__breakers__)
+
+    return {host: breaker.stats() for host, breaker in breakers.items()}
@@ -0,0 +1,71 @@
+"""
+Pooled control plane API client base class, with request metrics
+"""
+
+import threading
+import time
+
+from NcgHttpClient import NcgHttpClient
+
+
+class ControlPlaneClient:
+    # url is the control plane base URL, settingsName the NcgHttpClient settings used for the pooled session
+    def __init__(self, url: str, settingsName: str):
+        self.url = url.rstrip('/')
+        self.timeout = NcgHttpClient.getTimeout(settingsName)
+
+        self.session = NcgHttpClient.newSession(settingsName)
+        self.session.verify = False
+
+        self.requests = 0
+        self.errors = 0
+        self.statusCodes = {}
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+
+        self._lock = threading.Lock()
+
+    # Sends a request to the given control plane API path (ie. "/api/platform/v1/instance-groups")
+    # Returns the requests Response, exceptions are raised to the caller
+    def request(self, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        statusCode = None
+
+        try:
+            reply = self.session.request(method=method, url=f"{self.url}{path}", timeout=self.timeout, **kwargs)
+            statusCode = reply.status_code
+            return reply
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.requests += 1
+                self.totalTime += elapsed
+                self.maxTime = max(self.maxTime, elapsed)
+
+                if statusCode is None:
+                    self.errors += 1
+                else:
+                    self.statusCodes[statusCode] = self.statusCodes.get(statusCode, 0) + 1
+
+    def get(self, path: str, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path: str, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def patch(self, path: str, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    # Returns request metrics
+    def stats(self):
+        with self._lock:
+            return {'url': self.url, 'requests': self.requests, 'errors': self.errors,
+                    'status_codes': {str(k): v for k, v in self.statusCodes.items()},
+                    'time_ms': round(self.totalTime * 1000, 3), 'max_ms': round(self.maxTime * 1000, 3)}
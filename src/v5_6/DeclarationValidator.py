@@ -0,0 +1,257 @@
+"""
+Declaration cross-references validation
+"""
+
+from urllib.parse import urlparse
+
+import v5_6.MiscUtils
+
+
+# Builds the symbol tables for all named objects defined in the given declaration
+# Returns a dict of sets, keyed by object type
+def buildSymbolTables(d: dict):
+    symbols = {
+        'resolvers': set(),
+        'http_upstreams': set(),
+        'stream_upstreams': set(),
+        'rate_limits': set(),
+        'cache_profiles': set(),
+        'auth_client_profiles': set(),
+        'auth_server_profiles': set(),
+        'authz_client_profiles': set(),
+        'njs_profiles': set(),
+        'acme_issuers': set(),
+        'certificates': set(),
+        'keys': set()
+    }
+
+    for resolver in v5_6.MiscUtils.getDictKey(d, 'declaration.resolvers') or []:
+        symbols['resolvers'].add(resolver['name'])
+
+    for upstream in v5_6.MiscUtils.getDictKey(d, 'declaration.http.upstreams') or []:
+        symbols['http_upstreams'].add(upstream['name'])
+
+    for upstream in v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.upstreams') or []:
+        symbols['stream_upstreams'].add(upstream['name'])
+
+    for rateLimit in v5_6.MiscUtils.getDictKey(d, 'declaration.http.rate_limit') or []:
+        symbols['rate_limits'].add(rateLimit['name'])
+
+    for cacheProfile in v5_6.MiscUtils.getDictKey(d, 'declaration.http.cache') or []:
+        symbols['cache_profiles'].add(cacheProfile['name'])
+
+    # Only supported authentication and authorization types are rendered and can be referenced
+    for authProfile in v5_6.MiscUtils.getDictKey(d, 'declaration.http.authentication.client') or []:
+        if authProfile['type'] in ['jwt', 'mtls', 'oidc']:
+            symbols['auth_client_profiles'].add(authProfile['name'])
+
+    for authProfile in v5_6.MiscUtils.getDictKey(d, 'declaration.http.authentication.server') or []:
+        if authProfile['type'] in ['token', 'mtls']:
+            symbols['auth_server_profiles'].add(authProfile['name'])
+
+    for authzProfile in v5_6.MiscUtils.getDictKey(d, 'declaration.http.authorization') or []:
+        if authzProfile['type'] in ['jwt']:
+            symbols['authz_client_profiles'].add(authzProfile['name'])
+
+    for njsProfile in v5_6.MiscUtils.getDictKey(d, 'declaration.http.njs_profiles') or []:
+        symbols['njs_profiles'].add(njsProfile['name'].replace(' ', '_'))
+
+    for acmeIssuer in v5_6.MiscUtils.getDictKey(d, 'declaration.http.acme_issuers') or []:
+        symbols['acme_issuers'].add(acmeIssuer['name'])
+
+    for tlsItem in v5_6.MiscUtils.getDictKey(d, 'declaration.certificates') or []:
+        if tlsItem['name']:
+            symbols['certificates' if tlsItem['type'] == 'certificate' else 'keys'].add(tlsItem['name'])
+
+    return symbols
+
+
+# Returns a sorted list of valid names, used in error messages
+def __validNames__(symbols: set):
+    return sorted(symbols)
+
+
+# Checks all cross-references in the given declaration (output of ConfigDeclaration.model_dump())
+# No remote objects are fetched. Returns the list of all invalid references found, empty if the declaration is valid
+def validateReferences(d: dict):
+    symbols = buildSymbolTables(d)
+    errors = []
+
+    resolvers = symbols['resolvers']
+    authClientProfiles = symbols['auth_client_profiles']
+    authServerProfiles = symbols['auth_server_profiles']
+    authzClientProfiles = symbols['authz_client_profiles']
+    njsProfiles = symbols['njs_profiles']
+
+    # HTTP upstreams
+    for upstream in v5_6.MiscUtils.getDictKey(d, 'declaration.http.upstreams') or []:
+        if upstream['resolver'] and upstream['resolver'] not in resolvers:
+            errors.append(f"invalid resolver profile [{upstream['resolver']}] in HTTP upstream [{upstream['name']}], "
+                          f"must be one of {__validNames__(resolvers)}")
+
+    # HTTP level Javascript hooks
+    for njsHook in v5_6.MiscUtils.getDictKey(d, 'declaration.http.njs') or []:
+        if njsHook['profile'] not in njsProfiles:
+            errors.append(f"invalid njs profile [{njsHook['profile']}] in HTTP declaration, "
+                          f"must be one of {__validNames__(njsProfiles)}")
+
+    # HTTP level resolver
+    httpResolver = v5_6.MiscUtils.getDictKey(d, 'declaration.http.resolver')
+    if httpResolver and httpResolver not in resolvers:
+        errors.append(f"invalid resolver profile [{httpResolver}] in HTTP context, "
+                      f"must be one of {__validNames__(resolvers)}")
+
+    # ACME issuers trusted certificates
+    for acmeIssuer in v5_6.MiscUtils.getDictKey(d, 'declaration.http.acme_issuers') or []:
+        certName = acmeIssuer['ssl_trusted_certificate']
+        if certName and certName not in symbols['certificates']:
+            errors.append(f"invalid TLS certificate [{certName}] for ACME issuer [{acmeIssuer['name']}] "
+                          f"must be one of {__validNames__(symbols['certificates'])}")
+
+    # HTTP servers
+    for server in v5_6.MiscUtils.getDictKey(d, 'declaration.http.servers') or []:
+        errors += __validateHttpServer__(server=server, symbols=symbols)
+
+        for loc in server['locations'] or []:
+            errors += __validateHttpLocation__(loc=loc, symbols=symbols)
+
+    # Layer4 upstreams
+    for upstream in v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.upstreams') or []:
+        if upstream['resolver'] and upstream['resolver'] not in resolvers:
+            errors.append(f"invalid resolver profile [{upstream['resolver']}] in stream upstream [{upstream['name']}], "
+                          f"must be one of {__validNames__(resolvers)}")
+
+    # Layer4 servers
+    for server in v5_6.MiscUtils.getDictKey(d, 'declaration.layer4.servers') or []:
+        if server['resolver'] and server['resolver'] not in resolvers:
+            errors.append(f"invalid resolver profile [{server['resolver']}] in stream server [{server['name']}], "
+                          f"must be one of {__validNames__(resolvers)}")
+
+        if server.get('upstream') and server['upstream'] not in symbols['stream_upstreams']:
+            errors.append(f"invalid Layer4 upstream {server['upstream']}")
+
+    return errors
+
+
+# Checks references for an HTTP server. Returns the list of invalid references
+def __validateHttpServer__(server: dict, symbols: dict):
+    errors = []
+
+    if server['resolver'] and server['resolver'] not in symbols['resolvers']:
+        errors.append(f"invalid resolver profile [{server['resolver']}] in HTTP server [{server['name']}], "
+                      f"must be one of {__validNames__(symbols['resolvers'])}")
+
+    if server['cache'] and server['cache']['profile'] and server['cache']['profile'] not in symbols['cache_profiles']:
+        errors.append(f"invalid cache profile [{server['cache']['profile']}] in HTTP server [{server['name']}], "
+                      f"must be one of {__validNames__(symbols['cache_profiles'])}")
+
+    for njsHook in server['njs'] or []:
+        if njsHook['profile'] not in symbols['njs_profiles']:
+            errors.append(f"invalid njs profile [{njsHook['profile']}] in server [{server['name']}], "
+                          f"must be one of {__validNames__(symbols['njs_profiles'])}")
+
+    for authClientProfile in v5_6.MiscUtils.getDictKey(server, 'authentication.client') or []:
+        if authClientProfile['profile'] not in symbols['auth_client_profiles']:
+            errors.append(f"invalid client authentication profile [{authClientProfile['profile']}] in server "
+                          f"[{server['name']}] must be one of {__validNames__(symbols['auth_client_profiles'])}")
+
+    authzProfile = v5_6.MiscUtils.getDictKey(server, 'authorization.profile')
+    if authzProfile and authzProfile not in symbols['authz_client_profiles']:
+        errors.append(f"invalid client authorization profile [{authzProfile}] in server [{server['name']}] "
+                      f"must be one of {__validNames__(symbols['authz_client_profiles'])}")
+
+    tls = v5_6.MiscUtils.getDictKey(server, 'listen.tls')
+    if tls:
+        # mTLS client authentication
+        for mtlsClientProfile in v5_6.MiscUtils.getDictKey(tls, 'authentication.client') or []:
+            if mtlsClientProfile['profile'] not in symbols['auth_client_profiles']:
+                errors.append(f"invalid client authentication profile [{mtlsClientProfile['profile']}] in server "
+                              f"[{server['name']}] must be one of {__validNames__(symbols['auth_client_profiles'])}")
+
+        acmeIssuer = tls.get('acme_issuer')
+        if acmeIssuer and acmeIssuer not in symbols['acme_issuers']:
+            errors.append(f"invalid ACME issuer [{acmeIssuer}] in server [{server['name']}] "
+                          f"must be one of {__validNames__(symbols['acme_issuers'])}")
+
+        # TLS certificates and keys
+        certName = tls.get('certificate')
+        if certName and certName not in symbols['certificates']:
+            errors.append(f"invalid TLS certificate [{certName}] for server [{server['names']}] "
+                          f"must be one of {__validNames__(symbols['certificates'])}")
+
+        keyName = tls.get('key')
+        if keyName and keyName not in symbols['keys']:
+            errors.append(f"invalid TLS key [{keyName}] for server [{server['names']}] "
+                          f"must be one of {__validNames__(symbols['keys'])}")
+
+        trustedCertName = tls.get('trusted_ca_certificates')
+        if trustedCertName and trustedCertName not in symbols['certificates']:
+            errors.append(f"invalid trusted CA certificate [{trustedCertName}] for server [{server['names']}] "
+                          f"must be one of {__validNames__(symbols['certificates'])}")
+
+    return errors
+
+
+# Checks references for an HTTP location. Returns the list of invalid references
+def __validateHttpLocation__(loc: dict, symbols: dict):
+    errors = []
+
+    for njsHook in loc['njs'] or []:
+        if njsHook['profile'] not in symbols['njs_profiles']:
+            errors.append(f"invalid njs profile [{njsHook['profile']}] in location [{loc['uri']}], "
+                          f"must be one of {__validNames__(symbols['njs_profiles'])}")
+
+    if loc.get('upstream') and urlparse(loc['upstream']).netloc not in symbols['http_upstreams']:
+        errors.append(f"invalid HTTP upstream [{loc['upstream']}]")
+
+    for authClientProfile in v5_6.MiscUtils.getDictKey(loc, 'authentication.client') or []:
+        if authClientProfile['profile'] not in symbols['auth_client_profiles']:
+            errors.append(f"invalid client authentication profile [{authClientProfile['profile']}] in location "
+                          f"[{loc['uri']}] must be one of {__validNames__(symbols['auth_client_profiles'])}")
+
+    authzProfile = v5_6.MiscUtils.getDictKey(loc, 'authorization.profile')
+    if authzProfile and authzProfile not in symbols['authz_client_profiles']:
+        errors.append(f"invalid client authorization profile [{authzProfile}] in location [{loc['uri']}] "
+                      f"must be one of {__validNames__(symbols['authz_client_profiles'])}")
+
+    for authServerProfile in v5_6.MiscUtils.getDictKey(loc, 'authentication.server') or []:
+        if authServerProfile['profile'] not in symbols['auth_server_profiles']:
+            errors.append(f"invalid server authentication profile [{authServerProfile['profile']}] in location "
+                          f"[{loc['uri']}]")
+
+    apiGateway = loc.get('apigateway')
+    if apiGateway and v5_6.MiscUtils.getDictKey(apiGateway, 'api_gateway.enabled') == True:
+        openApiSchema = v5_6.MiscUtils.getDictKey(apiGateway, 'openapi_schema.content')
+
+        for authClientProfile in v5_6.MiscUtils.getDictKey(apiGateway, 'authentication.client') or []:
+            if authClientProfile['profile'] not in symbols['auth_client_profiles']:
+                errors.append(f"invalid API Gateway authentication profile [{authClientProfile['profile']}] for "
+                              f"OpenAPI schema [{openApiSchema}] must be one of "
+                              f"{__validNames__(symbols['auth_client_profiles'])}")
+
+        for authzProfile in apiGateway['authorization'] or []:
+            if authzProfile['profile'] not in symbols['authz_client_profiles']:
+                errors.append(f"invalid API Gateway authorization profile [{authzProfile['profile']}] for "
+                              f"OpenAPI schema [{openApiSchema}] must be one of "
+                              f"{__validNames__(symbols['authz_client_profiles'])}")
+
+        for rateLimitProfile in apiGateway['rate_limit'] or []:
+            if rateLimitProfile['profile'] not in symbols['rate_limits']:
+                errors.append(f"invalid API Gateway rate limit profile [{rateLimitProfile['profile']}] for "
+                              f"OpenAPI schema [{openApiSchema}] must be one of "
+                              f"{__validNames__(symbols['rate_limits'])}")
+
+        openApiAuthProfile = v5_6.MiscUtils.getDictKey(apiGateway, 'openapi_schema.authentication')
+        if openApiAuthProfile and openApiAuthProfile[0]['profile'] not in symbols['auth_server_profiles']:
+            errors.append(f"invalid server authentication profile [{openApiAuthProfile[0]['profile']}] for "
+                          f"OpenAPI schema [{openApiSchema}]")
+
+    rateLimitProfile = v5_6.MiscUtils.getDictKey(loc, 'rate_limit.profile')
+    if rateLimitProfile and rateLimitProfile not in symbols['rate_limits']:
+        errors.append(f"invalid rate_limit profile [{rateLimitProfile}]")
+
+    cacheProfile = v5_6.MiscUtils.getDictKey(loc, 'cache.profile')
+    if cacheProfile and cacheProfile not in symbols['cache_profiles']:
+        errors.append(f"invalid cache profile [{cacheProfile}]")
+
+    return errors
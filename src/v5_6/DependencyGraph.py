@@ -0,0 +1,237 @@
+"""
+Declaration dependency graph, used to re-render only the objects affected by a declaration update
+"""
+
+from urllib.parse import urlparse
+
+import v5_6.MiscUtils
+
+# Named declaration objects tracked as graph nodes. For each entry key is the node type,
+# value is the declaration path of the list holding the objects.
+# Nodes are identified by (node type, object name) tuples
+NODE_TYPES = {
+    'resolver': 'declaration.resolvers',
+    'certificate': 'declaration.certificates',
+    'http_upstream': 'declaration.http.upstreams',
+    'http_server': 'declaration.http.servers',
+    'auth_client': 'declaration.http.authentication.client',
+    'auth_server': 'declaration.http.authentication.server',
+    'authz': 'declaration.http.authorization',
+    'njs': 'declaration.http.njs_profiles',
+    'acme': 'declaration.http.acme_issuers',
+    'rate_limit': 'declaration.http.rate_limit',
+    'cache': 'declaration.http.cache',
+    'policy': 'declaration.http.policies',
+    'stream_upstream': 'declaration.layer4.upstreams',
+    'stream_server': 'declaration.layer4.servers'
+}
+
+# HTTP and layer4 settings that are not part of any named object (ie. http snippet, maps, logformats)
+# Every HTTP server depends on the 'http' node, every stream server on the 'layer4' node
+HTTP_NODE = ('http', '')
+LAYER4_NODE = ('layer4', '')
+
+# Dependencies whose contents are used when rendering the dependent node, as (dependent type, dependency type)
+# All other dependencies are references by name: the dependent node rendered output does not change when the
+# referenced object is updated
+CONTENT_DEPENDENCIES = {('http_server', 'auth_client'), ('http_server', 'http'), ('stream_server', 'layer4')}
+
+__httpNodeKeys__ = ['upstreams', 'servers', 'authentication', 'authorization', 'njs_profiles', 'acme_issuers',
+                    'rate_limit', 'cache', 'policies']
+
+
+# Returns all named objects in the given declaration as a dict: key is the node id, value is the object
+def getNodes(d: dict):
+    nodes = {}
+
+    for nodeType, path in NODE_TYPES.items():
+        for obj in v5_6.MiscUtils.getDictKey(d, path) or []:
+            if obj and 'name' in obj:
+                nodes[(nodeType, obj['name'])] = obj
+
+    http = v5_6.MiscUtils.getDictKey(d, 'declaration.http')
+    if http is not None:
+        nodes[HTTP_NODE] = {k: v for k, v in http.items() if k not in __httpNodeKeys__}
+
+    layer4 = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4')
+    if layer4 is not None:
+        nodes[LAYER4_NODE] = {k: v for k, v in layer4.items() if k not in ['upstreams', 'servers']}
+
+    return nodes
+
+
+# Returns the digest of all nodes in the given declaration as a dict: key is the node id, value is the digest
+def nodeDigests(d: dict):
+    return {node: v5_6.MiscUtils.digest(obj) for node, obj in getNodes(d).items()}
+
+
+# Returns the ids of the nodes the given HTTP location depends on
+def __locationDependencies__(loc: dict):
+    dependencies = set()
+
+    if loc.get('upstream'):
+        dependencies.add(('http_upstream', urlparse(loc['upstream']).netloc))
+
+    for njsHook in loc.get('njs') or []:
+        dependencies.add(('njs', njsHook['profile']))
+
+    for authProfile in v5_6.MiscUtils.getDictKey(loc, 'authentication.client') or []:
+        dependencies.add(('auth_client', authProfile['profile']))
+
+    for authProfile in v5_6.MiscUtils.getDictKey(loc, 'authentication.server') or []:
+        dependencies.add(('auth_server', authProfile['profile']))
+
+    authzProfile = v5_6.MiscUtils.getDictKey(loc, 'authorization.profile')
+    if authzProfile:
+        dependencies.add(('authz', authzProfile))
+
+    rateLimitProfile = v5_6.MiscUtils.getDictKey(loc, 'rate_limit.profile')
+    if rateLimitProfile:
+        dependencies.add(('rate_limit', rateLimitProfile))
+
+    cacheProfile = v5_6.MiscUtils.getDictKey(loc, 'cache.profile')
+    if cacheProfile:
+        dependencies.add(('cache', cacheProfile))
+
+    policy = v5_6.MiscUtils.getDictKey(loc, 'app_protect.policy')
+    if policy:
+        dependencies.add(('policy', policy))
+
+    apiGateway = loc.get('apigateway')
+    if apiGateway:
+        for authProfile in v5_6.MiscUtils.getDictKey(apiGateway, 'authentication.client') or []:
+            dependencies.add(('auth_client', authProfile['profile']))
+
+        for authzProfile in apiGateway.get('authorization') or []:
+            dependencies.add(('authz', authzProfile['profile']))
+
+        for rateLimitProfile in apiGateway.get('rate_limit') or []:
+            dependencies.add(('rate_limit', rateLimitProfile['profile']))
+
+        for authProfile in v5_6.MiscUtils.getDictKey(apiGateway, 'openapi_schema.authentication') or []:
+            dependencies.add(('auth_server', authProfile['profile']))
+
+    return dependencies
+
+
+# Returns the ids of the nodes the given HTTP server depends on, including its locations dependencies
+def __httpServerDependencies__(server: dict):
+    dependencies = {HTTP_NODE}
+
+    if server.get('resolver'):
+        dependencies.add(('resolver', server['resolver']))
+
+    cacheProfile = v5_6.MiscUtils.getDictKey(server, 'cache.profile')
+    if cacheProfile:
+        dependencies.add(('cache', cacheProfile))
+
+    for njsHook in server.get('njs') or []:
+        dependencies.add(('njs', njsHook['profile']))
+
+    for authProfile in v5_6.MiscUtils.getDictKey(server, 'authentication.client') or []:
+        dependencies.add(('auth_client', authProfile['profile']))
+
+    authzProfile = v5_6.MiscUtils.getDictKey(server, 'authorization.profile')
+    if authzProfile:
+        dependencies.add(('authz', authzProfile))
+
+    policy = v5_6.MiscUtils.getDictKey(server, 'app_protect.policy')
+    if policy:
+        dependencies.add(('policy', policy))
+
+    tls = v5_6.MiscUtils.getDictKey(server, 'listen.tls')
+    if tls:
+        for authProfile in v5_6.MiscUtils.getDictKey(tls, 'authentication.client') or []:
+            dependencies.add(('auth_client', authProfile['profile']))
+
+        if tls.get('acme_issuer'):
+            dependencies.add(('acme', tls['acme_issuer']))
+
+        for tlsItem in ['certificate', 'key', 'trusted_ca_certificates']:
+            if tls.get(tlsItem):
+                dependencies.add(('certificate', tls[tlsItem]))
+
+    for loc in server.get('locations') or []:
+        dependencies |= __locationDependencies__(loc)
+
+    return dependencies
+
+
+# Builds the dependency graph for the given declaration
+# Returns a dict: key is the node id, value is the set of node ids it depends on
+def buildGraph(d: dict):
+    graph = {}
+
+    for node, obj in getNodes(d).items():
+        nodeType = node[0]
+        dependencies = set()
+
+        if nodeType in ['http_upstream', 'stream_upstream'] and obj.get('resolver'):
+            dependencies.add(('resolver', obj['resolver']))
+        elif nodeType == 'http_server':
+            dependencies = __httpServerDependencies__(obj)
+        elif nodeType == 'stream_server':
+            dependencies.add(LAYER4_NODE)
+
+            if obj.get('resolver'):
+                dependencies.add(('resolver', obj['resolver']))
+            if obj.get('upstream'):
+                dependencies.add(('stream_upstream', obj['upstream']))
+        elif nodeType == 'acme' and obj.get('ssl_trusted_certificate'):
+            dependencies.add(('certificate', obj['ssl_trusted_certificate']))
+
+        graph[node] = dependencies
+
+    return graph
+
+
+# Returns the ids of nodes added, removed or modified between two sets of node digests
+def changedNodes(previousDigests: dict, currentDigests: dict):
+    return {node for node in previousDigests.keys() | currentDigests.keys()
+            if previousDigests.get(node) != currentDigests.get(node)}
+
+
+# Returns the ids of all nodes affected by the given changed nodes: the changed nodes themselves
+# and all nodes that directly or transitively depend on their contents
+def affectedNodes(graph: dict, changed: set):
+    dependents = {}
+    for node, dependencies in graph.items():
+        for dependency in dependencies:
+            if (node[0], dependency[0]) in CONTENT_DEPENDENCIES:
+                dependents.setdefault(dependency, set()).add(node)
+
+    affected = set(changed)
+    pending = list(changed)
+
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent not in affected:
+                affected.add(dependent)
+                pending.append(dependent)
+
+    return affected
+
+
+# Replaces all objects in d that are not affected with the same object taken from the previous declaration.
+# Objects already fetched from the source of truth in the previous declaration are not fetched again
+# Returns the number of objects reused
+def reuseNodes(d: dict, previous: dict, affected: set):
+    previousNodes = getNodes(previous)
+    reused = 0
+
+    for nodeType, path in NODE_TYPES.items():
+        objects = v5_6.MiscUtils.getDictKey(d, path) or []
+
+        for i in range(len(objects)):
+            node = (nodeType, objects[i]['name'])
+
+            if node not in affected and node in previousNodes:
+                objects[i] = previousNodes[node]
+                reused += 1
+
+    for node, context in [(HTTP_NODE, 'http'), (LAYER4_NODE, 'layer4')]:
+        if node not in affected and node in previousNodes and context in d['declaration']:
+            d['declaration'][context].update(previousNodes[node])
+            reused += 1
+
+    return reused
@@ -0,0 +1,102 @@
+"""
+Control plane deployments watcher
+
+Deployments accepted by a control plane are polled until completion by a single scheduler thread and a small pool
+of workers, instead of a polling loop in each request thread. Polling interval doubles after each pending check,
+up to a maximum interval, and deployments still pending after the timeout are reported as failed
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from NcgConfig import NcgConfig
+
+# Deployments to be checked, heap of (next check time, sequence number, deployment dict)
+__queue__ = []
+__condition__ = threading.Condition()
+__sequence__ = itertools.count()
+
+__scheduler__ = None
+__executor__ = None
+
+
+# Returns the deployment watcher settings, from the controlplane configuration section
+def __settings__():
+    settings = NcgConfig.config.get('controlplane', {})
+
+    return {'max_interval': settings.get('deployment_poll_max_interval', 10),
+            'timeout': settings.get('deployment_timeout', 600),
+            'workers': settings.get('deployment_workers', 4)}
+
+
+# Starts the scheduler thread and the workers pool if needed. Must be called holding __condition__
+def __start__():
+    global __scheduler__, __executor__
+
+    if __scheduler__ is None:
+        __executor__ = ThreadPoolExecutor(max_workers=__settings__()['workers'], thread_name_prefix="ncg-deployment")
+        __scheduler__ = threading.Thread(target=__schedule__, name="ncg-deployment-watcher", daemon=True)
+        __scheduler__.start()
+
+
+# Submits deployments to the workers pool when their next check is due
+def __schedule__():
+    while True:
+        with __condition__:
+            while not __queue__ or __queue__[0][0] > time.monotonic():
+                __condition__.wait(timeout=__queue__[0][0] - time.monotonic() if __queue__ else None)
+
+            _, _, deployment = heapq.heappop(__queue__)
+
+        __executor__.submit(__check__, deployment)
+
+
+# Checks a deployment: completed deployments are finalized, pending ones are scheduled again
+# Errors while checking are retried until the deployment times out
+def __check__(deployment: dict):
+    try:
+        done, result = deployment['check']()
+    except Exception as e:
+        print(f"Deployment check failed: {e}")
+        done, result = False, None
+
+    if not done and time.monotonic() < deployment['deadline']:
+        deployment['interval'] = min(max(deployment['interval'] * 2, 0.1), deployment['maxInterval'])
+
+        with __condition__:
+            heapq.heappush(__queue__, (time.monotonic() + deployment['interval'], next(__sequence__), deployment))
+            __condition__.notify()
+
+        return
+
+    # result is None if the deployment timed out
+    try:
+        deployment['future'].set_result(deployment['onDone'](result if done else None))
+    except Exception as e:
+        deployment['future'].set_exception(e)
+
+
+# Watches a deployment accepted by a control plane
+# check is called to poll the deployment status, it returns a tuple: True and the final status if the deployment
+# is completed, False and None if it is still pending
+# onDone is called with the final status, or None if the deployment is still pending after the timeout
+# interval is the first polling interval in seconds
+# Returns a Future holding the onDone return value
+def watch(check, onDone, interval: float = 1):
+    settings = __settings__()
+    future = Future()
+    deployment = {'check': check, 'onDone': onDone, 'interval': interval,
+                  'maxInterval': settings['max_interval'], 'deadline': time.monotonic() + settings['timeout'],
+                  'future': future}
+
+    with __condition__:
+        __start__()
+        heapq.heappush(__queue__, (time.monotonic() + interval, next(__sequence__), deployment))
+        __condition__.notify()
+
+    return future
+
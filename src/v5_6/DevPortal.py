@@ -30,7 +30,7 @@ def buildDevPortal(openapischema):
 def createDevPortal(locationDeclaration: dict, authProfiles: Authentication={}):
     if locationDeclaration['apigateway']['openapi_schema']:
         status, apiSchemaString = v5_6.GitOps.getObjectFromRepo(
-            object = locationDeclaration['apigateway']['openapi_schema'], authProfiles = authProfiles['server'] if 'server' in authProfiles else {}, base64Encode = False)
+            object = locationDeclaration['apigateway']['openapi_schema'], authProfiles = authProfiles, base64Encode = False)
 
         if v5_6.MiscUtils.yaml_or_json(apiSchemaString['content']) == 'yaml':
             # YAML to JSON conversion
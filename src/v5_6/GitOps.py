@@ -3,62 +3,329 @@ GitOps support functions
 """
 
 import base64
-import requests
+import contextvars
+import os
+import threading
 
-from requests import ReadTimeout, HTTPError, Timeout, ConnectionError, ConnectTimeout
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+from requests import RequestException
 
+import v5_6.CircuitBreaker
+import v5_6.GitRepository
 import v5_6.MiscUtils
+import v5_6.ObjectCache
+
+from NcgConfig import NcgConfig
+from NcgHttpClient import NcgHttpClient
+from NcgTemplates import NcgTemplates
 
 # pydantic models
 from V5_6_NginxConfigDeclaration import *
 
 
-# Fetches a URL content
+# Fetches made while processing a declaration, see beginFetchSession
+# Value is a dict: 'lock', 'fetches' and 'repositories'. For each 'fetches' entry key is the object cache key,
+# value is a Future holding the (status_code, content) tuple. For each 'repositories' entry key is the git
+# repository cache key, value is a Future holding the v5_6.GitRepository.sync reply
+__fetchSession__ = contextvars.ContextVar('fetchSession', default = None)
+
+
+# Starts a fetch session for the declaration being processed: until endFetchSession is called each URL is
+# fetched once with the same headers, concurrent and later requests for it share the same reply.
+# Each git repository is synced once
+def beginFetchSession():
+    __fetchSession__.set({'lock': threading.Lock(), 'fetches': {}, 'repositories': {}})
+
+
+# Ends the current fetch session, discarding all fetched objects
+def endFetchSession():
+    __fetchSession__.set(None)
+
+
+# Runs function once for the given key of a fetch session table: concurrent and later callers share its return value
+# function is always run if there is no current fetch session
+def __once__(table: str, key: str, function):
+    session = __fetchSession__.get()
+
+    if session is None:
+        return function()
+
+    with session['lock']:
+        future = session[table].get(key)
+        isOwner = future is None
+
+        if isOwner:
+            future = Future()
+            session[table][key] = future
+
+    if isOwner:
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+
+    return future.result()
+
+
+# Fetches a URL content, once for the current fetch session
 def __fetchfromsourceoftruth__(url, headers = {} ):
+    cacheKey = v5_6.ObjectCache.cacheKey(url = url, headers = headers)
+
+    return __once__('fetches', cacheKey, lambda: __fetch__(url = url, headers = headers, cacheKey = cacheKey))
+
+
+# Returns True if the given object content references the source of truth: http(s), git and file URLs
+def isRemote(content: str):
+    return content.lower().startswith(("http://", "https://", "file://")) or v5_6.GitRepository.isGitUrl(content)
+
+
+# Fetches a URL content from the source of truth
+# Connections are pooled and kept alive, failed fetches are retried with backoff and timeouts apply
+# Cached objects are revalidated with a conditional GET and reused if not modified
+def __fetch__(url, headers = {}, cacheKey = None):
+    if v5_6.GitRepository.isGitUrl(url):
+        return __fetchFromGit__(url = url, headers = headers)
+
+    if url.lower().startswith("file://"):
+        return __fetchFromFile__(url = url)
+
+    if cacheKey is None:
+        cacheKey = v5_6.ObjectCache.cacheKey(url = url, headers = headers)
+
+    # Requests to unavailable hosts fail fast
+    host = __host__(url)
+    breaker = v5_6.CircuitBreaker.getBreaker(host)
+
+    if not breaker.allow():
+        return 503, __circuitOpen__(host = host, breaker = breaker)
+
     # Object is fetched from external repository
+    cached = v5_6.ObjectCache.get(cacheKey)
 
     try:
-        reply = requests.get(url = url, headers = headers, verify=False)
-    except (ConnectTimeout, HTTPError, ReadTimeout, Timeout, ConnectionError):
+        reply = NcgHttpClient.get('sourceoftruth', url = url,
+                                  headers = {**headers, **v5_6.ObjectCache.conditionalHeaders(cached)}, verify=False)
+    except RequestException:
+        breaker.recordFailure()
         return 408, "URL " + url + " unreachable"
 
+    if reply.status_code >= 500:
+        breaker.recordFailure()
+    else:
+        breaker.recordSuccess()
+
+    if reply.status_code == 304 and cached is not None:
+        return 200, cached['content']
+
+    if reply.status_code == 200:
+        v5_6.ObjectCache.put(cacheKey, content = reply.text, etag = reply.headers.get('ETag'),
+                             lastModified = reply.headers.get('Last-Modified'))
+
     return reply.status_code, reply.text
 
 
+# Reads a file from the local working copy of a git repository
+# The repository is fetched once for the current fetch session, all files referenced in it are read from disk
+def __fetchFromGit__(url, headers = {}):
+    gitUrl = v5_6.GitRepository.parseUrl(url)
+
+    if gitUrl is None:
+        return 422, f"Invalid git URL {url}, must be <scheme>://<repository>//<path>?ref=<branch, tag or commit>"
+
+    repository, ref, path = gitUrl
+
+    # Local repositories are subject to the same restrictions as file:// objects
+    if repository.startswith("file://") and not __inFileRoots__(repository):
+        return 403, f"{repository} is not in an allowed file_roots directory"
+
+    status_code, directory, commit = __once__('repositories',
+                                              v5_6.ObjectCache.cacheKey(url = f"{repository}?ref={ref}", headers = headers),
+                                              lambda: __syncRepository__(repository = repository, ref = ref,
+                                                                         headers = headers))
+
+    if status_code != 200:
+        return status_code, directory
+
+    content = v5_6.GitRepository.readFile(directory = directory, path = path)
+
+    if content is None:
+        return 404, f"{path} not found in {repository} commit {commit}"
+
+    return 200, content
+
+
+# Syncs a git repository working copy, see v5_6.GitRepository.sync. Unavailable hosts fail fast
+def __syncRepository__(repository, ref, headers):
+    host = __host__(repository)
+    breaker = v5_6.CircuitBreaker.getBreaker(host)
+
+    if not breaker.allow():
+        return 503, __circuitOpen__(host = host, breaker = breaker), None
+
+    status_code, directory, commit = v5_6.GitRepository.sync(repository = repository, ref = ref, headers = headers)
+
+    if status_code == 200:
+        breaker.recordSuccess()
+    else:
+        breaker.recordFailure()
+
+    return status_code, directory, commit
+
+
+# Returns the host a source of truth URL is fetched from, used to track its availability
+def __host__(url):
+    gitUrl = v5_6.GitRepository.parseUrl(url)
+    parsedUrl = urlparse(gitUrl[0] if gitUrl else url)
+
+    return parsedUrl.netloc.rpartition('@')[2] or f"{parsedUrl.scheme}://{parsedUrl.path}"
+
+
+# Returns the error message for requests rejected by an open circuit breaker
+def __circuitOpen__(host, breaker):
+    return f"Source of truth {host} unavailable after {breaker.failures} consecutive failures, " \
+           f"circuit open: retrying in {breaker.retryIn():.0f} seconds"
+
+
+# Returns True if the given file:// URL is in one of the sourceoftruth.file_roots directories
+def __inFileRoots__(url):
+    fileName = os.path.realpath(unquote(urlparse(url).path))
+    roots = [os.path.realpath(root) for root in NcgConfig.config.get('sourceoftruth', {}).get('file_roots') or []]
+
+    return any(os.path.commonpath([root, fileName]) == root for root in roots)
+
+
+# Reads a local file. Only files in the sourceoftruth.file_roots directories can be read
+def __fetchFromFile__(url):
+    if not __inFileRoots__(url):
+        return 403, f"{url} is not in an allowed file_roots directory"
+
+    fileName = os.path.realpath(unquote(urlparse(url).path))
+
+    try:
+        with open(fileName, 'r', encoding = 'utf-8') as f:
+            return 200, f.read()
+    except OSError:
+        return 404, f"{url} not found"
+
+
+# Returns the HTTP headers needed to fetch the given object using the server authentication profile it references
+def __authHeaders__(object: ObjectFromSourceOfTruth, authProfiles: Authentication={}):
+    headers = {}
+
+    # Set server authentication if needed
+    if authProfiles and 'server' in authProfiles and len(object['authentication'])>0:
+        for authP in authProfiles['server']:
+            if object['authentication'][0]['profile'] == authP['name']:
+                # Sets up authentication
+                if authP['type'].lower() == 'token':
+
+                    authToken = authP['token']['token']
+                    authTokenType = authP['token']['type']
+
+                    if authTokenType.lower() == 'bearer':
+                        headers['Authorization'] = f"Bearer {authToken}"
+                    elif authTokenType.lower() == 'basic':
+                        authTokenUsername = authP['token']['username']
+                        authTokenPassword = base64.b64decode(authP['token']['password']).decode('utf-8')
+
+                        headers['Authorization'] = f"Basic {base64.b64encode(str.encode(authTokenUsername + ':' + authTokenPassword)).decode('utf-8')}"
+                    elif authTokenType.lower() == 'header':
+                        authTokenLocation = authP['token']['location']
+
+                        headers[authTokenLocation] = authToken
+
+    return headers
+
+
+# Returns all objects referenced by the given declaration that are fetched from the source of truth
+def remoteObjects(d: dict):
+    objects = []
+
+    http = v5_6.MiscUtils.getDictKey(d, 'declaration.http') or {}
+    objects.append(http.get('snippet'))
+    objects += [upstream['snippet'] for upstream in http.get('upstreams') or []]
+    objects += [njsProfile['file'] for njsProfile in http.get('njs_profiles') or []]
+
+    for server in http.get('servers') or []:
+        objects.append(server['snippet'])
+
+        for loc in server['locations'] or []:
+            objects.append(loc['snippet'])
+
+            if v5_6.MiscUtils.getDictKey(loc, 'apigateway.api_gateway.enabled') \
+                    or v5_6.MiscUtils.getDictKey(loc, 'apigateway.developer_portal.enabled'):
+                objects.append(loc['apigateway']['openapi_schema'])
+
+    for policy in http.get('policies') or []:
+        objects += [policyVersion['contents'] for policyVersion in policy.get('versions') or []]
+
+    layer4 = v5_6.MiscUtils.getDictKey(d, 'declaration.layer4') or {}
+    objects += [upstream['snippet'] for upstream in layer4.get('upstreams') or []]
+    objects += [server['snippet'] for server in layer4.get('servers') or []]
+
+    objects += [certificate['contents'] for certificate in v5_6.MiscUtils.getDictKey(d, 'declaration.certificates') or []]
+
+    return [o for o in objects if o and isRemote(o['content'])]
+
+
+# Fetches all objects referenced by the given declaration concurrently, using up to the given number of workers
+# Objects are fetched in the current fetch session, that is started if needed
+# Returns the number of objects fetched
+def prefetchObjects(d: dict, workers: int):
+    if __fetchSession__.get() is None:
+        beginFetchSession()
+
+    authProfiles = v5_6.MiscUtils.getDictKey(d, 'declaration.http.authentication') or {}
+    pending = {}
+
+    for object in remoteObjects(d):
+        headers = __authHeaders__(object = object, authProfiles = authProfiles)
+        pending[v5_6.ObjectCache.cacheKey(url = object['content'], headers = headers)] = (object['content'], headers)
+
+    if not pending:
+        return 0
+
+    # Workers run in a copy of the current context, to share the fetch session
+    with ThreadPoolExecutor(max_workers = max(1, min(workers, len(pending))), thread_name_prefix = "ncg-fetch") as executor:
+        for url, headers in pending.values():
+            executor.submit(contextvars.copy_context().run, __fetchfromsourceoftruth__, url, headers)
+
+    return len(pending)
+
+
+# Returns the fingerprint of the given declaration, of the current content of all remote objects it references and
+# of the templates and configuration it is rendered with, see NcgTemplates.templatesDigest
+# Remote objects are fetched in the current fetch session, see prefetchObjects: with the objects cache enabled
+# unchanged objects are revalidated and not downloaded again
+def sourcesFingerprint(d: dict, workers: int, apiVersion: str):
+    prefetchObjects(d = d, workers = workers)
+
+    objects = {}
+    for cacheKey, future in __fetchSession__.get()['fetches'].items():
+        try:
+            objects[cacheKey] = future.result()
+        except Exception as e:
+            objects[cacheKey] = repr(e)
+
+    return v5_6.MiscUtils.digest({'declaration': d, 'objects': objects,
+                                  'templates': NcgTemplates.templatesDigest(apiVersion)})
+
+
 # If content starts with http(s):// fetches the object and return it b64-encoded by default.
 # base64Encode to be set to False to disable b64 encoding
 # Returns the status original content otherwise.
+# If pipelineStage is set, the object is accounted for in the given configuration pipeline stage
 # Return is a tuple: status_code, content
-def getObjectFromRepo(object: ObjectFromSourceOfTruth, authProfiles: Authentication={}, base64Encode: bool=True):
+def getObjectFromRepo(object: ObjectFromSourceOfTruth, authProfiles: Authentication={}, base64Encode: bool=True,
+                      pipelineStage = None):
     status_code = 200
     response = object
 
     if object:
-        if object['content'].lower().startswith(("http://","https://")):
+        if isRemote(object['content']):
             # Object is fetched from external repository
-            headers = {}
-
-            # Set server authentication if needed
-            if authProfiles and 'server' in authProfiles and len(object['authentication'])>0:
-                for authP in authProfiles['server']:
-                    if object['authentication'][0]['profile'] == authP['name']:
-                        # Sets up authentication
-                        if authP['type'].lower() == 'token':
-
-                            authToken = authP['token']['token']
-                            authTokenType = authP['token']['type']
-
-                            if authTokenType.lower() == 'bearer':
-                                headers['Authorization'] = f"Bearer {authToken}"
-                            elif authTokenType.lower() == 'basic':
-                                authTokenUsername = authP['token']['username']
-                                authTokenPassword = base64.b64decode(authP['token']['password']).decode('utf-8')
-
-                                headers['Authorization'] = f"Basic {base64.b64encode(str.encode(authTokenUsername + ':' + authTokenPassword)).decode('utf-8')}"
-                            elif authTokenType.lower() == 'header':
-                                authTokenLocation = authP['token']['location']
-
-                                headers[authTokenLocation] = authToken
+            headers = __authHeaders__(object = object, authProfiles = authProfiles)
 
             status_code, fetchedContent = __fetchfromsourceoftruth__(url = object['content'], headers = headers)
 
@@ -70,6 +337,10 @@ def getObjectFromRepo(object: ObjectFromSourceOfTruth, authProfiles: Authenticat
             else:
                 fetchedContent = f"Error fetching {object['content']}"
 
+                host = __host__(object['content'])
+                if v5_6.CircuitBreaker.isOpen(host):
+                    fetchedContent += f": {__circuitOpen__(host = host, breaker = v5_6.CircuitBreaker.getBreaker(host))}"
+
             response['content'] = fetchedContent
 
         else:
@@ -80,4 +351,7 @@ def getObjectFromRepo(object: ObjectFromSourceOfTruth, authProfiles: Authenticat
                 else:
                     response['content'] = object['content']
 
+        if pipelineStage is not None and status_code == 200:
+            pipelineStage.add(objects=1, bytes=len(response['content']))
+
     return status_code, response
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Local working copies of git repositories used as source of truth
+
+Objects are referenced as <scheme>://<repository>//<path>?ref=<branch, tag or commit>
+where scheme is git, git+http, git+https, git+ssh or git+file. ref is optional and defaults to the remote HEAD
+git+file repositories must be in the sourceoftruth.file_roots directories
+Examples:
+  git+https://github.com/example/nginx-config.git//snippets/server.conf?ref=main
+  git+file:///srv/repositories/nginx-config.git//snippets/server.conf
+"""
+
+import os
+import re
+import subprocess
+import threading
+
+from urllib.parse import parse_qs
+
+import v5_6.MiscUtils
+
+from NcgConfig import NcgConfig
+from v5_6.LRUCache import LRUCache
+
+# Supported URL schemes
+SCHEMES = ("git://", "git+http://", "git+https://", "git+ssh://", "git+file://")
+
+# Locks serializing git operations and reads on each working copy. Key is the working copy directory
+__locks__ = {}
+__locksLock__ = threading.Lock()
+
+# isValidRef results, refs are checked once instead of running git check-ref-format for each URL parsing
+__validRefs__ = LRUCache(maxBytes=65536)
+
+
+# Returns True if the given URL references an object in a git repository
+def isGitUrl(url: str):
+    return url.lower().startswith(SCHEMES)
+
+
+# Returns True if ref is a full commit hash or a valid branch or tag name. Abbreviated commit hashes can't be
+# fetched and are not valid. Refs starting with - are rejected, not to be taken as git command options
+def isValidRef(ref: str):
+    if not ref or ref.startswith('-'):
+        return False
+
+    if re.fullmatch(r'[0-9a-fA-F]{40}', ref):
+        return True
+
+    if re.fullmatch(r'[0-9a-fA-F]{7,39}', ref):
+        return False
+
+    valid = __validRefs__.get(ref)
+
+    if valid is None:
+        valid, _ = __git__('check-ref-format', '--allow-onelevel', ref)
+        __validRefs__.put(ref, valid, size=len(ref))
+
+    return valid
+
+
+# Parses a git object URL
+# Return is a tuple: repository URL, ref, path. None if the URL or the ref are not valid
+def parseUrl(url: str):
+    if not isGitUrl(url):
+        return None
+
+    location, _, query = url.partition('?')
+    ref = parse_qs(query).get('ref', ['HEAD'])[0]
+
+    if location.lower().startswith('git+'):
+        location = location[4:]
+
+    scheme, _, location = location.partition('://')
+    scheme = scheme.lower()
+    repository, separator, path = location.partition('//')
+
+    if not separator or not repository or not path.strip('/') or not isValidRef(ref):
+        return None
+
+    return f"{scheme}://{repository}", ref, path.strip('/')
+
+
+# Returns the lock for the given working copy directory
+def __lock__(directory: str):
+    with __locksLock__:
+        return __locks__.setdefault(directory, threading.Lock())
+
+
+# Runs a git command. Request headers are passed through the environment, not to be visible in the process list
+# Return is a tuple: True and the command standard output, or False and the error message
+def __git__(*args, headers: dict = {}):
+    env = {**os.environ, 'GIT_TERMINAL_PROMPT': '0', 'GIT_CONFIG_COUNT': str(len(headers))}
+
+    for i, (name, value) in enumerate(headers.items()):
+        env[f'GIT_CONFIG_KEY_{i}'] = 'http.extraHeader'
+        env[f'GIT_CONFIG_VALUE_{i}'] = f"{name}: {value}"
+
+    try:
+        reply = subprocess.run(['git', *args], env=env, capture_output=True, text=True, check=True,
+                               timeout=NcgConfig.config.get('sourceoftruth', {}).get('git', {}).get('timeout', 60))
+    except subprocess.CalledProcessError as e:
+        return False, e.stderr.strip()
+    except (subprocess.TimeoutExpired, OSError) as e:
+        return False, str(e)
+
+    return True, reply.stdout.strip()
+
+
+# Fetches the given ref of a repository into its local working copy, cloning it the first time
+# Working copies are kept in the sourceoftruth.git.cache_dir directory, one for each repository, ref and
+# authentication headers
+# Return is a tuple: status_code, working copy directory, checked out commit hash
+# On failure status_code is 408 and the error message is returned instead of the directory
+def sync(repository: str, ref: str = 'HEAD', headers: dict = {}):
+    cacheDir = NcgConfig.config.get('sourceoftruth', {}).get('git', {}).get('cache_dir', '/tmp/ncg-git')
+    directory = os.path.join(cacheDir, v5_6.MiscUtils.digest({'repository': repository, 'ref': ref,
+                                                              'headers': headers}))
+
+    with __lock__(directory):
+        if not os.path.isdir(os.path.join(directory, '.git')):
+            os.makedirs(directory, exist_ok=True)
+
+            ok, output = __git__('init', '-q', directory)
+            if not ok:
+                return 408, output, None
+
+        # Only the latest commit is needed. Repository and ref are never parsed as options
+        ok, output = __git__('-C', directory, 'fetch', '-q', '--depth', '1', '--', repository, ref, headers=headers)
+        if not ok:
+            return 408, f"Repository {repository} unreachable: {output}", None
+
+        _, commit = __git__('-C', directory, 'rev-parse', 'FETCH_HEAD')
+        hasHead, head = __git__('-C', directory, 'rev-parse', '--verify', '-q', 'HEAD')
+
+        if not hasHead or head != commit:
+            ok, output = __git__('-C', directory, 'checkout', '-q', '--force', '--detach', commit)
+            if not ok:
+                return 408, output, None
+
+    return 200, directory, commit
+
+
+# Returns the content of a file in the given working copy, None if not found
+# Paths outside of the working copy and in its .git directory are not found
+def readFile(directory: str, path: str):
+    root = os.path.realpath(directory)
+    fileName = os.path.realpath(os.path.join(root, path))
+
+    if os.path.commonpath([root, fileName]) != root or \
+            os.path.relpath(fileName, root).split(os.sep)[0] == '.git':
+        return None
+
+    with __lock__(directory):
+        try:
+            with open(fileName, 'r', encoding='utf-8') as f:
+                return f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
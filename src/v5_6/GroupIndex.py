@@ -0,0 +1,68 @@
+"""
+Cached name to UID indexes of control plane groups: NGINX Instance Manager instance groups and NGINX One Console
+config sync groups
+
+An index is kept for each control plane and credentials for controlplane.group_cache_ttl seconds. Names not found
+in a cached index trigger a reload, to resolve groups created after the index was built
+"""
+
+import threading
+import time
+
+from NcgConfig import NcgConfig
+
+# Cached indexes. Key is the control plane key, value is a dict with 'index' (name to UID) and 'expires'
+__indexes__ = {}
+__indexesLock__ = threading.Lock()
+
+# Locks serializing index loads, key is the control plane key
+__loadLocks__ = {}
+
+
+# Returns the cached index for the given key, None if not cached or expired
+def __cached__(key: str):
+    with __indexesLock__:
+        entry = __indexes__.get(key)
+
+    if entry is None or entry['expires'] <= time.monotonic():
+        return None
+
+    return entry['index']
+
+
+# Resolves a group name to its UID using the index for the given control plane key
+# loader is called to build the index when not cached, expired or when name is not found in it, it returns a tuple:
+# status_code, index dict (name to UID) or error message
+# Return is a tuple: status_code, UID (None if not found) or the loader error message
+def resolve(key: str, name: str, loader):
+    index = __cached__(key)
+
+    if index is not None and name in index:
+        return 200, index[name]
+
+    with __indexesLock__:
+        loadLock = __loadLocks__.setdefault(key, threading.Lock())
+
+    with loadLock:
+        # The index could have been reloaded while waiting
+        reloaded = __cached__(key)
+        if reloaded is not None and reloaded is not index and name in reloaded:
+            return 200, reloaded[name]
+
+        status_code, index = loader()
+
+        if status_code != 200:
+            return status_code, index
+
+        ttl = NcgConfig.config.get('controlplane', {}).get('group_cache_ttl', 0)
+        if ttl > 0:
+            with __indexesLock__:
+                __indexes__[key] = {'index': index, 'expires': time.monotonic() + ttl}
+
+    return 200, index.get(name)
+
+
+# Removes the cached index for the given control plane key, ie. when a cached UID is not valid anymore
+def invalidate(key: str):
+    with __indexesLock__:
+        __indexes__.pop(key, None)
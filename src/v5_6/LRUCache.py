@@ -0,0 +1,88 @@
+"""
+Thread-safe LRU cache bounded by total size in bytes
+"""
+
+import sys
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the size in bytes used to account for the given value
+    @staticmethod
+    def sizeOf(value):
+        if isinstance(value, (str, bytes, bytearray)):
+            return len(value)
+
+        return sys.getsizeof(value)
+
+    # Returns the cached value for the given key, or None if not found
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    # Stores a value, evicting the least recently used entries if maxBytes is exceeded
+    # size is the number of bytes accounted for the value, computed by sizeOf if not set
+    # Values larger than maxBytes are not cached
+    def put(self, key, value, size: int = None):
+        if size is None:
+            size = self.sizeOf(value)
+
+        if size > self.maxBytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.currentBytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self.currentBytes += size
+
+            while self.currentBytes > self.maxBytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.currentBytes -= evicted[1]
+                self.evictions += 1
+
+    # Removes the given key
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.currentBytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.currentBytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    # Returns cache statistics
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.currentBytes, 'max_bytes': self.maxBytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -8,6 +8,7 @@ import yaml
 import uuid
 import socket
 import base64
+import hashlib
 
 
 # Searches for a nested key in a dictionary and returns its value, or None if nothing was found.
@@ -64,4 +65,28 @@ def isBase64(s):
     try:
         return base64.b64encode(base64.b64decode(s)) == bytes(s,"utf-8")
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+
+# Returns a stable SHA-256 hex digest for the given JSON-serializable object
+# Dictionary key ordering does not affect the digest
+def digest(obj):
+    if isinstance(obj, bytes):
+        return hashlib.sha256(obj).hexdigest()
+
+    if isinstance(obj, str):
+        return hashlib.sha256(obj.encode('utf-8')).hexdigest()
+
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')).hexdigest()
+
+
+# Returns the given declaration dict without empty dict values, so that it can be validated again
+# Optional nested objects that were not set are dumped as {}, which is not a valid value for their model
+def removeEmptyDicts(obj):
+    if isinstance(obj, dict):
+        return {k: removeEmptyDicts(v) for k, v in obj.items() if v != {}}
+
+    if isinstance(obj, list):
+        return [removeEmptyDicts(v) for v in obj]
+
+    return obj
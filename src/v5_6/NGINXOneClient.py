@@ -0,0 +1,49 @@
+"""
+Pooled NGINX One Console API clients
+
+A client is kept for each NGINX One Console URL and API token for the life of the process: connections are kept
+alive and reused across all requests made while publishing declarations, including publication status polls
+"""
+
+import threading
+
+import v5_6.MiscUtils
+from v5_6.ControlPlaneClient import ControlPlaneClient
+
+# Clients, key is the digest of the NGINX One Console URL and API token
+__clients__ = {}
+__clientsLock__ = threading.Lock()
+
+
+class NGINXOneClient(ControlPlaneClient):
+    def __init__(self, url: str, token: str):
+        super().__init__(url=url, settingsName='nginxone')
+        self.session.headers['Authorization'] = f"Bearer APIToken {token}"
+
+        # Identifies the token in metrics without disclosing it
+        self.tokenId = v5_6.MiscUtils.digest(token)[:12]
+
+    def stats(self):
+        return {**super().stats(), 'token_id': self.tokenId}
+
+
+# Returns the client for the given NGINX One Console URL and API token, creating it if needed
+def getClient(nOneUrl: str, nOneToken: str):
+    key = v5_6.MiscUtils.digest({'url': nOneUrl.rstrip('/'), 'token': nOneToken})
+
+    with __clientsLock__:
+        client = __clients__.get(key)
+
+        if client is None:
+            client = NGINXOneClient(url=nOneUrl, token=nOneToken)
+            __clients__[key] = client
+
+    return client
+
+
+# Returns request metrics for all clients
+def stats():
+    with __clientsLock__:
+        clients = list(__clients__.values())
+
+    return [client.stats() for client in clients]
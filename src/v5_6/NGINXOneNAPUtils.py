@@ -2,11 +2,11 @@
 NGINX App Protect support functions
 """
 
-import requests
 import json
 import base64
 
 import v5_6.GitOps
+import v5_6.NGINXOneClient
 
 from NcgConfig import NcgConfig
 
@@ -35,27 +35,26 @@ def __definePolicyOnNGINXOne__(nginxOneUrl: str, nginxOneToken: str, nginxOneNam
     allExistingPolicies = __getAllPolicies__(nginxOneUrl = nginxOneUrl, nginxOneToken = nginxOneToken, nginxOneNamespace=nginxOneNamespace)
     polId = __getPolicyId__(json.loads(allExistingPolicies.text), policyName)
 
+    nOneClient = v5_6.NGINXOneClient.getClient(nginxOneUrl, nginxOneToken)
+
     if polId != "":
         # This is a new version for an existing policy
-        r = requests.put(url=f"{nginxOneUrl}/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies/{polId}",
-                          data=json.dumps(policyCreationPayload),
-                          headers={'Content-Type': 'application/json',
-                                   "Authorization": f"Bearer APIToken {nginxOneToken}"},
-                          verify=False)
+        r = nOneClient.put(f"/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies/{polId}",
+                           data=json.dumps(policyCreationPayload),
+                           headers={'Content-Type': 'application/json'})
     else:
         # New policy creation
-        r = requests.post(url=f"{nginxOneUrl}/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies",
-            data=json.dumps(policyCreationPayload),
-            headers={'Content-Type': 'application/json', "Authorization": f"Bearer APIToken {nginxOneToken}"},
-            verify=False)
+        r = nOneClient.post(f"/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies",
+                            data=json.dumps(policyCreationPayload),
+                            headers={'Content-Type': 'application/json'})
 
     return r
 
 
 # Retrieve security policies information
 def __getAllPolicies__(nginxOneUrl: str, nginxOneToken: str, nginxOneNamespace: str):
-    return requests.get(url=f"{nginxOneUrl}/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies?paginated=false",
-                        headers={"Authorization": f"Bearer APIToken {nginxOneToken}"}, verify=False)
+    return v5_6.NGINXOneClient.getClient(nginxOneUrl, nginxOneToken).get(
+        f"/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies?paginated=false")
 
 
 # Return the policy ID for the given policyName. allPoliciesJSON is the JSON output from __getAllPolicies__
@@ -78,9 +77,9 @@ def __deletePolicy__(nginxOneUrl: str, nginxOneToken: str, nginxOneNamespace: st
         item['action'] = "delete"
         jsonPayload.append(item)
 
-    return requests.patch(url=f'{nginxOneUrl}/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies',
-        headers={"Content-Type": "application/json", "Authorization": f"Bearer APIToken {nginxOneToken}"}, verify=False,
-        data=json.dumps(jsonPayload))
+    return v5_6.NGINXOneClient.getClient(nginxOneUrl, nginxOneToken).patch(
+        f'/api/nginx/one/namespaces/{nginxOneNamespace}/app-protect/policies',
+        headers={"Content-Type": "application/json"}, data=json.dumps(jsonPayload))
 
 
 # Check NAP policies names validity for the given declaration
@@ -249,9 +248,7 @@ def makePolicyActive(nginxOneUrl: str, nginxOneToken: str, nginxOneNamespace: st
         }
 
         doWeHavePolicies = True
-        r = requests.post(url=f'{nginxOneUrl}/api/platform/v1/security/publish',
-                          data=json.dumps(body),
-                          headers={'Content-Type': 'application/json', "Authorization": f"Bearer APIToken {nginxOneToken}"},
-                          verify=False)
+        r = v5_6.NGINXOneClient.getClient(nginxOneUrl, nginxOneToken).post(
+            '/api/platform/v1/security/publish', data=json.dumps(body), headers={'Content-Type': 'application/json'})
 
     return doWeHavePolicies
\ No newline at end of file
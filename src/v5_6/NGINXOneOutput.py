@@ -3,23 +3,27 @@ Output to NGINX One console
 """
 
 import base64
-import requests
 import json
 import pickle
+import threading
 import time
 import schedule
 
-from jinja2 import Environment, FileSystemLoader
 from urllib.parse import urlparse
 from datetime import datetime
 
 import V5_6_CreateConfig
 
 import v5_6.APIGateway
+import v5_6.DeploymentWatcher
 import v5_6.DevPortal
 import v5_6.DeclarationPatcher
 import v5_6.GitOps
 import v5_6.MiscUtils
+import v5_6.PipelineStats
+import v5_6.Rollout
+import v5_6.StagedConfig
+import v5_6.NGINXOneClient
 import v5_6.NGINXOneUtils
 
 # pydantic models
@@ -32,15 +36,22 @@ import v5_6.NGINXOneNAPUtils
 # NGINX Declarative API modules
 from NcgConfig import NcgConfig
 from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
 
 def NGINXOneOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: str,
               b64StreamConf: str,configFiles = {}, auxFiles = {},
               runfromautosync: bool = False,
-              configUid: str = ""):
+              configUid: str = "", pipeline: v5_6.PipelineStats.PipelineStats = None,
+              autosyncFingerprint: str = None):
     # NGINX One Console Staged Configuration publish
 
+    if pipeline is None:
+        pipeline = v5_6.PipelineStats.PipelineStats()
+
     nOneToken = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.token')
     nOneConfigSyncGroup = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.configsyncgroup')
+    nOneConfigSyncGroups = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.configsyncgroups') or [nOneConfigSyncGroup]
+    nOneWaveSize = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.wavesize')
     nOneNamespace = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.namespace')
 
     nOneSynctime = v5_6.MiscUtils.getDictKey(d, 'output.nginxone.synctime')
@@ -54,8 +65,11 @@ def NGINXOneOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpCo
                                                             "content": f"invalid NGINX One URL {nOneUrlFromJson}"}},
                 "headers": {'Content-Type': 'application/json'}}
 
+    # Dry run: the staged configuration is built and returned, the control plane is never contacted
+    dryRun = v5_6.MiscUtils.getDictKey(d, 'output.dryrun')
+
     # DNS resolution check
-    dnsOutcome, dnsReply = v5_6.MiscUtils.resolveFQDN(urlCheck.netloc)
+    dnsOutcome, dnsReply = v5_6.MiscUtils.resolveFQDN(urlCheck.hostname) if not dryRun else (True, None)
     if not dnsOutcome:
         return {"status_code": 400,
                 "message": {"status_code": 400, "message": {"code": 400,
@@ -69,181 +83,154 @@ def NGINXOneOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpCo
                 "message": {"status_code": 400, "message": {"code": 400, "content": "synctime must be >= 0"}},
                 "headers": {'Content-Type': 'application/json'}}
 
-    # Fetch NGINX App Protect WAF policies from source of truth if needed
-    d_policies = v5_6.MiscUtils.getDictKey(d, 'declaration.http.policies')
-    if d_policies is not None:
-        for policy in d_policies:
-            if 'versions' in policy:
-                for policyVersion in policy['versions']:
-                    status, content = v5_6.GitOps.getObjectFromRepo(object=policyVersion['contents'],
-                                                                    authProfiles=d['declaration']['http'][
-                                                                        'authentication'])
-
-                    if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": content}}
-
-                    policyVersion['contents'] = content
-
-    # Check TLS items validity
-    all_tls = {'certificate': {}, 'key': {}}
-
-    d_certs = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
-    if d_certs is not None:
-        for i in range(len(d_certs)):
-            if d_certs[i]['name']:
-                all_tls[d_certs[i]['type']][d_certs[i]['name']] = True
-
-    # TLS certificates and key names validity checks for servers
-    d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.servers')
-    if d_servers is not None:
-        for server in d_servers:
-            if server['listen'] is not None:
-                if 'tls' in server['listen']:
-                    cert_name = v5_6.MiscUtils.getDictKey(server, 'listen.tls.certificate')
-                    if cert_name and cert_name not in all_tls['certificate']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid TLS certificate [" +
-                                                           cert_name + "] for server [" + str(
-                                                    server['names']) + "] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                                }}
-
-                    cert_key = v5_6.MiscUtils.getDictKey(server, 'listen.tls.key')
-                    if cert_key and cert_key not in all_tls['key']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid TLS key [" + cert_key + "] for server [" + str(
-                                                    server['names']) + "] must be one of [" + ",".join(all_tls['key']) + "]"}
-                                }}
-
-                    trusted_cert_name = v5_6.MiscUtils.getDictKey(server, 'listen.tls.trusted_ca_certificates')
-                    if trusted_cert_name and trusted_cert_name not in all_tls['certificate']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid trusted CA certificate [" +
-                                                           trusted_cert_name + "] for server [" + str(server['names'])
-                                                           + "] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                                }}
-
-    # TLS certificates and key names validity checks or ACME issuer profiles
-    d_acmeissuers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.acme_issuers')
-    if d_acmeissuers is not None:
-        for issuer in d_acmeissuers:
-            cert_name = issuer['ssl_trusted_certificate']
-            if cert_name and cert_name not in all_tls['certificate']:
-                return {"status_code": 422,
-                        "message": {
-                            "status_code": 422,
-                            "message": {"code": 422,
-                                        "content": "invalid TLS certificate [" +
-                                                   cert_name + "] for ACME issuer [" + str(
-                                            issuer['name']) +"] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                        }}
-
-    # Add optional certificates specified under declaration.certificates
-    extensions_map = {'certificate': '.crt', 'key': '.key'}
-
-    d_certificates = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
-    if d_certificates is not None:
-        for c in d_certificates:
-            status, certContent = v5_6.GitOps.getObjectFromRepo(object=c['contents'],
-                                                                authProfiles=d['declaration']['http']['authentication'])
-
-            if status != 200:
-                return {"status_code": 422,
-                        "message": {"status_code": status, "message": {"code": status, "content": certContent}}}
-
-            newAuxFile = {'contents': certContent['content'], 'name': NcgConfig.config['nms']['certs_dir'] +
-                                                                      '/' + c['name'] + extensions_map[c['type']]}
-            auxFiles['files'].append(newAuxFile)
-
-    ### / Add optional certificates specified under declaration.certificates
-
-    # NGINX main configuration file through template
-    j2_env = Environment(loader=FileSystemLoader(NcgConfig.config['templates']['root_dir'] + '/' + apiversion),
-                         trim_blocks=True, extensions=["jinja2_base64_filters.Base64Filters"])
-
-    nginxMainConf = j2_env.get_template(NcgConfig.config['templates']['nginxmain']).render(
-        nginxconf={'mainhttpfile': NcgConfig.config['nms']['staged_config_http_filename'],
-                   'mainstreamfile': NcgConfig.config['nms']['staged_config_stream_filename'],
-                   'modules': v5_6.MiscUtils.getDictKey(d, 'output.nginxone.modules'),
-                   'license': v5_6.MiscUtils.getDictKey(d, 'output.license')},
-                   d={'http': v5_6.MiscUtils.getDictKey(d, 'declaration.http')})
-
-    # Base64-encoded NGINX main configuration (/etc/nginx/nginx.conf)
-    b64NginxMain = str(base64.urlsafe_b64encode(nginxMainConf.encode("utf-8")), "utf-8")
-
-    # NGINX License file
-    licenseJwtFile = j2_env.get_template(NcgConfig.config['templates']['license']).render(
-        nginxconf={'license': v5_6.MiscUtils.getDictKey(d, 'output.license')})
-
-    # Base64-encoded license file (/etc/nginx/license.jwt)
-    b64licenseJwtFile = str(base64.urlsafe_b64encode(licenseJwtFile.encode("utf-8")), "utf-8")
-
-    # Base64-encoded NGINX mime.types (/etc/nginx/mime.types)
-    f = open(NcgConfig.config['templates']['root_dir'] + '/' + apiversion + '/' + NcgConfig.config['templates'][
-        'mimetypes'], 'r')
-    nginxMimeTypes = f.read()
-    f.close()
-
-    b64NginxMimeTypes = str(base64.urlsafe_b64encode(nginxMimeTypes.encode("utf-8")), "utf-8")
-    filesMimeType = {'contents': b64NginxMimeTypes, 'name': NcgConfig.config['nms']['config_dir'] + '/mime.types'}
-    auxFiles['files'].append(filesMimeType)
-
-    # Base64-encoded NGINX HTTP service configuration
-    filesNginxMain = {'contents': b64NginxMain, 'name': NcgConfig.config['nms']['config_dir'] + '/nginx.conf'}
-    filesLicenseFile = {'contents': b64licenseJwtFile, 'name': NcgConfig.config['nms']['config_dir'] + '/license.jwt'}
-    filesHttpConf = {'contents': b64HttpConf,
-                     'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
-                         'staged_config_http_filename']}
-    filesStreamConf = {'contents': b64StreamConf,
-                       'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
-                           'staged_config_stream_filename']}
-
-    # Append config files to staged configuration
-    configFiles['files'].append(filesNginxMain)
-    configFiles['files'].append(filesHttpConf)
-    configFiles['files'].append(filesStreamConf)
-
-    # If no R33+ license token was specified in the JSON declaration, it is assumed a token already exists
-    # on the NGINX instances and it won't be overwritten
-    if v5_6.MiscUtils.getDictKey(d, 'output.license.token') != "":
-        configFiles['files'].append(filesLicenseFile)
-
-    # Staged config
-    baseStagedConfig = {'aux': [ { 'files': configFiles } ] }
-    stagedConfig = {'conf_path': NcgConfig.config['nms']['config_dir'] + '/nginx.conf',
-                    'configs': [ configFiles, auxFiles ]}
-
-    currentBaseStagedConfig = NcgRedis.redis.get(f'ncg.basestagedconfig.{configUid}').decode(
-        'utf-8') if NcgRedis.redis.get(f'ncg.basestagedconfig.{configUid}') else None
-    newBaseStagedConfig = json.dumps(baseStagedConfig)
-
-    if currentBaseStagedConfig is not None and newBaseStagedConfig == currentBaseStagedConfig:
+    ### Fetch stage
+    with pipeline.stage('fetch') as stage:
+        # Fetch NGINX App Protect WAF policies from source of truth if needed
+        d_policies = v5_6.MiscUtils.getDictKey(d, 'declaration.http.policies')
+        if d_policies is not None:
+            for policy in d_policies:
+                if 'versions' in policy:
+                    for policyVersion in policy['versions']:
+                        status, content = v5_6.GitOps.getObjectFromRepo(object=policyVersion['contents'],
+                                                                        authProfiles=d['declaration']['http'][
+                                                                            'authentication'],
+                                                                        pipelineStage=stage)
+
+                        if status != 200:
+                            return {"status_code": 422, "message": {"status_code": status, "message": content}}
+
+                        policyVersion['contents'] = content
+
+        # Add optional certificates specified under declaration.certificates
+        extensions_map = {'certificate': '.crt', 'key': '.key'}
+
+        d_certificates = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
+        if d_certificates is not None:
+            for c in d_certificates:
+                status, certContent = v5_6.GitOps.getObjectFromRepo(object=c['contents'],
+                                                                    authProfiles=d['declaration']['http']['authentication'],
+                                                                    pipelineStage=stage)
+
+                if status != 200:
+                    return {"status_code": 422,
+                            "message": {"status_code": status, "message": {"code": status, "content": certContent}}}
+
+                newAuxFile = {'contents': certContent['content'], 'name': NcgConfig.config['nms']['certs_dir'] +
+                                                                          '/' + c['name'] + extensions_map[c['type']]}
+                auxFiles['files'].append(newAuxFile)
+
+        ### / Add optional certificates specified under declaration.certificates
+
+    ### Render stage
+    with pipeline.stage('render') as stage:
+        # NGINX main configuration file through template
+        j2_env = NcgTemplates.getEnvironment(apiversion)
+
+        nginxMainConf = j2_env.get_template(NcgConfig.config['templates']['nginxmain']).render(
+            nginxconf={'mainhttpfile': NcgConfig.config['nms']['staged_config_http_filename'],
+                       'mainstreamfile': NcgConfig.config['nms']['staged_config_stream_filename'],
+                       'modules': v5_6.MiscUtils.getDictKey(d, 'output.nginxone.modules'),
+                       'license': v5_6.MiscUtils.getDictKey(d, 'output.license')},
+                       d={'http': v5_6.MiscUtils.getDictKey(d, 'declaration.http')})
+
+        # NGINX License file
+        licenseJwtFile = j2_env.get_template(NcgConfig.config['templates']['license']).render(
+            nginxconf={'license': v5_6.MiscUtils.getDictKey(d, 'output.license')})
+        stage.add(objects=2, bytes=len(nginxMainConf) + len(licenseJwtFile))
+
+    ### Encode stage
+    with pipeline.stage('encode') as stage:
+        # Base64-encoded NGINX main configuration (/etc/nginx/nginx.conf)
+        b64NginxMain = str(base64.urlsafe_b64encode(nginxMainConf.encode("utf-8")), "utf-8")
+
+        # Base64-encoded license file (/etc/nginx/license.jwt)
+        b64licenseJwtFile = str(base64.urlsafe_b64encode(licenseJwtFile.encode("utf-8")), "utf-8")
+
+        # Base64-encoded NGINX mime.types (/etc/nginx/mime.types)
+        f = open(NcgConfig.config['templates']['root_dir'] + '/' + apiversion + '/' + NcgConfig.config['templates'][
+            'mimetypes'], 'r')
+        nginxMimeTypes = f.read()
+        f.close()
+
+        b64NginxMimeTypes = str(base64.urlsafe_b64encode(nginxMimeTypes.encode("utf-8")), "utf-8")
+        filesMimeType = {'contents': b64NginxMimeTypes, 'name': NcgConfig.config['nms']['config_dir'] + '/mime.types'}
+        auxFiles['files'].append(filesMimeType)
+
+        # Base64-encoded NGINX HTTP service configuration
+        filesNginxMain = {'contents': b64NginxMain, 'name': NcgConfig.config['nms']['config_dir'] + '/nginx.conf'}
+        filesLicenseFile = {'contents': b64licenseJwtFile, 'name': NcgConfig.config['nms']['config_dir'] + '/license.jwt'}
+        filesHttpConf = {'contents': b64HttpConf,
+                         'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
+                             'staged_config_http_filename']}
+        filesStreamConf = {'contents': b64StreamConf,
+                           'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
+                               'staged_config_stream_filename']}
+
+        # Append config files to staged configuration
+        configFiles['files'].append(filesNginxMain)
+        configFiles['files'].append(filesHttpConf)
+        configFiles['files'].append(filesStreamConf)
+
+        # If no R33+ license token was specified in the JSON declaration, it is assumed a token already exists
+        # on the NGINX instances and it won't be overwritten
+        if v5_6.MiscUtils.getDictKey(d, 'output.license.token') != "":
+            configFiles['files'].append(filesLicenseFile)
+
+        stage.add(objects=len(configFiles['files']) + len(auxFiles['files']),
+                  bytes=sum(len(f['contents']) for f in configFiles['files'] + auxFiles['files']))
+
+    if dryRun:
+        return v5_6.StagedConfig.dryRunReply(configFiles=configFiles, auxFiles=auxFiles, pipeline=pipeline)
+
+    ### Diff stage
+    with pipeline.stage('diff') as stage:
+        # Staged config
+        stagedConfig = {'conf_path': NcgConfig.config['nms']['config_dir'] + '/nginx.conf',
+                        'configs': [ configFiles, auxFiles ]}
+
+        # Staged files are compared to the digest manifest of the last published staged config
+        stagedManifest = v5_6.StagedConfig.digestManifest(configFiles, auxFiles)
+        currentStagedManifest = NcgRedis.redis.get(f'ncg.stagedmanifest.{configUid}')
+        previousStagedManifest = json.loads(currentStagedManifest) if currentStagedManifest else {}
+        stagedChanges = v5_6.StagedConfig.diffManifests(previousStagedManifest, stagedManifest)
+
+        # The config sync groups the last published staged config has been applied to. Groups added since then get the
+        # full staged config
+        publishedGroups = json.loads(NcgRedis.redis.get(f'ncg.publishedgroups.{configUid}') or '[]')
+        newGroups = [group for group in nOneConfigSyncGroups if group not in publishedGroups]
+        stage.add(objects=len(stagedManifest),
+                  bytes=sum(len(f['contents']) for f in configFiles['files'] + auxFiles['files']))
+
+    if currentStagedManifest is not None and not any(stagedChanges.values()) and not newGroups:
         print(f'Declaration [{configUid}] not changed')
         return {"status_code": 200,
-                "message": {"status_code": 200, "message": {"code": 200, "content": "no changes"}}}
+                "message": {"status_code": 200, "message": {"code": 200, "content": "no changes",
+                                                            "pipeline": pipeline.toDict()}}}
     else:
         # Configuration objects have changed, publish to NGINX One needed
         print(
-            f'Declaration [{configUid}] changed, publishing' if configUid else f'New declaration created, publishing')
+            f'Declaration [{configUid}] changed, publishing: {len(stagedChanges["added"])} files added, '
+            f'{len(stagedChanges["changed"])} changed, {len(stagedChanges["removed"])} removed, '
+            f'{len(newGroups)} new config sync groups'
+            if configUid else f'New declaration created, publishing')
 
-        # Get the config sync group id nOneUrl: str, nOneTokenUsername: str, nameSpace: str, clusterName: str
-        returnCode, igUid = v5_6.NGINXOneUtils.getConfigSyncGroupId(nOneUrl = nOneUrl, nOneToken = nOneToken,
-                                                nameSpace = nOneNamespace, configSyncGroupName = nOneConfigSyncGroup)
+        ### Publish stage
+        publishStage = pipeline.stage('publish').start()
 
-        # Invalid config sync group
-        if returnCode != 200:
-            return {"status_code": 404,
-                    "message": {"status_code": 404, "message": {"code": returnCode,
-                                                                "content": igUid}},
-                    "headers": {'Content-Type': 'application/json'}}
+        # Get the config sync groups id nOneUrl: str, nOneTokenUsername: str, nameSpace: str, clusterName: str
+        igUids = {}
+        for configSyncGroup in nOneConfigSyncGroups:
+            returnCode, igUid = v5_6.NGINXOneUtils.getConfigSyncGroupId(nOneUrl = nOneUrl, nOneToken = nOneToken,
+                                                    nameSpace = nOneNamespace, configSyncGroupName = configSyncGroup)
+
+            # Invalid config sync group
+            if returnCode != 200:
+                return {"status_code": 404,
+                        "message": {"status_code": 404, "message": {"code": returnCode,
+                                                                    "content": igUid}},
+                        "headers": {'Content-Type': 'application/json'}}
+
+            igUids[configSyncGroup] = igUid
 
         ### NGINX App Protect policies support - commits policies to control plane
 
@@ -269,111 +256,245 @@ def NGINXOneOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpCo
 
         ### / NGINX App Protect policies support
 
-        ### Publish staged config to config sync group
-        returnHttpCode = 422
+        ### Publish staged config to config sync groups
+        nOneClient = v5_6.NGINXOneClient.getClient(nOneUrl, nOneToken)
+        stagedConfigPayload = json.dumps(stagedConfig)
 
-        r = requests.put(url=f'{nOneUrl}/api/nginx/one/namespaces/{nOneNamespace}/config-sync-groups/{igUid}/config',
-                          data=json.dumps(stagedConfig),
-                          headers={'Content-Type': 'application/json', "Authorization": f"Bearer APIToken {nOneToken}"},
-                          verify=False)
+        # Delta publishing: only files added or changed since the last successful publish are sent, patching the
+        # config sync group configuration. The full staged config is published for new declarations, to config sync
+        # groups added since the last successful publish, when files have been removed or if the patch is rejected
+        deltaConfigPayload = None
+        if NcgConfig.config.get('controlplane', {}).get('delta_publish', False) and currentStagedManifest is not None \
+                and not stagedChanges['removed']:
+            deltaConfigPayload = json.dumps({'conf_path': stagedConfig['conf_path'],
+                                             'configs': [v5_6.StagedConfig.deltaFiles(c, stagedChanges)
+                                                         for c in stagedConfig['configs']]})
 
-        if r.status_code not in [200, 202]:
-            # Configuration publish failed
-            return {"status_code": r.status_code,
-                    "message": {"status_code": r.status_code, "message": r.text},
-                    "headers": {'Content-Type': 'application/json'}}
+        # if nmsSynctime > 0 and runfromautosync == False:
+        if runfromautosync == False:
+            # No configuration is found, generate one. The configUid is the tracking handle for the publication
+            configUid = str(v5_6.MiscUtils.getuniqueid())
 
-        if r.status_code == 202:
-            # Configuration has been submitted to NGINX One Console, fetch the deployment status - reply was HTTP/202
-            publishResponse = json.loads(r.text)
-            publication_id = publishResponse['object_id']
+        # Publication id for each config sync group the staged config has been submitted to
+        publications = {}
+        # Bytes sent to config sync groups
+        publishedBytes = []
+        # Config sync groups NGINX App Protect policies have been made active for
+        activePolicyGroups = []
 
-            # Wait for either NGINX One Cloud Console success or failure after pushing a staged config
-            isPending = True
-            while isPending:
-                time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
-                deploymentCheck = requests.get(url=f'{nOneUrl}/api/nginx/one/namespaces/{nOneNamespace}/config-sync-groups/{igUid}/publications/{publication_id}',
-                                               headers={"Authorization": f"Bearer APIToken {nOneToken}"},
-                                               verify=False)
+        # Returns the status of the publish in progress
+        def publicationInProgress():
+            content = {'message': 'publication in progress'}
 
-                checkJson = json.loads(deploymentCheck.text)
+            if len(nOneConfigSyncGroups) == 1:
+                content['publication'] = next(iter(publications.values()), None)
+            else:
+                content['publications'] = dict(publications)
 
-                if not checkJson['status'] == 'pending':
-                    isPending = False
+            return {'code': 202, 'content': content, 'configUid': configUid, 'changes': stagedChanges,
+                    'pipeline': pipeline.toDict()}
 
-            if checkJson['status'] == "failed":
-                # Staged config publish to NGINX One failed
-                jsonResponse = checkJson['status_reasons'][0]
-                returnHttpCode = 422
-            elif checkJson['status'] == "succeeded":
-                jsonResponse = { "message": "Config successfully applied", "status": checkJson['status'] }
-                returnHttpCode = 200
+        # Set once the staged config has been accepted by a config sync group
+        declarationStored = []
+        declarationStoredLock = threading.Lock()
 
-        else:
-            # Staged config publish to NGINX One succeeded - reply was HTTP/200
-            jsonResponse = json.loads(r.text)
-            returnHttpCode = 200
+        # Stores the declaration once the staged config has been accepted by the first config sync group: while the
+        # publication is in progress its status can be retrieved, and the declaration patched and deleted
+        def storeDeclaration():
+            with declarationStoredLock:
+                if declarationStored:
+                    return
 
-        # if nmsSynctime > 0 and runfromautosync == False:
-        if runfromautosync == False:
-            # No configuration is found, generate one
-            configUid = str(v5_6.MiscUtils.getuniqueid())
+                declarationStored.append(configUid)
 
             # Stores the staged config to redis
             # Redis keys:
             # ncg.declaration.[configUid] = original config declaration
             # ncg.declarationrendered.[configUid] = original config declaration - rendered
-            # ncg.basestagedconfig.[configUid] = base staged configuration
+            # ncg.stagedmanifest.[configUid] = staged configuration files digests
+            # ncg.stagedfile.[sha256] = staged configuration file contents, shared across declarations
+            # ncg.publishedgroups.[configUid] = groups the staged configuration has been applied to
             # ncg.apiversion.[configUid] = ncg API version
             # ncg.status.[configUid] = latest status
-
             NcgRedis.redis.set(f'ncg.declaration.{configUid}', pickle.dumps(declaration))
             NcgRedis.redis.set(f'ncg.declarationrendered.{configUid}', json.dumps(d))
-            NcgRedis.redis.set(f'ncg.basestagedconfig.{configUid}', json.dumps(baseStagedConfig))
             NcgRedis.redis.set(f'ncg.apiversion.{configUid}', apiversion)
 
-        # Makes NGINX App Protect policies active
-        doWeHavePolicies = v5_6.NGINXOneNAPUtils.makePolicyActive(nginxOneUrl=nOneUrl,
-                                                             nginxOneToken=nOneToken,
-                                                             nginxOneNamespace=nOneNamespace,
-                                                             activePolicyUids=activePolicyUids,
-                                                             instanceGroupUid=igUid)
-
-        if doWeHavePolicies:
-            # Clean up NGINX App Protect WAF policies not used anymore
-            # and not defined in the declaration just pushed
-            time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
-            #v5_6.NGINXOneNAPUtils.cleanPolicyLeftovers(nginxOneUrl=nOneUrl,nginxOneToken=nOneToken,
-            #                                        nginxOneNamespace=nOneNamespace,
-            #                                        currentPolicies=provisionedNapPolicies)
-
-        # If deploying a new configuration in GitOps mode start autosync
-        if nOneSynctime == 0:
-            NcgRedis.declarationsList[configUid] = "static"
-        elif not runfromautosync:
-            # GitOps autosync
-            print(f'Starting autosync for configUid {configUid} every {nOneSynctime} seconds')
-
-            job = schedule.every(nOneSynctime).seconds.do(lambda: v5_6_CreateConfig.configautosync(configUid))
-            # Keep track of GitOps configs, key is the threaded job
-            NcgRedis.declarationsList[configUid] = job
+            # If deploying a new configuration in GitOps mode start autosync
+            if nOneSynctime == 0:
+                NcgRedis.declarationsList[configUid] = "static"
+            elif not runfromautosync:
+                # GitOps autosync
+                print(f'Starting autosync for configUid {configUid} every {nOneSynctime} seconds')
 
-            NcgRedis.redis.set(f'ncg.apiversion.{configUid}', apiversion)
+                job = schedule.every(nOneSynctime).seconds.do(lambda: V5_6_CreateConfig.configautosync(configUid))
+                # Keep track of GitOps configs, key is the threaded job
+                NcgRedis.declarationsList[configUid] = job
+
+        # Publishes the staged config to a config sync group
+        # Returns a Future holding a tuple: HTTP code, reply content and True if the staged config was accepted
+        def publishToConfigSyncGroup(configSyncGroup: str):
+            igUid = igUids[configSyncGroup]
+            configPath = f'/api/nginx/one/namespaces/{nOneNamespace}/config-sync-groups/{igUid}/config'
+
+            if configSyncGroup in publishedGroups and not any(stagedChanges.values()):
+                # Only config sync groups added since the last publish need the staged config
+                storeDeclaration()
+                return v5_6.Rollout.outcome(200, {"message": "no changes"}, True)
+
+            r = None
+            if deltaConfigPayload is not None and configSyncGroup in publishedGroups:
+                r = nOneClient.patch(configPath, data=deltaConfigPayload, headers={'Content-Type': 'application/json'})
+                payloadSize = len(deltaConfigPayload)
 
-        responseContent = {' code': returnHttpCode, 'content': jsonResponse, 'configUid': configUid}
+                if r.status_code not in [200, 202, 404]:
+                    print(f'Declaration [{configUid}] delta publish to {configSyncGroup} failed with '
+                          f'HTTP/{r.status_code}, publishing the full staged config')
+                    r = None
 
-        # Configuration push completed, update redis keys
-        if configUid != "":
-            NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(responseContent))
+            if r is None:
+                r = nOneClient.put(configPath, data=stagedConfigPayload, headers={'Content-Type': 'application/json'})
+                payloadSize = len(stagedConfigPayload)
 
-            # if nmsSynctime > 0:
-            # Updates status, declaration and basestagedconfig in redis
-            NcgRedis.redis.set('ncg.declaration.' + configUid, pickle.dumps(declaration))
-            NcgRedis.redis.set('ncg.declarationrendered.' + configUid, json.dumps(d))
-            NcgRedis.redis.set('ncg.basestagedconfig.' + configUid, json.dumps(baseStagedConfig))
+            if r.status_code not in [200, 202]:
+                # Configuration publish failed
+                if r.status_code == 404:
+                    # The cached config sync group object id is not valid anymore
+                    v5_6.NGINXOneUtils.invalidateConfigSyncGroups(nOneUrl=nOneUrl, nOneToken=nOneToken,
+                                                                  nameSpace=nOneNamespace)
 
-        return {"status_code": returnHttpCode,
-            "message": {"status_code": returnHttpCode,
-                        "message": responseContent},
-            "headers": {'Content-Type': 'application/json'}
-            }
\ No newline at end of file
+                return v5_6.Rollout.outcome(r.status_code, r.text, False)
+
+            publishedBytes.append(payloadSize)
+            storeDeclaration()
+
+            # Completes the config sync group publish once the staged config has been applied by NGINX One Console
+            def publicationCompleted(returnHttpCode: int, jsonResponse: dict):
+                # Makes NGINX App Protect policies active
+                if v5_6.NGINXOneNAPUtils.makePolicyActive(nginxOneUrl=nOneUrl, nginxOneToken=nOneToken,
+                                                          nginxOneNamespace=nOneNamespace,
+                                                          activePolicyUids=activePolicyUids, instanceGroupUid=igUid):
+                    activePolicyGroups.append(configSyncGroup)
+
+                return returnHttpCode, jsonResponse, True
+
+            if r.status_code == 200:
+                # Staged config publish to NGINX One succeeded - reply was HTTP/200
+                return v5_6.Rollout.outcome(*publicationCompleted(200, json.loads(r.text)))
+
+            # Configuration has been submitted to NGINX One Console - reply was HTTP/202
+            publicationId = json.loads(r.text)['object_id']
+            publicationPath = f'/api/nginx/one/namespaces/{nOneNamespace}/config-sync-groups/{igUid}/publications/{publicationId}'
+            publications[configSyncGroup] = publicationId
+
+            # Returns a tuple: True and the HTTP code and publication JSON if the publication is completed or can't be
+            # checked anymore, False and None if it is still pending
+            def checkPublication():
+                publicationCheck = nOneClient.get(publicationPath)
+
+                if publicationCheck.status_code == 404:
+                    return True, (404, {"message": f"publication not found at {publicationPath}"})
+
+                if publicationCheck.status_code not in [200, 202]:
+                    return True, (publicationCheck.status_code, publicationCheck.text)
+
+                checkJson = json.loads(publicationCheck.text)
+
+                if checkJson['status'] == 'pending':
+                    return False, None
+
+                return True, (publicationCheck.status_code, checkJson)
+
+            # Returns a tuple with the HTTP code and the reply content for the given checkPublication final status,
+            # None if the publication timed out
+            def publicationOutcome(publication):
+                if publication is None:
+                    return 504, {"message": f"publication {publicationId} still pending after "
+                                            f"{NcgConfig.config.get('controlplane', {}).get('deployment_timeout', 600)} seconds"}
+
+                statusCode, checkJson = publication
+
+                if statusCode not in [200, 202]:
+                    # Publication status check failed
+                    return statusCode, checkJson
+
+                if checkJson['status'] == "succeeded":
+                    return 200, { "message": "Config successfully applied", "status": checkJson['status'] }
+
+                # Staged config publish to NGINX One failed
+                return 422, checkJson['status_reasons'][0] if checkJson.get('status_reasons') else checkJson
+
+            # The publication is tracked in the background, the declaration status is updated once all config sync
+            # groups have been published
+            NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(publicationInProgress()))
+
+            return v5_6.DeploymentWatcher.watch(check=checkPublication,
+                                                onDone=lambda publication: publicationCompleted(*publicationOutcome(publication)),
+                                                interval=NcgConfig.config['nms']['staged_config_publish_waittime'])
+
+        # Completes the publish once all config sync groups have been published
+        # outcomes is the config sync group to (HTTP code, reply content, accepted) tuple dict
+        def rolloutCompleted(outcomes: dict):
+            returnHttpCode = v5_6.Rollout.aggregateStatus(outcomes)
+            jsonResponse = next(iter(outcomes.values()))[1] if len(outcomes) == 1 else v5_6.Rollout.groupsReply(outcomes)
+
+            if not any(outcome[2] for outcome in outcomes.values()):
+                # The staged config was not accepted by any config sync group
+                return {"status_code": returnHttpCode,
+                        "message": {"status_code": returnHttpCode, "message": jsonResponse},
+                        "headers": {'Content-Type': 'application/json'}}
+
+            if activePolicyGroups:
+                # Clean up NGINX App Protect WAF policies not used anymore
+                # and not defined in the declaration just pushed
+                time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
+                #v5_6.NGINXOneNAPUtils.cleanPolicyLeftovers(nginxOneUrl=nOneUrl,nginxOneToken=nOneToken,
+                #                                        nginxOneNamespace=nOneNamespace,
+                #                                        currentPolicies=provisionedNapPolicies)
+
+            publishStage.add(objects=len(configFiles['files']) + len(auxFiles['files']), bytes=sum(publishedBytes))
+            publishStage.stop()
+
+            responseContent = {' code': returnHttpCode, 'content': jsonResponse, 'configUid': configUid,
+                               'changes': stagedChanges, 'pipeline': pipeline.toDict()}
+
+            if configUid not in NcgRedis.declarationsList:
+                # The declaration has been deleted while the publication was in progress
+                print(f'Declaration [{configUid}] deleted, publication outcome not stored')
+            else:
+                # Configuration push completed, update redis keys
+                # The staged config manifest describes the configuration applied by NGINX One Console, delta
+                # publishing is based on it. After a failed publish the next one sends the full staged config
+                if returnHttpCode == 200:
+                    # Rendered configuration files are reused by PATCH requests, see V5_6_CreateConfig
+                    v5_6.StagedConfig.storeFiles(configFiles, stagedManifest, previousStagedManifest)
+                    NcgRedis.redis.set('ncg.stagedmanifest.' + configUid, json.dumps(stagedManifest))
+                    NcgRedis.redis.set('ncg.publishedgroups.' + configUid, json.dumps(nOneConfigSyncGroups))
+                else:
+                    NcgRedis.redis.delete('ncg.stagedmanifest.' + configUid, 'ncg.publishedgroups.' + configUid)
+
+                V5_6_CreateConfig.autosyncCompleted(configUid=configUid, fingerprint=autosyncFingerprint,
+                                                     statusCode=returnHttpCode)
+
+                # The status is updated last: once it is not 202 anymore the publication outcome is fully stored
+                NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(responseContent))
+
+            return {"status_code": returnHttpCode,
+                "message": {"status_code": returnHttpCode,
+                            "message": responseContent},
+                "headers": {'Content-Type': 'application/json'}
+                }
+
+        # Config sync groups are published in waves of nOneWaveSize groups, see v5_6.Rollout
+        deployment = v5_6.Rollout.rollout(groups=nOneConfigSyncGroups, publish=publishToConfigSyncGroup,
+                                          onDone=rolloutCompleted, waveSize=nOneWaveSize, key=configUid)
+
+        if deployment.done():
+            return deployment.result()
+
+        # Publications are tracked in the background and their outcome stored as the declaration status:
+        # the configUid and publication ids are returned right away
+        return {"status_code": 202,
+                "message": {"status_code": 202, "message": publicationInProgress()},
+                "headers": {'Content-Type': 'application/json'}
+                }
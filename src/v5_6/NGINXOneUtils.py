@@ -2,16 +2,23 @@
 NGINX One support functions
 """
 
-import requests
 import json
 
+import v5_6.GroupIndex
+import v5_6.MiscUtils
+import v5_6.NGINXOneClient
 
-# Fetch a cluster ID from NGINX One
-# Return None if not found
-def getConfigSyncGroupId(nOneUrl: str, nOneToken: str, nameSpace: str, configSyncGroupName: str):
-    # Retrieve config sync group uid
-    cSyncGroup = requests.get(url=f'{nOneUrl}/api/nginx/one/namespaces/{nameSpace}/config-sync-groups?paginated=false',
-                      verify=False, headers = {"Authorization": f"Bearer APIToken {nOneToken}"})
+
+# Returns the config sync groups index key for the given NGINX One Console, token and namespace
+def __groupIndexKey__(nOneUrl: str, nOneToken: str, nameSpace: str):
+    return v5_6.MiscUtils.digest({'nginxone': nOneUrl.rstrip('/'), 'token': nOneToken, 'namespace': nameSpace})
+
+
+# Fetch all config sync groups from NGINX One
+# Return is a tuple: status_code, config sync group name to object id dict or error message
+def __loadConfigSyncGroups__(nOneUrl: str, nOneToken: str, nameSpace: str):
+    cSyncGroup = v5_6.NGINXOneClient.getClient(nOneUrl, nOneToken).get(
+        f'/api/nginx/one/namespaces/{nameSpace}/config-sync-groups?paginated=false')
 
     if cSyncGroup.status_code != 200:
         if cSyncGroup.status_code == 401:
@@ -19,14 +26,26 @@ def getConfigSyncGroupId(nOneUrl: str, nOneToken: str, nameSpace: str, configSyn
         else:
             return cSyncGroup.status_code, f"Error fetching config sync group uid: {cSyncGroup.text}"
 
-    # Get the instance group id
-    igUid = None
-    igJson = json.loads(cSyncGroup.text)
-    for i in igJson['items']:
-        if i['name'] == configSyncGroupName:
-            igUid = i['object_id']
+    return 200, {i['name']: i['object_id'] for i in json.loads(cSyncGroup.text)['items']}
+
+
+# Fetch a cluster ID from NGINX One
+# Return None if not found
+def getConfigSyncGroupId(nOneUrl: str, nOneToken: str, nameSpace: str, configSyncGroupName: str):
+    returnCode, igUid = v5_6.GroupIndex.resolve(
+        key=__groupIndexKey__(nOneUrl, nOneToken, nameSpace), name=configSyncGroupName,
+        loader=lambda: __loadConfigSyncGroups__(nOneUrl, nOneToken, nameSpace))
+
+    if returnCode != 200:
+        return returnCode, igUid
 
     if igUid is None:
         return 404, f"config sync group [{configSyncGroupName}] not found"
 
     return 200, igUid
+
+
+# Discards the cached config sync groups for the given NGINX One Console namespace, ie. when a config sync group
+# object id is not found
+def invalidateConfigSyncGroups(nOneUrl: str, nOneToken: str, nameSpace: str):
+    v5_6.GroupIndex.invalidate(__groupIndexKey__(nOneUrl, nOneToken, nameSpace))
@@ -0,0 +1,47 @@
+"""
+Pooled NGINX Instance Manager API clients
+
+A client is kept for each NGINX Instance Manager URL and credentials for the life of the process: connections are
+kept alive and reused across all requests made while publishing declarations
+"""
+
+import threading
+
+import v5_6.MiscUtils
+from v5_6.ControlPlaneClient import ControlPlaneClient
+
+# Clients, key is the digest of the NGINX Instance Manager URL and credentials
+__clients__ = {}
+__clientsLock__ = threading.Lock()
+
+
+class NIMClient(ControlPlaneClient):
+    def __init__(self, url: str, username: str, password: str):
+        super().__init__(url=url, settingsName='nim')
+        self.username = username
+        self.session.auth = (username, password)
+
+    def stats(self):
+        return {**super().stats(), 'username': self.username}
+
+
+# Returns the client for the given NGINX Instance Manager URL and credentials, creating it if needed
+def getClient(nmsUrl: str, nmsUsername: str, nmsPassword: str):
+    key = v5_6.MiscUtils.digest({'url': nmsUrl.rstrip('/'), 'username': nmsUsername, 'password': nmsPassword})
+
+    with __clientsLock__:
+        client = __clients__.get(key)
+
+        if client is None:
+            client = NIMClient(url=nmsUrl, username=nmsUsername, password=nmsPassword)
+            __clients__[key] = client
+
+    return client
+
+
+# Returns request metrics for all clients
+def stats():
+    with __clientsLock__:
+        clients = list(__clients__.values())
+
+    return [client.stats() for client in clients]
@@ -2,11 +2,11 @@
 F5 WAF for NGINX support functions
 """
 
-import requests
 import json
 import base64
 
 import v5_6.GitOps
+import v5_6.NIMClient
 
 from NcgConfig import NcgConfig
 
@@ -38,43 +38,38 @@ def __definePolicyOnNMS__(nmsUrl: str, nmsUsername: str, nmsPassword: str, polic
     policyCreationPayload['metadata']['description'] = policyDescription
     policyCreationPayload['content'] = policyJson
 
+    nimClient = v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword)
+
     if policyUid != "":
         # Existing policy update
-        r = requests.put(url=f"{nmsUrl}/api/platform/v1/security/policies/{policyUid}",
-                         data=json.dumps(policyCreationPayload),
-                         headers={'Content-Type': 'application/json'},
-                         auth=(nmsUsername, nmsPassword),
-                         verify=False)
+        r = nimClient.put(f"/api/platform/v1/security/policies/{policyUid}",
+                          data=json.dumps(policyCreationPayload),
+                          headers={'Content-Type': 'application/json'})
     else:
         # New policy creation - first try to create it as a new revision for an existing policy
         # The response code is 201 if successful and 404 if there is no policy with the given name
-        r = requests.post(url=f"{nmsUrl}/api/platform/v1/security/policies?isNewRevision=true",
-                          data=json.dumps(policyCreationPayload),
-                          headers={'Content-Type': 'application/json'},
-                          auth=(nmsUsername, nmsPassword),
-                          verify=False)
+        r = nimClient.post("/api/platform/v1/security/policies?isNewRevision=true",
+                           data=json.dumps(policyCreationPayload),
+                           headers={'Content-Type': 'application/json'})
 
         # Check if this is a new policy with no existing versions. If this is true create its initial version
         if r.status_code == 404:
-            r = requests.post(url=f"{nmsUrl}/api/platform/v1/security/policies",
-                              data=json.dumps(policyCreationPayload),
-                              headers={'Content-Type': 'application/json'},
-                              auth=(nmsUsername, nmsPassword),
-                              verify=False)
+            r = nimClient.post("/api/platform/v1/security/policies",
+                               data=json.dumps(policyCreationPayload),
+                               headers={'Content-Type': 'application/json'})
 
     return r
 
 
 # Retrieve security policies information
 def __getAllPolicies__(nmsUrl: str, nmsUsername: str, nmsPassword: str):
-    return requests.get(url=f'{nmsUrl}/api/platform/v1/security/policies',
-                        auth=(nmsUsername, nmsPassword), verify=False)
+    return v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword).get('/api/platform/v1/security/policies')
 
 
 # Delete security policy from control plane
 def __deletePolicy__(nmsUrl: str, nmsUsername: str, nmsPassword: str, policyUid: str):
-    return requests.delete(url=f'{nmsUrl}/api/platform/v1/security/policies/{policyUid}',
-                           auth=(nmsUsername, nmsPassword), verify=False)
+    return v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword).delete(
+        f'/api/platform/v1/security/policies/{policyUid}')
 
 
 # Check NAP policies names validity for the given declaration
@@ -243,8 +238,8 @@ def makePolicyActive(nmsUrl: str, nmsUsername: str, nmsPassword: str, activePoli
         }
 
         doWeHavePolicies = True
-        r = requests.post(url=f'{nmsUrl}/api/platform/v1/security/publish', auth=(nmsUsername, nmsPassword),
-                          data=json.dumps(body), headers={'Content-Type': 'application/json'}, verify=False)
+        r = v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword).post(
+            '/api/platform/v1/security/publish', data=json.dumps(body), headers={'Content-Type': 'application/json'})
 
     return doWeHavePolicies
 
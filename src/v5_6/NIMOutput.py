@@ -3,23 +3,27 @@ Output to NGINX Instance Manager
 """
 
 import base64
-import requests
 import json
 import pickle
+import threading
 import time
 import schedule
 
-from jinja2 import Environment, FileSystemLoader
 from urllib.parse import urlparse
 from datetime import datetime
 
 import V5_6_CreateConfig
 
 import v5_6.APIGateway
+import v5_6.DeploymentWatcher
 import v5_6.DevPortal
 import v5_6.DeclarationPatcher
 import v5_6.GitOps
 import v5_6.MiscUtils
+import v5_6.PipelineStats
+import v5_6.Rollout
+import v5_6.StagedConfig
+import v5_6.NIMClient
 import v5_6.NIMOutput
 import v5_6.NIMUtils
 
@@ -32,16 +36,23 @@ import v5_6.NIMNAPUtils
 # NGINX Declarative API modules
 from NcgConfig import NcgConfig
 from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
 
 def NIMOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: str,
               b64StreamConf: str,configFiles = {}, auxFiles = {},
               runfromautosync: bool = False,
-              configUid: str = ""):
+              configUid: str = "", pipeline: v5_6.PipelineStats.PipelineStats = None,
+              autosyncFingerprint: str = None):
     # NGINX Instance Manager Staged Configuration publish
 
+    if pipeline is None:
+        pipeline = v5_6.PipelineStats.PipelineStats()
+
     nmsUsername = v5_6.MiscUtils.getDictKey(d, 'output.nms.username')
     nmsPassword = v5_6.MiscUtils.getDictKey(d, 'output.nms.password')
     nmsInstanceGroup = v5_6.MiscUtils.getDictKey(d, 'output.nms.instancegroup')
+    nmsInstanceGroups = v5_6.MiscUtils.getDictKey(d, 'output.nms.instancegroups') or [nmsInstanceGroup]
+    nmsWaveSize = v5_6.MiscUtils.getDictKey(d, 'output.nms.wavesize')
     nmsSynctime = v5_6.MiscUtils.getDictKey(d, 'output.nms.synctime')
 
     nmsUrlFromJson = v5_6.MiscUtils.getDictKey(d, 'output.nms.url')
@@ -53,8 +64,11 @@ def NIMOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: s
                                                             "content": f"invalid NGINX Instance Manager URL {nmsUrlFromJson}"}},
                 "headers": {'Content-Type': 'application/json'}}
 
+    # Dry run: the staged configuration is built and returned, the control plane is never contacted
+    dryRun = v5_6.MiscUtils.getDictKey(d, 'output.dryrun')
+
     # DNS resolution check
-    dnsOutcome, dnsReply = v5_6.MiscUtils.resolveFQDN(urlCheck.netloc)
+    dnsOutcome, dnsReply = v5_6.MiscUtils.resolveFQDN(urlCheck.hostname) if not dryRun else (True, None)
     if not dnsOutcome:
         return {"status_code": 400,
                 "message": {"status_code": 400, "message": {"code": 400,
@@ -68,182 +82,154 @@ def NIMOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: s
                 "message": {"status_code": 400, "message": {"code": 400, "content": "synctime must be >= 0"}},
                 "headers": {'Content-Type': 'application/json'}}
 
-    # Fetch F5 WAF for NGINX WAF policies from source of truth if needed
-    d_policies = v5_6.MiscUtils.getDictKey(d, 'output.declaration.http.policies')
-    if d_policies is not None:
-        for policy in d_policies:
-            if 'versions' in policy:
-                for policyVersion in policy['versions']:
-                    status, content = v5_6.GitOps.getObjectFromRepo(object=policyVersion['contents'],
-                                                                    authProfiles=d['declaration']['http'][
-                                                                        'authentication'])
-
-                    if status != 200:
-                        return {"status_code": 422, "message": {"status_code": status, "message": content}}
-
-                    policyVersion['contents'] = content
-
-    # Check TLS items validity
-    all_tls = {'certificate': {}, 'key': {}}
-
-    d_certs = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
-    if d_certs is not None:
-        for i in range(len(d_certs)):
-            if d_certs[i]['name']:
-                all_tls[d_certs[i]['type']][d_certs[i]['name']] = True
-
-    # TLS certificates and key names validity checks for servers
-    d_servers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.servers')
-    if d_servers is not None:
-        for server in d_servers:
-            if server['listen'] is not None:
-                if 'tls' in server['listen']:
-                    cert_name = v5_6.MiscUtils.getDictKey(server, 'listen.tls.certificate')
-                    if cert_name and cert_name not in all_tls['certificate']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid TLS certificate [" +
-                                                           cert_name + "] for server [" + str(
-                                                    server['names']) + "] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                                }}
-
-                    cert_key = v5_6.MiscUtils.getDictKey(server, 'listen.tls.key')
-                    if cert_key and cert_key not in all_tls['key']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid TLS key [" + cert_key + "] for server [" + str(
-                                                    server['names']) + "] must be one of [" + ",".join(all_tls['key']) + "]"}
-                                }}
-
-                    trusted_cert_name = v5_6.MiscUtils.getDictKey(server, 'listen.tls.trusted_ca_certificates')
-                    if trusted_cert_name and trusted_cert_name not in all_tls['certificate']:
-                        return {"status_code": 422,
-                                "message": {
-                                    "status_code": 422,
-                                    "message": {"code": 422,
-                                                "content": "invalid trusted CA certificate [" +
-                                                           trusted_cert_name + "] for server [" + str(server['names'])
-                                                           + "] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                                }}
-
-    # TLS certificates and key names validity checks or ACME issuer profiles
-    d_acmeissuers = v5_6.MiscUtils.getDictKey(d, 'declaration.http.acme_issuers')
-    if d_acmeissuers is not None:
-        for issuer in d_acmeissuers:
-            cert_name = issuer['ssl_trusted_certificate']
-            if cert_name and cert_name not in all_tls['certificate']:
-                return {"status_code": 422,
-                        "message": {
-                            "status_code": 422,
-                            "message": {"code": 422,
-                                        "content": "invalid TLS certificate [" +
-                                                   cert_name + "] for ACME issuer [" + str(
-                                            issuer['name']) +"] must be one of [" + ",".join(all_tls['certificate']) + "]"}
-                        }}
-
-    # Add optional certificates specified under declaration.certificates
-    extensions_map = {'certificate': '.crt', 'key': '.key'}
-
-    d_certificates = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
-    if d_certificates is not None:
-        for c in d_certificates:
-            status, certContent = v5_6.GitOps.getObjectFromRepo(object=c['contents'],
-                                                                authProfiles=d['declaration']['http']['authentication'])
-
-            if status != 200:
-                return {"status_code": 422,
-                        "message": {"status_code": status, "message": {"code": status, "content": certContent}}}
-
-            newAuxFile = {'contents': certContent['content'], 'name': NcgConfig.config['nms']['certs_dir'] +
-                                                                      '/' + c['name'] + extensions_map[c['type']]}
-            auxFiles['files'].append(newAuxFile)
-
-    ### / Add optional certificates specified under declaration.certificates
-
-    # NGINX main configuration file through template
-    j2_env = Environment(loader=FileSystemLoader(NcgConfig.config['templates']['root_dir'] + '/' + apiversion),
-                         trim_blocks=True, extensions=["jinja2_base64_filters.Base64Filters"])
-
-    nginxMainConf = j2_env.get_template(NcgConfig.config['templates']['nginxmain']).render(
-        nginxconf={'mainhttpfile': NcgConfig.config['nms']['staged_config_http_filename'],
-                   'mainstreamfile': NcgConfig.config['nms']['staged_config_stream_filename'],
-                   'modules': v5_6.MiscUtils.getDictKey(d, 'output.nms.modules'),
-                   'license': v5_6.MiscUtils.getDictKey(d, 'output.license')},
-                   d={'http': v5_6.MiscUtils.getDictKey(d, 'declaration.http')})
-
-    # Base64-encoded NGINX main configuration (/etc/nginx/nginx.conf)
-    b64NginxMain = str(base64.urlsafe_b64encode(nginxMainConf.encode("utf-8")), "utf-8")
-
-    # NGINX License file
-    licenseJwtFile = j2_env.get_template(NcgConfig.config['templates']['license']).render(
-        nginxconf={'license': v5_6.MiscUtils.getDictKey(d, 'output.license')})
-
-    # Base64-encoded license file (/etc/nginx/license.jwt)
-    b64licenseJwtFile = str(base64.urlsafe_b64encode(licenseJwtFile.encode("utf-8")), "utf-8")
-
-    # Base64-encoded NGINX mime.types (/etc/nginx/mime.types)
-    f = open(NcgConfig.config['templates']['root_dir'] + '/' + apiversion + '/' + NcgConfig.config['templates'][
-        'mimetypes'], 'r')
-    nginxMimeTypes = f.read()
-    f.close()
-
-    b64NginxMimeTypes = str(base64.urlsafe_b64encode(nginxMimeTypes.encode("utf-8")), "utf-8")
-    filesMimeType = {'contents': b64NginxMimeTypes, 'name': NcgConfig.config['nms']['config_dir'] + '/mime.types'}
-    auxFiles['files'].append(filesMimeType)
-
-    # Base64-encoded NGINX HTTP service configuration
-    filesNginxMain = {'contents': b64NginxMain, 'name': NcgConfig.config['nms']['config_dir'] + '/nginx.conf'}
-    filesLicenseFile = {'contents': b64licenseJwtFile, 'name': NcgConfig.config['nms']['config_dir'] + '/license.jwt'}
-    filesHttpConf = {'contents': b64HttpConf,
-                     'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
-                         'staged_config_http_filename']}
-    filesStreamConf = {'contents': b64StreamConf,
-                       'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
-                           'staged_config_stream_filename']}
-
-    # Append config files to staged configuration
-    configFiles['files'].append(filesNginxMain)
-    configFiles['files'].append(filesHttpConf)
-    configFiles['files'].append(filesStreamConf)
-
-    # If no R33+ license token was specified in the JSON declaration, it is assumed a token already exists
-    # on the NGINX instances and it won't be overwritten
-    if v5_6.MiscUtils.getDictKey(d, 'output.license.token') != "":
-        configFiles['files'].append(filesLicenseFile)
-
-    # Staged config
-    baseStagedConfig = {'auxFiles': auxFiles, 'configFiles': configFiles}
-    stagedConfig = {'auxFiles': auxFiles, 'configFiles': configFiles,
-                    'updateTime': datetime.utcnow().isoformat()[:-3] + 'Z',
-                    'ignoreConflict': True, 'validateConfig': False}
-
-    currentBaseStagedConfig = NcgRedis.redis.get(f'ncg.basestagedconfig.{configUid}').decode(
-        'utf-8') if NcgRedis.redis.get(f'ncg.basestagedconfig.{configUid}') else None
-    newBaseStagedConfig = json.dumps(baseStagedConfig)
-
-    if currentBaseStagedConfig is not None and newBaseStagedConfig == currentBaseStagedConfig:
+    ### Fetch stage
+    with pipeline.stage('fetch') as stage:
+        # Fetch F5 WAF for NGINX WAF policies from source of truth if needed
+        d_policies = v5_6.MiscUtils.getDictKey(d, 'output.declaration.http.policies')
+        if d_policies is not None:
+            for policy in d_policies:
+                if 'versions' in policy:
+                    for policyVersion in policy['versions']:
+                        status, content = v5_6.GitOps.getObjectFromRepo(object=policyVersion['contents'],
+                                                                        authProfiles=d['declaration']['http'][
+                                                                            'authentication'],
+                                                                        pipelineStage=stage)
+
+                        if status != 200:
+                            return {"status_code": 422, "message": {"status_code": status, "message": content}}
+
+                        policyVersion['contents'] = content
+
+        # Add optional certificates specified under declaration.certificates
+        extensions_map = {'certificate': '.crt', 'key': '.key'}
+
+        d_certificates = v5_6.MiscUtils.getDictKey(d, 'declaration.certificates')
+        if d_certificates is not None:
+            for c in d_certificates:
+                status, certContent = v5_6.GitOps.getObjectFromRepo(object=c['contents'],
+                                                                    authProfiles=d['declaration']['http']['authentication'],
+                                                                    pipelineStage=stage)
+
+                if status != 200:
+                    return {"status_code": 422,
+                            "message": {"status_code": status, "message": {"code": status, "content": certContent}}}
+
+                newAuxFile = {'contents': certContent['content'], 'name': NcgConfig.config['nms']['certs_dir'] +
+                                                                          '/' + c['name'] + extensions_map[c['type']]}
+                auxFiles['files'].append(newAuxFile)
+
+        ### / Add optional certificates specified under declaration.certificates
+
+    ### Render stage
+    with pipeline.stage('render') as stage:
+        # NGINX main configuration file through template
+        j2_env = NcgTemplates.getEnvironment(apiversion)
+
+        nginxMainConf = j2_env.get_template(NcgConfig.config['templates']['nginxmain']).render(
+            nginxconf={'mainhttpfile': NcgConfig.config['nms']['staged_config_http_filename'],
+                       'mainstreamfile': NcgConfig.config['nms']['staged_config_stream_filename'],
+                       'modules': v5_6.MiscUtils.getDictKey(d, 'output.nms.modules'),
+                       'license': v5_6.MiscUtils.getDictKey(d, 'output.license')},
+                       d={'http': v5_6.MiscUtils.getDictKey(d, 'declaration.http')})
+
+        # NGINX License file
+        licenseJwtFile = j2_env.get_template(NcgConfig.config['templates']['license']).render(
+            nginxconf={'license': v5_6.MiscUtils.getDictKey(d, 'output.license')})
+        stage.add(objects=2, bytes=len(nginxMainConf) + len(licenseJwtFile))
+
+    ### Encode stage
+    with pipeline.stage('encode') as stage:
+        # Base64-encoded NGINX main configuration (/etc/nginx/nginx.conf)
+        b64NginxMain = str(base64.urlsafe_b64encode(nginxMainConf.encode("utf-8")), "utf-8")
+
+        # Base64-encoded license file (/etc/nginx/license.jwt)
+        b64licenseJwtFile = str(base64.urlsafe_b64encode(licenseJwtFile.encode("utf-8")), "utf-8")
+
+        # Base64-encoded NGINX mime.types (/etc/nginx/mime.types)
+        f = open(NcgConfig.config['templates']['root_dir'] + '/' + apiversion + '/' + NcgConfig.config['templates'][
+            'mimetypes'], 'r')
+        nginxMimeTypes = f.read()
+        f.close()
+
+        b64NginxMimeTypes = str(base64.urlsafe_b64encode(nginxMimeTypes.encode("utf-8")), "utf-8")
+        filesMimeType = {'contents': b64NginxMimeTypes, 'name': NcgConfig.config['nms']['config_dir'] + '/mime.types'}
+        auxFiles['files'].append(filesMimeType)
+
+        # Base64-encoded NGINX HTTP service configuration
+        filesNginxMain = {'contents': b64NginxMain, 'name': NcgConfig.config['nms']['config_dir'] + '/nginx.conf'}
+        filesLicenseFile = {'contents': b64licenseJwtFile, 'name': NcgConfig.config['nms']['config_dir'] + '/license.jwt'}
+        filesHttpConf = {'contents': b64HttpConf,
+                         'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
+                             'staged_config_http_filename']}
+        filesStreamConf = {'contents': b64StreamConf,
+                           'name': NcgConfig.config['nms']['config_dir'] + '/' + NcgConfig.config['nms'][
+                               'staged_config_stream_filename']}
+
+        # Append config files to staged configuration
+        configFiles['files'].append(filesNginxMain)
+        configFiles['files'].append(filesHttpConf)
+        configFiles['files'].append(filesStreamConf)
+
+        # If no R33+ license token was specified in the JSON declaration, it is assumed a token already exists
+        # on the NGINX instances and it won't be overwritten
+        if v5_6.MiscUtils.getDictKey(d, 'output.license.token') != "":
+            configFiles['files'].append(filesLicenseFile)
+
+        stage.add(objects=len(configFiles['files']) + len(auxFiles['files']),
+                  bytes=sum(len(f['contents']) for f in configFiles['files'] + auxFiles['files']))
+
+    if dryRun:
+        return v5_6.StagedConfig.dryRunReply(configFiles=configFiles, auxFiles=auxFiles, pipeline=pipeline)
+
+    ### Diff stage
+    with pipeline.stage('diff') as stage:
+        # Staged config
+        stagedConfig = {'auxFiles': auxFiles, 'configFiles': configFiles,
+                        'updateTime': datetime.utcnow().isoformat()[:-3] + 'Z',
+                        'ignoreConflict': True, 'validateConfig': False}
+
+        # Staged files are compared to the digest manifest of the last published staged config
+        stagedManifest = v5_6.StagedConfig.digestManifest(configFiles, auxFiles)
+        currentStagedManifest = NcgRedis.redis.get(f'ncg.stagedmanifest.{configUid}')
+        previousStagedManifest = json.loads(currentStagedManifest) if currentStagedManifest else {}
+        stagedChanges = v5_6.StagedConfig.diffManifests(previousStagedManifest, stagedManifest)
+
+        # The instance groups the last published staged config has been applied to. Groups added since then get the
+        # full staged config
+        publishedGroups = json.loads(NcgRedis.redis.get(f'ncg.publishedgroups.{configUid}') or '[]')
+        newGroups = [group for group in nmsInstanceGroups if group not in publishedGroups]
+        stage.add(objects=len(stagedManifest),
+                  bytes=sum(len(f['contents']) for f in configFiles['files'] + auxFiles['files']))
+
+    if currentStagedManifest is not None and not any(stagedChanges.values()) and not newGroups:
         print(f'Declaration [{configUid}] not changed')
         return {"status_code": 200,
-                "message": {"status_code": 200, "message": {"code": 200, "content": "no changes"}}}
+                "message": {"status_code": 200, "message": {"code": 200, "content": "no changes",
+                                                            "pipeline": pipeline.toDict()}}}
     else:
         # Configuration objects have changed, publish to NIM needed
         print(
-            f'Declaration [{configUid}] changed, publishing' if configUid else f'New declaration created, publishing')
-
-        # Get the instance group id
-        igUid = v5_6.NIMUtils.getNIMInstanceGroupUid(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
-                                                     nmsPassword=nmsPassword, instanceGroupName=nmsInstanceGroup)
-
-        # Invalid instance group
-        if igUid is None:
-            return {"status_code": 404,
-                    "message": {"status_code": 404, "message": {"code": 404,
-                                                                "content": f"instance group {nmsInstanceGroup} not found"}},
-                    "headers": {'Content-Type': 'application/json'}}
+            f'Declaration [{configUid}] changed, publishing: {len(stagedChanges["added"])} files added, '
+            f'{len(stagedChanges["changed"])} changed, {len(stagedChanges["removed"])} removed, '
+            f'{len(newGroups)} new instance groups'
+            if configUid else f'New declaration created, publishing')
+
+        ### Publish stage
+        publishStage = pipeline.stage('publish').start()
+
+        # Get the instance groups id
+        igUids = {}
+        for instanceGroup in nmsInstanceGroups:
+            igUids[instanceGroup] = v5_6.NIMUtils.getNIMInstanceGroupUid(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
+                                                                         nmsPassword=nmsPassword,
+                                                                         instanceGroupName=instanceGroup)
+
+            # Invalid instance group
+            if igUids[instanceGroup] is None:
+                return {"status_code": 404,
+                        "message": {"status_code": 404, "message": {"code": 404,
+                                                                    "content": f"instance group {instanceGroup} not found"}},
+                        "headers": {'Content-Type': 'application/json'}}
 
         ### F5 WAF for NGINX policies support - commits policies to control plane
 
@@ -269,79 +255,48 @@ def NIMOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: s
 
            ### / F5 WAF for NGINX policies support
 
-        ### Publish staged config to instance group
-        r = requests.post(url=nmsUrl + f"/api/platform/v1/instance-groups/{igUid}/config",
-                          data=json.dumps(stagedConfig),
-                          headers={'Content-Type': 'application/json'},
-                          auth=(nmsUsername, nmsPassword),
-                          verify=False)
-
-        if r.status_code != 202:
-            # Configuration push failed
-            return {"status_code": r.status_code,
-                    "message": {"status_code": r.status_code, "message": r.text},
-                    "headers": {'Content-Type': 'application/json'}}
-
-        # Fetch the deployment status
-        publishResponse = json.loads(r.text)
-
-        # Wait for either NGINX Instance Manager success or failure after pushing a staged config
-        isPending = True
-        jsonResponse = {}
-        while isPending:
-            time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
-            deploymentCheck = requests.get(url=nmsUrl + publishResponse['links']['rel'],
-                                           auth=(nmsUsername, nmsPassword),
-                                           verify=False)
-
-            checkJson = json.loads(deploymentCheck.text)
-
-            if deploymentCheck.status_code == 404:
-                jsonResponse = {"message": f"deployment not found at {publishResponse['links']['rel']}"}
-                isPending = False
-
-            if 'details' in checkJson and not checkJson['details']['pending']:
-                isPending = False
-
-        if 'details' not in checkJson or len(checkJson['details']['failure']) > 0:
-            # Staged config publish to NIM failed
-            jsonResponse = checkJson['details']['failure'][0] if 'details' in checkJson else jsonResponse
-            deploymentCheck.status_code = 422
-        else:
-            # Staged config publish to NIM succeeded
-            jsonResponse = json.loads(deploymentCheck.text)
-
-            # if nmsSynctime > 0 and runfromautosync == False:
-            if runfromautosync == False:
-                # No configuration is found, generate one
-                configUid = str(v5_6.MiscUtils.getuniqueid())
-
-                # Stores the staged config to redis
-                # Redis keys:
-                # ncg.declaration.[configUid] = original config declaration
-                # ncg.declarationrendered.[configUid] = original config declaration - rendered
-                # ncg.basestagedconfig.[configUid] = base staged configuration
-                # ncg.apiversion.[configUid] = ncg API version
-                # ncg.status.[configUid] = latest status
-
-                NcgRedis.redis.set(f'ncg.declaration.{configUid}', pickle.dumps(declaration))
-                NcgRedis.redis.set(f'ncg.declarationrendered.{configUid}', json.dumps(d))
-                NcgRedis.redis.set(f'ncg.basestagedconfig.{configUid}', json.dumps(baseStagedConfig))
-                NcgRedis.redis.set(f'ncg.apiversion.{configUid}', apiversion)
-
-            # Makes F5 WAF for NGINX policies active
-            doWeHavePolicies = v5_6.NIMNAPUtils.makePolicyActive(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
-                                                                 nmsPassword=nmsPassword,
-                                                                 activePolicyUids=activePolicyUids,
-                                                                 instanceGroupUid=igUid)
-
-            if doWeHavePolicies:
-                # Clean up F5 WAF for NGINX WAF policies not used anymore
-                # and not defined in the declaration just pushed
-                time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
-                v5_6.NIMNAPUtils.cleanPolicyLeftovers(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
-                                                      nmsPassword=nmsPassword,
-                                                      currentPolicies=provisionedNapPolicies)
+        ### Publish staged config to instance groups
+        stagedConfigPayload = json.dumps(stagedConfig)
+        nimClient = v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword)
+
+        # if nmsSynctime > 0 and runfromautosync == False:
+        if runfromautosync == False:
+            # No configuration is found, generate one. The configUid is the tracking handle for the deployment
+            configUid = str(v5_6.MiscUtils.getuniqueid())
+
+        # Instance groups F5 WAF for NGINX policies have been made active for
+        activePolicyGroups = []
+
+        # Returns the status of the deployment in progress
+        def deploymentInProgress():
+            return {'code': 202, 'content': {'message': 'deployment in progress'}, 'configUid': configUid,
+                    'changes': stagedChanges, 'pipeline': pipeline.toDict()}
+
+        # Set once the staged config has been accepted by an instance group
+        declarationStored = []
+        declarationStoredLock = threading.Lock()
+
+        # Stores the declaration once the staged config has been accepted by the first instance group: while the
+        # deployment is in progress its status can be retrieved, and the declaration patched and deleted
+        def storeDeclaration():
+            with declarationStoredLock:
+                if declarationStored:
+                    return
+
+                declarationStored.append(configUid)
+
+            # Stores the staged config to redis
+            # Redis keys:
+            # ncg.declaration.[configUid] = original config declaration
+            # ncg.declarationrendered.[configUid] = original config declaration - rendered
+            # ncg.stagedmanifest.[configUid] = staged configuration files digests
+            # ncg.stagedfile.[sha256] = staged configuration file contents, shared across declarations
+            # ncg.publishedgroups.[configUid] = groups the staged configuration has been applied to
+            # ncg.apiversion.[configUid] = ncg API version
+            # ncg.status.[configUid] = latest status
+            NcgRedis.redis.set(f'ncg.declaration.{configUid}', pickle.dumps(declaration))
+            NcgRedis.redis.set(f'ncg.declarationrendered.{configUid}', json.dumps(d))
+            NcgRedis.redis.set(f'ncg.apiversion.{configUid}', apiversion)
 
             # If deploying a new configuration in GitOps mode start autosync
             if nmsSynctime == 0:
@@ -350,26 +305,146 @@ def NIMOutput(d, declaration: ConfigDeclaration, apiversion: str, b64HttpConf: s
                 # GitOps autosync
                 print(f'Starting autosync for configUid {configUid} every {nmsSynctime} seconds')
 
-                job = schedule.every(nmsSynctime).seconds.do(lambda: v5_6_CreateConfig.configautosync(configUid))
+                job = schedule.every(nmsSynctime).seconds.do(lambda: V5_6_CreateConfig.configautosync(configUid))
                 # Keep track of GitOps configs, key is the threaded job
                 NcgRedis.declarationsList[configUid] = job
 
-                NcgRedis.redis.set(f'ncg.apiversion.{configUid}', apiversion)
-
-        responseContent = {'code': deploymentCheck.status_code, 'content': jsonResponse, 'configUid': configUid}
-
-        # Configuration push completed, update redis keys
-        if configUid != "":
-            NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(responseContent))
-
-            # if nmsSynctime > 0:
-            # Updates status, declaration and basestagedconfig in redis
-            NcgRedis.redis.set('ncg.declaration.' + configUid, pickle.dumps(declaration))
-            NcgRedis.redis.set('ncg.declarationrendered.' + configUid, json.dumps(d))
-            NcgRedis.redis.set('ncg.basestagedconfig.' + configUid, json.dumps(baseStagedConfig))
+        # Publishes the staged config to an instance group
+        # Returns a Future holding a tuple: status_code, reply content and True if the staged config was accepted
+        def publishToInstanceGroup(instanceGroup: str):
+            igUid = igUids[instanceGroup]
+            r = nimClient.post(f"/api/platform/v1/instance-groups/{igUid}/config",
+                               data=stagedConfigPayload,
+                               headers={'Content-Type': 'application/json'})
+
+            if r.status_code != 202:
+                # Configuration push failed
+                if r.status_code == 404:
+                    # The cached instance group UID is not valid anymore
+                    v5_6.NIMUtils.invalidateInstanceGroups(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
+                                                           nmsPassword=nmsPassword)
+
+                return v5_6.Rollout.outcome(r.status_code, r.text, False)
+
+            # Fetch the deployment status
+            publishResponse = json.loads(r.text)
+            deploymentUrl = publishResponse['links']['rel']
+
+            # The deployment is tracked in the background, the declaration status is updated once all instance
+            # groups have been published
+            storeDeclaration()
+            NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(deploymentInProgress()))
+
+            # Returns a tuple: True and the (status_code, deployment JSON) tuple if the deployment is completed,
+            # False and None if it is still pending
+            def checkDeployment():
+                deploymentCheck = nimClient.get(deploymentUrl)
+
+                if deploymentCheck.status_code == 404:
+                    return True, (404, {"message": f"deployment not found at {deploymentUrl}"})
+
+                checkJson = json.loads(deploymentCheck.text)
+
+                if 'details' in checkJson and not checkJson['details']['pending']:
+                    return True, (deploymentCheck.status_code, checkJson)
+
+                return False, None
+
+            # Completes the instance group publish once NGINX Instance Manager reports the deployment success or
+            # failure. deployment is the checkDeployment final status, None if the deployment timed out
+            def deploymentCompleted(deployment):
+                if deployment is None:
+                    statusCode, checkJson = 504, {}
+                    jsonResponse = {"message": f"deployment {deploymentUrl} still pending after "
+                                               f"{NcgConfig.config.get('controlplane', {}).get('deployment_timeout', 600)} seconds"}
+                else:
+                    statusCode, checkJson = deployment
+                    jsonResponse = checkJson if statusCode == 404 else {}
+
+                if 'details' not in checkJson or len(checkJson['details']['failure']) > 0:
+                    # Staged config publish to NIM failed
+                    jsonResponse = checkJson['details']['failure'][0] if 'details' in checkJson else jsonResponse
+                    statusCode = 422 if statusCode != 504 else statusCode
+                else:
+                    # Staged config publish to NIM succeeded
+                    jsonResponse = checkJson
+
+                    # Makes F5 WAF for NGINX policies active
+                    if v5_6.NIMNAPUtils.makePolicyActive(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
+                                                         nmsPassword=nmsPassword, activePolicyUids=activePolicyUids,
+                                                         instanceGroupUid=igUid):
+                        activePolicyGroups.append(instanceGroup)
+
+                return statusCode, jsonResponse, True
+
+            # The deployment is polled by the deployment watcher until completion
+            return v5_6.DeploymentWatcher.watch(check=checkDeployment, onDone=deploymentCompleted,
+                                                interval=NcgConfig.config['nms']['staged_config_publish_waittime'])
+
+        # Completes the publish once all instance groups have been published
+        # outcomes is the instance group to (status_code, reply content, accepted) tuple dict
+        def rolloutCompleted(outcomes: dict):
+            statusCode = v5_6.Rollout.aggregateStatus(outcomes)
+            jsonResponse = next(iter(outcomes.values()))[1] if len(outcomes) == 1 else v5_6.Rollout.groupsReply(outcomes)
+
+            if not any(outcome[2] for outcome in outcomes.values()):
+                # The staged config was not accepted by any instance group
+                return {"status_code": statusCode,
+                        "message": {"status_code": statusCode, "message": jsonResponse},
+                        "headers": {'Content-Type': 'application/json'}}
+
+            if activePolicyGroups:
+                # Clean up F5 WAF for NGINX WAF policies not used anymore
+                # and not defined in the declaration just pushed
+                time.sleep(NcgConfig.config['nms']['staged_config_publish_waittime'])
+                v5_6.NIMNAPUtils.cleanPolicyLeftovers(nmsUrl=nmsUrl, nmsUsername=nmsUsername,
+                                                      nmsPassword=nmsPassword,
+                                                      currentPolicies=provisionedNapPolicies)
 
-        return {"status_code": deploymentCheck.status_code,
-            "message": {"status_code": deploymentCheck.status_code,
-                        "message": responseContent},
-            "headers": {'Content-Type': 'application/json'}
-            }
\ No newline at end of file
+            publishStage.add(objects=len(configFiles['files']) + len(auxFiles['files']),
+                             bytes=len(stagedConfigPayload) * sum(1 for outcome in outcomes.values() if outcome[2]))
+            publishStage.stop()
+
+            responseContent = {'code': statusCode, 'content': jsonResponse, 'configUid': configUid,
+                               'changes': stagedChanges, 'pipeline': pipeline.toDict()}
+
+            if configUid not in NcgRedis.declarationsList:
+                # The declaration has been deleted while the deployment was in progress
+                print(f'Declaration [{configUid}] deleted, deployment outcome not stored')
+            else:
+                # Configuration push completed, update redis keys
+                # The staged config manifest describes the configuration deployed to all instance groups. After a
+                # failed or partial deployment the next run publishes the staged config again
+                if statusCode == 200:
+                    # Rendered configuration files are reused by PATCH requests, see V5_6_CreateConfig
+                    v5_6.StagedConfig.storeFiles(configFiles, stagedManifest, previousStagedManifest)
+                    NcgRedis.redis.set('ncg.stagedmanifest.' + configUid, json.dumps(stagedManifest))
+                    NcgRedis.redis.set('ncg.publishedgroups.' + configUid, json.dumps(nmsInstanceGroups))
+                else:
+                    NcgRedis.redis.delete('ncg.stagedmanifest.' + configUid, 'ncg.publishedgroups.' + configUid)
+
+                V5_6_CreateConfig.autosyncCompleted(configUid=configUid, fingerprint=autosyncFingerprint,
+                                                     statusCode=statusCode)
+
+                # The status is updated last: once it is not 202 anymore the deployment outcome is fully stored
+                NcgRedis.redis.set('ncg.status.' + configUid, json.dumps(responseContent))
+
+            return {"status_code": statusCode,
+                "message": {"status_code": statusCode,
+                            "message": responseContent},
+                "headers": {'Content-Type': 'application/json'}
+                }
+
+        # Instance groups are published in waves of nmsWaveSize groups, see v5_6.Rollout
+        deployment = v5_6.Rollout.rollout(groups=nmsInstanceGroups, publish=publishToInstanceGroup,
+                                          onDone=rolloutCompleted, waveSize=nmsWaveSize, key=configUid)
+
+        if deployment.done():
+            return deployment.result()
+
+        # Deployments are tracked in the background and their outcome stored as the declaration status:
+        # the configUid is returned right away
+        return {"status_code": 202,
+                "message": {"status_code": 202, "message": deploymentInProgress()},
+                "headers": {'Content-Type': 'application/json'}
+                }
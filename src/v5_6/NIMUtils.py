@@ -2,25 +2,58 @@
 NGINX Instance Manager support functions
 """
 
-import requests
 import json
 
+import v5_6.GroupIndex
+import v5_6.MiscUtils
+import v5_6.NIMClient
+
+from NcgConfig import NcgConfig
+
+
+# Returns the instance groups index key for the given NGINX Instance Manager and credentials
+def __groupIndexKey__(nmsUrl: str, nmsUsername: str, nmsPassword: str):
+    return v5_6.MiscUtils.digest({'nim': nmsUrl.rstrip('/'), 'username': nmsUsername, 'password': nmsPassword})
+
+
+# Fetch all instance groups from NGINX Instance Manager, one page at a time
+# Return is a tuple: status_code, instance group name to UID dict or error message
+def __loadInstanceGroups__(nmsUrl: str, nmsUsername: str, nmsPassword: str):
+    nimClient = v5_6.NIMClient.getClient(nmsUrl, nmsUsername, nmsPassword)
+    pageSize = NcgConfig.config.get('controlplane', {}).get('group_page_size', 100)
+
+    index = {}
+    page = 1
+    while True:
+        ig = nimClient.get(f'/api/platform/v1/instance-groups?limit={pageSize}&page={page}')
+
+        if ig.status_code != 200:
+            return ig.status_code, f"Error fetching instance groups: {ig.text}"
+
+        igJson = json.loads(ig.text)
+        items = igJson.get('items') or []
+        newItems = [i for i in items if i['name'] not in index]
+
+        for i in items:
+            index[i['name']] = i['uid']
+
+        # Last page reached. Pages with no new items are returned when pagination is not supported
+        if len(items) < pageSize or not newItems or len(index) >= igJson.get('count', len(index) + 1):
+            return 200, index
+
+        page += 1
+
 
 # Fetch an instance group UID from NGINX Instance Manager
 # Return None if not found
 def getNIMInstanceGroupUid(nmsUrl: str, nmsUsername: str, nmsPassword: str, instanceGroupName: str):
-    # Retrieve instance group uid
-    ig = requests.get(url=f'{nmsUrl}/api/platform/v1/instance-groups?limit=100', auth=(nmsUsername, nmsPassword),
-                      verify=False)
+    status_code, igUid = v5_6.GroupIndex.resolve(
+        key=__groupIndexKey__(nmsUrl, nmsUsername, nmsPassword), name=instanceGroupName,
+        loader=lambda: __loadInstanceGroups__(nmsUrl, nmsUsername, nmsPassword))
 
-    if ig.status_code != 200:
-        return None
+    return igUid if status_code == 200 else None
 
-    # Get the instance group id
-    igUid = None
-    igJson = json.loads(ig.text)
-    for i in igJson['items']:
-        if i['name'] == instanceGroupName:
-            igUid = i['uid']
 
-    return igUid
+# Discards the cached instance groups for the given NGINX Instance Manager, ie. when an instance group UID is not found
+def invalidateInstanceGroups(nmsUrl: str, nmsUsername: str, nmsPassword: str):
+    v5_6.GroupIndex.invalidate(__groupIndexKey__(nmsUrl, nmsUsername, nmsPassword))
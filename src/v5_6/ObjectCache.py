@@ -0,0 +1,134 @@
+"""
+Cache for objects fetched from the source of truth, revalidated through conditional GET requests
+Objects are cached in-process and optionally in redis, shared across API replicas
+"""
+
+import json
+import threading
+import zlib
+
+from redis.exceptions import RedisError
+
+import v5_6.MiscUtils
+from v5_6.LRUCache import LRUCache
+
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+
+# Cached objects. Key is the cache key, value is a dict with 'content', 'etag' and 'last_modified'
+__cache__ = None
+__cacheLock__ = threading.Lock()
+
+
+# Returns the fetched objects cache, None if disabled
+def getCache():
+    global __cache__
+
+    if __cache__ is None:
+        with __cacheLock__:
+            cacheSize = NcgConfig.config.get('sourceoftruth', {}).get('cache_size', 0)
+
+            if __cache__ is None and cacheSize > 0:
+                __cache__ = LRUCache(maxBytes=cacheSize)
+
+    return __cache__
+
+
+# Returns the shared redis cache tier settings, None if disabled
+def __redisSettings__():
+    settings = NcgConfig.config.get('sourceoftruth', {}).get('redis_cache', {})
+
+    if not settings.get('enabled', False) or getattr(NcgRedis, 'redis', None) is None:
+        return None
+
+    return settings
+
+
+# Returns the object cached in redis for the given key, None if not cached or the redis tier is disabled
+def __redisGet__(key: str):
+    if __redisSettings__() is None:
+        return None
+
+    try:
+        compressed = NcgRedis.redis.get(f"ncg.objectcache.{key}")
+    except RedisError:
+        return None
+
+    if compressed is None:
+        return None
+
+    try:
+        return json.loads(zlib.decompress(compressed))
+    except (zlib.error, ValueError):
+        return None
+
+
+# Stores an object in redis, compressed. Objects larger than max_object_size are not stored
+def __redisPut__(key: str, cached: dict):
+    settings = __redisSettings__()
+
+    if settings is None:
+        return
+
+    compressed = zlib.compress(json.dumps(cached).encode('utf-8'))
+
+    if len(compressed) > settings.get('max_object_size', 1048576):
+        return
+
+    try:
+        NcgRedis.redis.set(f"ncg.objectcache.{key}", compressed, ex=settings.get('ttl', 86400))
+    except RedisError:
+        pass
+
+
+# Returns the size in bytes accounted for a cached object
+def __sizeOf__(cached: dict):
+    return len(cached['content']) + len(cached['etag'] or '') + len(cached['last_modified'] or '')
+
+
+# Returns the cache key for the given URL and request headers
+# Headers carry the authentication profile: the same URL fetched with different credentials is cached separately
+def cacheKey(url: str, headers: dict):
+    return v5_6.MiscUtils.digest({'url': url, 'headers': headers})
+
+
+# Returns the cached object for the given key, None if not cached
+# The in-process cache is looked up first, then redis
+def get(key: str):
+    cache = getCache()
+    cached = cache.get(key) if cache is not None else None
+
+    if cached is None:
+        cached = __redisGet__(key)
+
+        if cached is not None and cache is not None:
+            cache.put(key, cached, size=__sizeOf__(cached))
+
+    return cached
+
+
+# Caches a fetched object. Objects without an ETag or Last-Modified validator can't be revalidated and are not cached
+def put(key: str, content: str, etag: str = None, lastModified: str = None):
+    if not etag and not lastModified:
+        return
+
+    cached = {'content': content, 'etag': etag, 'last_modified': lastModified}
+    cache = getCache()
+
+    if cache is not None:
+        cache.put(key, cached, size=__sizeOf__(cached))
+
+    __redisPut__(key, cached)
+
+
+# Returns the conditional request headers to revalidate the given cached object
+def conditionalHeaders(cached: dict):
+    headers = {}
+
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    return headers
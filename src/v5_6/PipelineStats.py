@@ -0,0 +1,66 @@
+"""
+Configuration pipeline stages statistics
+"""
+
+import time
+
+# Configuration pipeline stages, in execution order
+STAGES = ['validate', 'fetch', 'render', 'encode', 'diff', 'publish']
+
+
+class PipelineStage:
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed = 0.0
+        self.objects = 0
+        self.bytes = 0
+
+        self._startedAt = None
+
+    def start(self):
+        self._startedAt = time.perf_counter()
+
+        return self
+
+    # Stops the stage timer. Multiple start/stop cycles add up
+    def stop(self):
+        if self._startedAt is not None:
+            self.elapsed += time.perf_counter() - self._startedAt
+            self._startedAt = None
+
+    # Accounts for objects processed and bytes produced by the stage
+    def add(self, objects: int = 1, bytes: int = 0):
+        self.objects += objects
+        self.bytes += bytes
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+        return False
+
+    # Returns the stage statistics. Wall-time of a running stage is included up to now
+    def toDict(self):
+        elapsed = self.elapsed
+        if self._startedAt is not None:
+            elapsed += time.perf_counter() - self._startedAt
+
+        return {'time_ms': round(elapsed * 1000, 3), 'objects': self.objects, 'bytes': self.bytes}
+
+
+class PipelineStats:
+    def __init__(self):
+        self.stages = {name: PipelineStage(name) for name in STAGES}
+
+        self._startedAt = time.perf_counter()
+
+    # Returns the given pipeline stage, to be used as a context manager or through start() and stop()
+    def stage(self, name: str):
+        return self.stages[name]
+
+    # Returns all stages statistics and the total wall-time since the pipeline was created
+    def toDict(self):
+        return {'stages': {name: stage.toDict() for name, stage in self.stages.items()},
+                'total_ms': round((time.perf_counter() - self._startedAt) * 1000, 3)}
@@ -0,0 +1,183 @@
+"""
+Staged configuration rollout to multiple instance groups / config sync groups
+
+Groups are published in waves: all groups in a wave are published concurrently, and the next wave is started once
+all groups in the current wave succeeded. If a group fails the following waves are not published, limiting the
+blast radius of a faulty configuration
+"""
+
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from NcgConfig import NcgConfig
+
+# Status code of groups not published because a previous wave failed
+SKIPPED = 424
+
+# Rollouts in progress for each key (ie. the configUid), see isRollingOut. Notified when a rollout completes
+__rollouts__ = {}
+__rolloutsLock__ = threading.Condition()
+
+# Runs the rollout steps following a group deployment completion: next waves and onDone
+__executor__ = None
+__executorLock__ = threading.Lock()
+
+
+# Splits groups in waves of waveSize groups. All groups are in a single wave if waveSize is 0
+def waves(groups: list, waveSize: int = 0):
+    size = waveSize if waveSize and waveSize > 0 else max(len(groups), 1)
+
+    return [groups[i:i + size] for i in range(0, len(groups), size)]
+
+
+# Returns the rollout status code: 200 if all groups succeeded, 207 if some of them did, otherwise the status code
+# of the first failed group
+# outcomes is the group name to (status code, reply content, accepted) tuple dict, see rollout
+def aggregateStatus(outcomes: dict):
+    statusCodes = [outcome[0] for outcome in outcomes.values()]
+
+    if all(statusCode == 200 for statusCode in statusCodes):
+        return 200
+
+    if any(statusCode == 200 for statusCode in statusCodes):
+        return 207
+
+    return next(statusCode for statusCode in statusCodes if statusCode != SKIPPED)
+
+
+# Returns the per-group rollout reply content
+def groupsReply(outcomes: dict):
+    return {group: {'code': outcome[0], 'content': outcome[1]} for group, outcome in outcomes.items()}
+
+
+# Runs fn on the rollout executor, started if needed
+def __submit__(fn):
+    global __executor__
+
+    with __executorLock__:
+        if __executor__ is None:
+            __executor__ = ThreadPoolExecutor(
+                max_workers=NcgConfig.config.get('controlplane', {}).get('rollout_workers', 8),
+                thread_name_prefix="ncg-rollout-steps")
+
+    __executor__.submit(fn)
+
+
+# Calls publish for the given group. Returns the group outcome Future, holding the exception if publish failed
+def __publish__(publish, group: str):
+    try:
+        return publish(group)
+    except Exception as e:
+        groupFuture = Future()
+        groupFuture.set_exception(e)
+
+        return groupFuture
+
+
+# Publishes a staged configuration to the given groups, in waves of waveSize groups
+# publish is called with a group name and returns a Future holding the group outcome: a tuple with the HTTP status
+# code, the reply content and True if the staged configuration was accepted by the control plane
+# onDone is called with the group name to outcome dict, in groups order, once all waves are completed
+# The first wave is started by the calling thread. Following waves and onDone are run by the same thread if the
+# previous wave completed while being started, otherwise by the rollout executor: the threads completing group
+# deployments (ie. the deployment watcher workers) are not held by uploads, waits and cleanups
+# Starting a wave returns once the staged configuration has been uploaded to all of its groups
+# key identifies the rollout for isRollingOut until onDone returns
+# Returns a Future holding the onDone return value
+def rollout(groups: list, publish, onDone, waveSize: int = 0, key: str = ""):
+    future = Future()
+    outcomes = {}
+    allWaves = waves(groups, waveSize)
+    lock = threading.Lock()
+
+    with __rolloutsLock__:
+        __rollouts__[key] = __rollouts__.get(key, 0) + 1
+
+    # Sets the rollout result, groups not published yet are skipped
+    def completed():
+        for group in groups:
+            if group not in outcomes:
+                outcomes[group] = (SKIPPED, {"message": f"{group} not published, a previous wave failed"}, False)
+
+        try:
+            result, error = onDone({group: outcomes[group] for group in groups}), None
+        except Exception as e:
+            result, error = None, e
+
+        # The rollout is not in progress anymore once its outcome has been handled by onDone
+        with __rolloutsLock__:
+            __rollouts__[key] -= 1
+            if __rollouts__[key] == 0:
+                __rollouts__.pop(key)
+                __rolloutsLock__.notify_all()
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def startWave(index: int):
+        if index == len(allWaves):
+            completed()
+            return
+
+        wave = allWaves[index]
+        pending = [len(wave)]
+        startingThread = threading.get_ident()
+
+        def groupDone(group: str, groupFuture: Future):
+            try:
+                outcome = groupFuture.result()
+            except Exception as e:
+                outcome = (500, {"message": f"publish to {group} failed: {e}"}, False)
+
+            with lock:
+                outcomes[group] = outcome
+                pending[0] -= 1
+
+                if pending[0] > 0:
+                    return
+
+            nextStep = (lambda: startWave(index + 1)) if all(outcomes[g][0] == 200 for g in wave) else completed
+
+            if threading.get_ident() == startingThread:
+                nextStep()
+            else:
+                __submit__(nextStep)
+
+        # Staged configurations are uploaded to the wave groups concurrently
+        workers = min(len(wave), NcgConfig.config.get('controlplane', {}).get('rollout_workers', 8))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ncg-rollout") as executor:
+                groupFutures = list(executor.map(lambda group: __publish__(publish, group), wave))
+        else:
+            groupFutures = [__publish__(publish, group) for group in wave]
+
+        for group, groupFuture in zip(wave, groupFutures):
+            groupFuture.add_done_callback(lambda f, group=group: groupDone(group, f))
+
+    startWave(0)
+
+    return future
+
+
+# Returns True if a rollout for the given key is in progress
+def isRollingOut(key: str):
+    with __rolloutsLock__:
+        return key in __rollouts__
+
+
+# Waits until no rollout for the given key is in progress
+# Returns False if rollouts were still in progress after timeout seconds, waits indefinitely if timeout is None
+def waitRollout(key: str, timeout: float = None):
+    with __rolloutsLock__:
+        return __rolloutsLock__.wait_for(lambda: key not in __rollouts__, timeout=timeout)
+
+
+# Returns a Future already holding the given group outcome, for groups completed without polling the control plane
+def outcome(statusCode: int, content, accepted: bool):
+    future = Future()
+    future.set_result((statusCode, content, accepted))
+
+    return future
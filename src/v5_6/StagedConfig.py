@@ -0,0 +1,98 @@
+"""
+Staged configuration support functions
+"""
+
+import base64
+import binascii
+import hashlib
+
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+
+
+# Decodes a staged configuration file contents. Both standard and URL-safe base64 encodings are used
+# for staged files: contents that are not base64-encoded are returned as utf-8 bytes
+def decodeContents(contents: str):
+    try:
+        return base64.b64decode(contents.translate(str.maketrans('-_', '+/')), validate=True)
+    except (binascii.Error, ValueError):
+        return contents.encode('utf-8')
+
+
+# Returns the manifest entry for a staged configuration file: name, decoded size in bytes and SHA-256 hex digest
+def fileManifest(stagedFile: dict):
+    contents = decodeContents(stagedFile['contents'])
+
+    return {'name': stagedFile['name'], 'size': len(contents), 'sha256': hashlib.sha256(contents).hexdigest()}
+
+
+# Builds the manifest for the given staged configuration files
+def buildManifest(configFiles: dict, auxFiles: dict):
+    manifest = {'configFiles': [fileManifest(f) for f in configFiles['files']],
+                'auxFiles': [fileManifest(f) for f in auxFiles['files']]}
+
+    allFiles = manifest['configFiles'] + manifest['auxFiles']
+    manifest['files'] = len(allFiles)
+    manifest['bytes'] = sum(f['size'] for f in allFiles)
+
+    return manifest
+
+
+# Builds the digest manifest for the given staged configuration files: file name to SHA-256 hex digest.
+# It is stored for each declaration to detect staged configuration changes
+def digestManifest(configFiles: dict, auxFiles: dict):
+    return {m['name']: m['sha256'] for m in (fileManifest(f) for f in configFiles['files'] + auxFiles['files'])}
+
+
+# Compares two digest manifests. Returns the names of added, changed and removed files
+def diffManifests(previous: dict, current: dict):
+    return {'added': sorted(name for name in current if name not in previous),
+            'changed': sorted(name for name in current if name in previous and current[name] != previous[name]),
+            'removed': sorted(name for name in previous if name not in current)}
+
+
+# Returns a copy of the given staged configuration files holding only the files added or changed according to the
+# given manifests diff, see diffManifests
+def deltaFiles(stagedFiles: dict, changes: dict):
+    names = set(changes['added']) | set(changes['changed'])
+
+    return {**stagedFiles, 'files': [f for f in stagedFiles['files'] if f['name'] in names]}
+
+
+# Stores the contents of the given staged configuration files. Each file is stored once for identical contents in
+# ncg.stagedfile.[sha256], shared across declarations, see digestManifest
+# Files already stored for the previous manifest only get their expiration time refreshed
+def storeFiles(stagedFiles: dict, manifest: dict, previousManifest: dict):
+    ttl = NcgConfig.config.get('controlplane', {}).get('staged_files_ttl', 604800)
+    allContents = {manifest[f['name']]: f['contents'] for f in stagedFiles['files']}
+    previousDigests = set(previousManifest.values())
+    stored = [sha256 for sha256 in allContents if sha256 in previousDigests]
+
+    pipeline = NcgRedis.redis.pipeline(transaction=False)
+    for sha256 in stored:
+        pipeline.expire(f'ncg.stagedfile.{sha256}', ttl)
+    refreshed = pipeline.execute()
+
+    # New files and files expired in the meantime are stored
+    for sha256 in set(allContents) - {sha256 for sha256, found in zip(stored, refreshed) if found}:
+        pipeline.set(f'ncg.stagedfile.{sha256}', allContents[sha256], ex=ttl)
+    pipeline.execute()
+
+
+# Returns the stored contents of the files in the given manifest, keyed by file name. Files not stored or expired
+# are not returned, see storeFiles
+def loadFiles(manifest: dict):
+    names = list(manifest)
+    allContents = NcgRedis.redis.mget([f'ncg.stagedfile.{manifest[name]}' for name in names]) if names else []
+
+    return {name: contents.decode('utf-8') for name, contents in zip(names, allContents) if contents is not None}
+
+
+# Builds the reply for a dry run: the staged configuration is returned without being published
+def dryRunReply(configFiles: dict, auxFiles: dict, pipeline):
+    return {"status_code": 200,
+            "message": {"status_code": 200,
+                        "message": {"code": 200,
+                                    "content": {"dryrun": True, "manifest": buildManifest(configFiles, auxFiles)},
+                                    "pipeline": pipeline.toDict()}},
+            "headers": {'Content-Type': 'application/json'}}
@@ -0,0 +1,110 @@
+"""
+Local NGINX Instance Manager stand-in for benchmarks
+
+Implements the control plane endpoints used to publish a staged configuration and serves
+the OpenAPI schema used by API gateway locations. Staged configurations are accepted and discarded
+"""
+
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INSTANCE_GROUP_UID = "00000000-0000-0000-0000-000000000001"
+
+# OpenAPI schema served at /openapi.json
+OPENAPI_SCHEMA = {
+    "openapi": "3.0.0",
+    "info": {"title": "Benchmark API", "version": "1.0.0"},
+    "servers": [{"url": "http://127.0.0.1"}],
+    "paths": {
+        f"/{resource}{suffix}": {
+            method: {"summary": f"{method} {resource}", "operationId": f"{method}{resource.capitalize()}{i}"}
+            for i, method in enumerate(["get", "post", "put", "delete"])
+        }
+        for resource in ["users", "orders", "products", "carts", "invoices"]
+        for suffix in ["", "/{id}"]
+    }
+}
+
+
+class __Handler__(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def __reply__(self, code: int, body: dict):
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+
+        if path == '/openapi.json':
+            self.__reply__(200, OPENAPI_SCHEMA)
+        elif path == '/api/platform/v1/instance-groups':
+            self.__reply__(200, {"items": [{"name": self.server.instanceGroup, "uid": INSTANCE_GROUP_UID}],
+                                 "count": 1})
+        elif path.startswith('/api/platform/v1/instance-groups/deployments/'):
+            self.__reply__(200, {"details": {"pending": False, "failure": [], "success": []},
+                                 "id": path.rsplit('/', 1)[1], "status": "finalized"})
+        elif path == '/api/platform/v1/security/policies':
+            self.__reply__(200, {"items": []})
+        else:
+            self.__reply__(404, {"message": f"{path} not found"})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if path == f'/api/platform/v1/instance-groups/{INSTANCE_GROUP_UID}/config':
+            self.server.record(body)
+            self.__reply__(202, {"links": {"rel": f"/api/platform/v1/instance-groups/deployments/{uuid.uuid4()}"}})
+        else:
+            self.__reply__(404, {"message": f"{path} not found"})
+
+
+class ControlPlane(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, instanceGroup: str = "benchmark"):
+        super().__init__((host, port), __Handler__)
+        self.instanceGroup = instanceGroup
+        self.__lock = threading.Lock()
+        self.reset()
+
+    # Base URL of the control plane
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    # Clears the published staged configurations counters
+    def reset(self):
+        with self.__lock:
+            self.publications = 0
+            self.publishedBytes = 0
+            self.stagedFiles = 0
+            self.stagedBytes = 0
+
+    # Records a staged configuration publication
+    def record(self, body: bytes):
+        stagedConfig = json.loads(body)
+        files = stagedConfig['configFiles']['files'] + stagedConfig['auxFiles']['files']
+
+        with self.__lock:
+            self.publications += 1
+            self.publishedBytes = len(body)
+            self.stagedFiles = len(files)
+            self.stagedBytes = sum(len(f['contents']) for f in files)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
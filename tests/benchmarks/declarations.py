@@ -0,0 +1,81 @@
+"""
+Synthetic declarations generator for benchmarks
+
+Generated declarations are valid for both the v5.5 and v5.6 API
+"""
+
+# Number of HTTP upstreams shared by all generated servers
+UPSTREAMS = 10
+
+
+# Returns a synthetic JSON declaration publishing to the NGINX Instance Manager at controlPlaneUrl
+# - servers: number of HTTP servers
+# - locations: number of locations for each HTTP server
+# - apiGatewayEvery: one server out of apiGatewayEvery has an API gateway location, 0 to disable
+# The API gateway OpenAPI schema is fetched from schemaUrl
+def generateDeclaration(servers: int, locations: int = 1, apiGatewayEvery: int = 10,
+                        controlPlaneUrl: str = "http://127.0.0.1", schemaUrl: str = ""):
+    httpServers = []
+
+    for s in range(servers):
+        serverLocations = []
+
+        for l in range(locations):
+            serverLocations.append({
+                "uri": f"/app{l}",
+                "urimatch": "prefix",
+                "upstream": f"http://upstream{(s + l) % UPSTREAMS}",
+                "rate_limit": {"profile": "ratelimit"},
+                "authentication": {"client": [{"profile": "jwt"}], "server": [{"profile": "token"}]},
+                "health_check": {"enabled": True, "uri": "/health", "interval": 5, "fails": 3, "passes": 2}
+            })
+
+        if apiGatewayEvery and schemaUrl and s % apiGatewayEvery == 0:
+            serverLocations.append({
+                "uri": "/api",
+                "urimatch": "prefix",
+                "apigateway": {
+                    "openapi_schema": {"content": schemaUrl},
+                    "api_gateway": {"enabled": True, "strip_uri": True, "server_url": f"http://upstream{s % UPSTREAMS}"},
+                    "authentication": {"client": [{"profile": "jwt"}], "enforceOnPaths": True,
+                                       "paths": ["/users/{id}"]},
+                    "rate_limit": [{"profile": "ratelimit", "httpcode": 429, "enforceOnPaths": False}]
+                }
+            })
+
+        httpServers.append({
+            "name": f"server{s}",
+            "names": [f"server{s}.example.com"],
+            "resolver": "resolver",
+            "listen": {"address": "80"},
+            "log": {"access": {"destination": f"/var/log/nginx/server{s}-access.log"},
+                    "error": {"destination": f"/var/log/nginx/server{s}-error.log"}},
+            "locations": serverLocations
+        })
+
+    return {
+        "output": {
+            "type": "nms",
+            "nms": {"url": controlPlaneUrl, "username": "admin", "password": "admin",
+                    "instancegroup": "benchmark", "synctime": 0}
+        },
+        "declaration": {
+            "resolvers": [{"name": "resolver", "address": "127.0.0.1", "valid": "10s"}],
+            "http": {
+                "servers": httpServers,
+                "upstreams": [{"name": f"upstream{u}", "resolver": "resolver",
+                               "origin": [{"server": f"10.0.{u // 250}.{u % 250 + 1}:8080"},
+                                          {"server": f"10.1.{u // 250}.{u % 250 + 1}:8080"}]}
+                              for u in range(UPSTREAMS)],
+                "rate_limit": [{"name": "ratelimit", "key": "$binary_remote_addr", "size": "10m", "rate": "10r/s"}],
+                "authentication": {
+                    "client": [{"name": "jwt", "type": "jwt",
+                                "jwt": {"realm": "Benchmark",
+                                        "key": "{\"keys\": [{\"k\":\"ZmFudGFzdGljand0\",\"kty\":\"oct\",\"kid\":\"0001\"}]}",
+                                        "cachetime": 5}}],
+                    "server": [{"name": "token", "type": "token",
+                                "token": {"token": "dG9rZW4=", "type": "bearer"}}]
+                }
+            }
+        }
+    }
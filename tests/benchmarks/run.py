@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+"""
+NGINX Declarative API createconfig benchmark
+
+Publishes synthetic declarations of increasing size to a local NGINX Instance Manager stand-in and reports
+rendering throughput, peak memory and output bytes as JSON. A Redis instance is required
+
+Usage: python3 tests/benchmarks/run.py --redis localhost:6379 --output results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', '..'))
+SRC_DIR = os.path.join(REPO_ROOT, 'src')
+
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from controlplane import ControlPlane
+from declarations import generateDeclaration
+
+API_VERSIONS = ['v5.5', 'v5.6']
+SIZES = [10, 100, 1000, 10000]
+
+
+# Initializes the NGINX Declarative API singletons the same way main.py does
+# Returns a dict with the createconfig function and the declaration model for each API version
+def __initialize__(configFile: str, redisHost: str, redisPort: int):
+    # Templates and config paths are relative to src/
+    os.chdir(SRC_DIR)
+
+    import NcgConfig
+    from NcgRedis import NcgRedis
+    from NcgTemplates import NcgTemplates
+
+    cfg = NcgConfig.NcgConfig(configFile=configFile)
+    NcgRedis(host=redisHost, port=redisPort)
+    NcgTemplates(rootDir=cfg.config['templates']['root_dir'],
+                 fragmentCacheSize=cfg.config['templates'].get('fragment_cache_size', 0),
+                 renderWorkers=cfg.config['templates'].get('render_workers', 0),
+                 renderPool=cfg.config['templates'].get('render_pool', 'thread'),
+                 apiVersions=['v5.6'])
+
+    # The control plane stand-in completes deployments immediately
+    cfg.config['nms']['staged_config_publish_waittime'] = 0
+
+    import V5_5_CreateConfig
+    import V5_5_NginxConfigDeclaration
+    import V5_6_CreateConfig
+    import V5_6_NginxConfigDeclaration
+
+    return {'v5.5': (V5_5_CreateConfig, V5_5_NginxConfigDeclaration.ConfigDeclaration),
+            'v5.6': (V5_6_CreateConfig, V5_6_NginxConfigDeclaration.ConfigDeclaration)}
+
+
+# Returns the configUid of the declaration created by a benchmark run, None if it was not created
+def __configUid__(reply: dict):
+    return reply['message']['message'].get('configUid') if isinstance(reply['message']['message'], dict) else None
+
+
+# Waits for the deployment of a declaration published in the background (HTTP/202 reply) to complete
+# Returns the deployment status code
+def __waitForDeployment__(reply: dict, timeout: float = 60):
+    from NcgRedis import NcgRedis
+
+    configUid = __configUid__(reply)
+    if reply['status_code'] != 202 or not configUid:
+        return reply['status_code']
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = json.loads(NcgRedis.redis.get(f'ncg.status.{configUid}'))
+        if status['code'] != 202:
+            return status['code']
+
+        time.sleep(0.01)
+
+    return 202
+
+
+# Removes the declaration created by a benchmark run
+def __cleanup__(reply: dict):
+    from NcgRedis import NcgRedis
+
+    configUid = __configUid__(reply)
+    if configUid:
+        NcgRedis.declarationsList.pop(configUid, None)
+
+        # Staged files are shared across declarations and expire, the benchmark ones are removed right away
+        manifest = NcgRedis.redis.get(f'ncg.stagedmanifest.{configUid}')
+        if manifest:
+            NcgRedis.redis.delete(*{f'ncg.stagedfile.{sha256}' for sha256 in json.loads(manifest).values()})
+
+        NcgRedis.redis.delete(f'ncg.declaration.{configUid}', f'ncg.declarationrendered.{configUid}',
+                              f'ncg.basestagedconfig.{configUid}', f'ncg.stagedmanifest.{configUid}',
+                              f'ncg.publishedgroups.{configUid}', f'ncg.apiversion.{configUid}',
+                              f'ncg.status.{configUid}')
+
+
+# Runs createconfig for the given declaration
+# Returns a tuple: reply, wall-time in seconds, peak traced memory in bytes (0 if not traced)
+def __createconfig__(createConfig, model, declaration: dict, apiVersion: str, traceMemory: bool):
+    if traceMemory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    reply = createConfig.createconfig(declaration=model(**declaration), apiversion=apiVersion)
+    elapsed = time.perf_counter() - start
+
+    peakMemory = 0
+    if traceMemory:
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Deployments tracked in the background are completed before the declaration is removed
+    reply['deployment_status_code'] = __waitForDeployment__(reply)
+    __cleanup__(reply)
+
+    return reply, elapsed, peakMemory
+
+
+# Benchmarks createconfig for the given API version and declaration size
+def runBenchmark(modules: dict, controlPlane: ControlPlane, apiVersion: str, servers: int, locations: int,
+                 apiGatewayEvery: int, repeat: int, traceMemory: bool):
+    createConfig, model = modules[apiVersion]
+    declaration = generateDeclaration(servers=servers, locations=locations, apiGatewayEvery=apiGatewayEvery,
+                                      controlPlaneUrl=controlPlane.url,
+                                      schemaUrl=f"{controlPlane.url}/openapi.json")
+
+    # Request body validation, as done by FastAPI before createconfig is invoked
+    start = time.perf_counter()
+    model(**declaration)
+    validateTime = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        controlPlane.reset()
+        reply, elapsed, _ = __createconfig__(createConfig, model, declaration, apiVersion, traceMemory=False)
+        times.append(elapsed)
+
+    result = {
+        'api_version': apiVersion,
+        'servers': servers,
+        'locations': servers * locations,
+        'apigateway_locations': len(range(0, servers, apiGatewayEvery)) if apiGatewayEvery else 0,
+        'declaration_bytes': len(json.dumps(declaration)),
+        'status_code': reply['status_code'],
+        'deployment_status_code': reply['deployment_status_code'],
+        'validate_s': round(validateTime, 4),
+        'createconfig_s': round(min(times), 4),
+        'createconfig_runs_s': [round(t, 4) for t in times],
+        'servers_per_s': round(servers / min(times), 1),
+        'peak_memory_bytes': None,
+        'published_bytes': controlPlane.publishedBytes,
+        'staged_files': controlPlane.stagedFiles,
+        'staged_bytes': controlPlane.stagedBytes
+    }
+
+    if isinstance(reply['message']['message'], dict) and 'pipeline' in reply['message']['message']:
+        result['pipeline'] = reply['message']['message']['pipeline']
+
+    if traceMemory:
+        _, _, result['peak_memory_bytes'] = __createconfig__(createConfig, model, declaration, apiVersion,
+                                                             traceMemory=True)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NGINX Declarative API createconfig benchmark')
+    parser.add_argument('--api', default=','.join(API_VERSIONS), help='comma-separated API versions')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES), help='comma-separated server counts')
+    parser.add_argument('--locations', type=int, default=1, help='locations for each server')
+    parser.add_argument('--apigw-every', type=int, default=10,
+                        help='one server out of N has an API gateway location, 0 to disable')
+    parser.add_argument('--repeat', type=int, default=1, help='runs for each size, the fastest one is reported')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement run')
+    parser.add_argument('--redis', default='localhost:6379', help='redis host:port')
+    parser.add_argument('--config', default=os.path.join(REPO_ROOT, 'etc', 'config.yaml'), help='config file')
+    parser.add_argument('--output', default='-', help='JSON results file, - for stdout')
+    args = parser.parse_args()
+
+    # Paths are resolved before moving to src/
+    configFile = os.path.abspath(args.config)
+    outputFile = os.path.abspath(args.output) if args.output != '-' else None
+
+    redisHost, redisPort = args.redis.rsplit(':', 1)
+    with contextlib.redirect_stdout(sys.stderr):
+        modules = __initialize__(configFile=configFile, redisHost=redisHost, redisPort=int(redisPort))
+
+    from NcgConfig import NcgConfig
+
+    controlPlane = ControlPlane().start()
+    results = []
+
+    # Progress and createconfig logs go to stderr, stdout is reserved for the JSON results
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            for apiVersion in args.api.split(','):
+                for servers in [int(s) for s in args.sizes.split(',')]:
+                    print(f"Benchmarking {apiVersion} with {servers} servers")
+                    results.append(runBenchmark(modules=modules, controlPlane=controlPlane, apiVersion=apiVersion,
+                                                servers=servers, locations=args.locations,
+                                                apiGatewayEvery=args.apigw_every, repeat=args.repeat,
+                                                traceMemory=not args.no_memory))
+    finally:
+        controlPlane.stop()
+
+    report = {
+        'benchmark': 'createconfig',
+        'version': NcgConfig.config['main']['version'],
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'locations': args.locations, 'apigw_every': args.apigw_every, 'repeat': args.repeat},
+        'results': results
+    }
+
+    if outputFile is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(outputFile, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
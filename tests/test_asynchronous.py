@@ -0,0 +1,73 @@
+"""
+Tests for v5_6/Asynchronous.py
+"""
+import json
+import threading
+
+from concurrent.futures import Future
+
+import pytest
+
+from fastapi.responses import JSONResponse
+
+import V5_6_CreateConfig
+import v5_6.Asynchronous as asynchronous
+import v5_6.Rollout as rollout
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+
+
+class _Redis:
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'controlplane': {'rollout_workers': 4}})
+    monkeypatch.setattr(NcgRedis, 'redis', _Redis(), raising=False)
+
+
+@pytest.fixture
+def patches(monkeypatch):
+    # patch_config replies 409 while the declaration is being deployed, as V5_6_CreateConfig.patch_config does
+    calls = []
+
+    def patch_config(declaration, configUid, apiversion):
+        statusCode = 409 if rollout.isRollingOut(configUid) else 202
+        calls.append(statusCode)
+
+        return JSONResponse(status_code=statusCode, content={'code': statusCode, 'configUid': configUid})
+
+    monkeypatch.setattr(V5_6_CreateConfig, 'patch_config', patch_config)
+
+    return calls
+
+
+def _submission():
+    return {'declaration': None, 'method': 'PATCH', 'configUid': 'uid', 'apiVersion': 'v5.6', 'submissionUid': 'sub'}
+
+
+class TestProcessSubmission:
+    def test_idle_declaration(self, patches):
+        response = asynchronous.processSubmission(_submission())
+
+        assert response.status_code == 202
+        assert patches == [202]
+        assert json.loads(NcgRedis.redis.values['ncg.async.submission.sub'])['code'] == 202
+
+    def test_waits_for_deployment(self, patches):
+        deployment = Future()
+        rolloutFuture = rollout.rollout(['a'], publish=lambda group: deployment, onDone=rollout.aggregateStatus,
+                                        key='uid')
+
+        threading.Timer(0.3, lambda: deployment.set_result((200, {}, True))).start()
+        response = asynchronous.processSubmission(_submission())
+
+        assert rolloutFuture.result(timeout=5) == 200
+        assert response.status_code == 202
+        assert patches == [202]
+        assert json.loads(NcgRedis.redis.values['ncg.async.submission.sub'])['code'] == 202
@@ -0,0 +1,104 @@
+"""
+Tests for v5_6/CircuitBreaker.py and fail fast source of truth fetches in v5_6/GitOps.py
+"""
+import socket
+
+import pytest
+
+import v5_6.CircuitBreaker as circuitbreaker
+import v5_6.GitOps as gitops
+from NcgConfig import NcgConfig
+from NcgHttpClient import NcgHttpClient
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'sourceoftruth': {'circuit_breaker': {'failure_threshold': 2,
+                                                                                    'reset_timeout': 30}}})
+    monkeypatch.setattr(circuitbreaker, '__breakers__', {})
+    monkeypatch.setattr(NcgHttpClient, 'settings', {'sourceoftruth': {**NcgHttpClient.defaults, 'retries': 0}})
+    monkeypatch.setattr(NcgHttpClient, 'sessions', {})
+    return circuitbreaker
+
+
+@pytest.fixture
+def closedPort():
+    # A local port nothing listens on
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = circuitbreaker.CircuitBreaker(failureThreshold=2, resetTimeout=30)
+
+        breaker.recordFailure()
+        assert breaker.allow()
+        breaker.recordFailure()
+
+        assert breaker.state == circuitbreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.stats()['rejected'] == 1
+
+    def test_success_resets_failures(self):
+        breaker = circuitbreaker.CircuitBreaker(failureThreshold=2, resetTimeout=30)
+
+        breaker.recordFailure()
+        breaker.recordSuccess()
+        breaker.recordFailure()
+
+        assert breaker.state == circuitbreaker.CLOSED
+
+    def test_half_open_single_probe(self, monkeypatch):
+        breaker = circuitbreaker.CircuitBreaker(failureThreshold=1, resetTimeout=30)
+        breaker.recordFailure()
+
+        monkeypatch.setattr(breaker, 'openedAt', breaker.openedAt - 30)
+        assert breaker.allow()
+        assert breaker.state == circuitbreaker.HALF_OPEN
+        assert not breaker.allow()
+
+        breaker.recordSuccess()
+        assert breaker.state == circuitbreaker.CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_opens_again(self, monkeypatch):
+        breaker = circuitbreaker.CircuitBreaker(failureThreshold=1, resetTimeout=30)
+        breaker.recordFailure()
+
+        monkeypatch.setattr(breaker, 'openedAt', breaker.openedAt - 30)
+        assert breaker.allow()
+        breaker.recordFailure()
+
+        assert breaker.state == circuitbreaker.OPEN
+        assert breaker.retryIn() > 29
+
+    def test_disabled(self):
+        breaker = circuitbreaker.CircuitBreaker(failureThreshold=0, resetTimeout=30)
+
+        for _ in range(10):
+            breaker.recordFailure()
+
+        assert breaker.allow()
+
+
+class TestFailFastFetches:
+    def test_unreachable_host_fails_fast(self, breakers, closedPort):
+        url = f"http://127.0.0.1:{closedPort}/snippet.conf"
+
+        assert [gitops.getObjectFromRepo({'content': url, 'authentication': []})[0] for _ in range(3)] == [408, 408, 503]
+
+        status, obj = gitops.getObjectFromRepo({'content': url, 'authentication': []})
+        assert status == 503
+        assert 'circuit open' in obj['content']
+        assert breakers.stats()[f"127.0.0.1:{closedPort}"]['state'] == circuitbreaker.OPEN
+
+    def test_hosts_tracked_separately(self, breakers, closedPort):
+        for _ in range(2):
+            gitops.getObjectFromRepo({'content': f"http://127.0.0.1:{closedPort}/a.conf", 'authentication': []})
+
+        assert not breakers.isOpen('localhost')
+        assert breakers.isOpen(f"127.0.0.1:{closedPort}")
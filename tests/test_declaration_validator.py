@@ -0,0 +1,118 @@
+"""
+Tests for v5_6/DeclarationValidator.py
+
+Declarations are built through the v5.6 pydantic model so that the validator
+sees the same model_dump() structure used by createconfig.
+"""
+import pytest
+
+import v5_6.DeclarationValidator as validator
+from V5_6_NginxConfigDeclaration import ConfigDeclaration
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _declaration(**overrides):
+    declaration = {
+        'output': {'type': 'nms', 'nms': {'url': 'http://nim', 'username': 'u', 'password': 'p',
+                                          'instancegroup': 'ig'}},
+        'declaration': {
+            'resolvers': [{'name': 'r1', 'address': '1.1.1.1'}],
+            'http': {
+                'servers': [{
+                    'name': 'srv', 'names': ['app.example.com'], 'resolver': 'r1',
+                    'listen': {'address': '80'},
+                    'locations': [{'uri': '/', 'upstream': 'http://up1',
+                                   'rate_limit': {'profile': 'rl'}, 'cache': {'profile': 'c1'},
+                                   'authentication': {'client': [{'profile': 'jwt1'}],
+                                                      'server': [{'profile': 'tok'}]}}]
+                }],
+                'upstreams': [{'name': 'up1', 'resolver': 'r1', 'origin': [{'server': '10.0.0.1:80'}]}],
+                'rate_limit': [{'name': 'rl', 'key': '$binary_remote_addr', 'size': '10m', 'rate': '1r/s'}],
+                'cache': [{'name': 'c1'}],
+                'authentication': {
+                    'client': [{'name': 'jwt1', 'type': 'jwt', 'jwt': {'key': 'k'}}],
+                    'server': [{'name': 'tok', 'type': 'token', 'token': {'token': 't', 'type': 'bearer'}}]
+                }
+            },
+            'layer4': {
+                'upstreams': [{'name': 'l4u', 'origin': [{'server': '10.1.1.1:53'}]}],
+                'servers': [{'name': 'l4s', 'listen': {'address': '53'}, 'upstream': 'l4u'}]
+            }
+        }
+    }
+
+    for path, value in overrides.items():
+        node = declaration
+        keys = path.split('.')
+        for key in keys[:-1]:
+            node = node[int(key)] if isinstance(node, list) else node[key]
+        node[keys[-1]] = value
+
+    return ConfigDeclaration(**declaration).model_dump()
+
+
+# ---------------------------------------------------------------------------
+# buildSymbolTables
+# ---------------------------------------------------------------------------
+
+class TestBuildSymbolTables:
+    def test_collects_named_objects(self):
+        symbols = validator.buildSymbolTables(_declaration())
+        assert symbols['resolvers'] == {'r1'}
+        assert symbols['http_upstreams'] == {'up1'}
+        assert symbols['stream_upstreams'] == {'l4u'}
+        assert symbols['rate_limits'] == {'rl'}
+        assert symbols['cache_profiles'] == {'c1'}
+        assert symbols['auth_client_profiles'] == {'jwt1'}
+        assert symbols['auth_server_profiles'] == {'tok'}
+
+    def test_empty_declaration(self):
+        symbols = validator.buildSymbolTables({'declaration': {}})
+        assert all(len(names) == 0 for names in symbols.values())
+
+
+# ---------------------------------------------------------------------------
+# validateReferences
+# ---------------------------------------------------------------------------
+
+class TestValidateReferences:
+    def test_valid_declaration(self):
+        assert validator.validateReferences(_declaration()) == []
+
+    def test_invalid_server_resolver(self):
+        errors = validator.validateReferences(_declaration(**{'declaration.http.servers.0.resolver': 'missing'}))
+        assert len(errors) == 1
+        assert '[missing]' in errors[0]
+        assert "['r1']" in errors[0]
+
+    def test_invalid_location_upstream(self):
+        errors = validator.validateReferences(
+            _declaration(**{'declaration.http.servers.0.locations.0.upstream': 'http://nowhere'}))
+        assert errors == ['invalid HTTP upstream [http://nowhere]']
+
+    def test_invalid_layer4_upstream(self):
+        errors = validator.validateReferences(_declaration(**{'declaration.layer4.servers.0.upstream': 'zz'}))
+        assert errors == ['invalid Layer4 upstream zz']
+
+    def test_invalid_tls_certificate(self):
+        errors = validator.validateReferences(
+            _declaration(**{'declaration.http.servers.0.listen': {'address': '443',
+                                                                  'tls': {'certificate': 'cert', 'key': 'key'}}}))
+        assert len(errors) == 2
+        assert errors[0].startswith('invalid TLS certificate [cert]')
+        assert errors[1].startswith('invalid TLS key [key]')
+
+    def test_all_errors_reported(self):
+        errors = validator.validateReferences(_declaration(**{
+            'declaration.http.servers.0.resolver': 'missing',
+            'declaration.http.servers.0.locations.0.rate_limit': {'profile': 'bad'},
+            'declaration.http.servers.0.locations.0.cache': {'profile': 'bad'},
+            'declaration.http.upstreams.0.resolver': 'missing',
+            'declaration.layer4.servers.0.upstream': 'zz'
+        }))
+        assert len(errors) == 5
+        assert 'invalid rate_limit profile [bad]' in errors
+        assert 'invalid cache profile [bad]' in errors
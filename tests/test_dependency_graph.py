@@ -0,0 +1,105 @@
+"""
+Tests for v5_6/DependencyGraph.py
+"""
+import copy
+
+import v5_6.DependencyGraph as graph
+
+
+def _declaration():
+    return {
+        'declaration': {
+            'resolvers': [{'name': 'r1', 'address': '8.8.8.8'}],
+            'http': {
+                'snippet': {'content': ''},
+                'upstreams': [
+                    {'name': 'up0', 'resolver': 'r1', 'origin': [{'server': '10.0.0.1:80'}]},
+                    {'name': 'up1', 'origin': [{'server': '10.0.0.2:80'}]}
+                ],
+                'authentication': {
+                    'client': [{'name': 'jwt1', 'type': 'jwt'}],
+                    'server': []
+                },
+                'servers': [
+                    {'name': 'srv0', 'resolver': 'r1',
+                     'locations': [{'uri': '/', 'upstream': 'http://up0',
+                                    'authentication': {'client': [{'profile': 'jwt1'}]}}]},
+                    {'name': 'srv1', 'locations': [{'uri': '/', 'upstream': 'http://up1'}]}
+                ]
+            },
+            'layer4': {
+                'upstreams': [{'name': 'tcp0', 'origin': [{'server': '10.0.0.3:53'}]}],
+                'servers': [{'name': 'l4srv', 'upstream': 'tcp0'}]
+            }
+        }
+    }
+
+
+class TestBuildGraph:
+    def test_nodes(self):
+        nodes = graph.getNodes(_declaration())
+
+        assert ('http_server', 'srv0') in nodes
+        assert ('http_upstream', 'up1') in nodes
+        assert ('auth_client', 'jwt1') in nodes
+        assert ('stream_server', 'l4srv') in nodes
+        assert nodes[graph.HTTP_NODE] == {'snippet': {'content': ''}}
+        assert nodes[graph.LAYER4_NODE] == {}
+
+    def test_dependencies(self):
+        g = graph.buildGraph(_declaration())
+
+        assert g[('http_server', 'srv0')] == {graph.HTTP_NODE, ('resolver', 'r1'), ('http_upstream', 'up0'),
+                                              ('auth_client', 'jwt1')}
+        assert g[('http_upstream', 'up0')] == {('resolver', 'r1')}
+        assert g[('stream_server', 'l4srv')] == {graph.LAYER4_NODE, ('stream_upstream', 'tcp0')}
+
+
+class TestAffectedNodes:
+    def test_unchanged(self):
+        d = _declaration()
+        assert graph.changedNodes(graph.nodeDigests(d), graph.nodeDigests(copy.deepcopy(d))) == set()
+
+    def test_added_and_removed(self):
+        previous = _declaration()
+        current = copy.deepcopy(previous)
+        current['declaration']['http']['upstreams'].pop()
+        current['declaration']['resolvers'].append({'name': 'r2', 'address': '1.1.1.1'})
+
+        changed = graph.changedNodes(graph.nodeDigests(previous), graph.nodeDigests(current))
+        assert changed == {('http_upstream', 'up1'), ('resolver', 'r2')}
+
+    def test_upstream_change_does_not_propagate(self):
+        d = _declaration()
+        affected = graph.affectedNodes(graph.buildGraph(d), {('http_upstream', 'up0')})
+
+        assert affected == {('http_upstream', 'up0')}
+
+    def test_auth_client_change_propagates_to_servers(self):
+        d = _declaration()
+        affected = graph.affectedNodes(graph.buildGraph(d), {('auth_client', 'jwt1')})
+
+        assert affected == {('auth_client', 'jwt1'), ('http_server', 'srv0')}
+
+    def test_http_settings_change_propagates_to_all_servers(self):
+        d = _declaration()
+        affected = graph.affectedNodes(graph.buildGraph(d), {graph.HTTP_NODE})
+
+        assert affected == {graph.HTTP_NODE, ('http_server', 'srv0'), ('http_server', 'srv1')}
+
+
+class TestReuseNodes:
+    def test_unaffected_objects_are_reused(self):
+        previousDigests = graph.nodeDigests(_declaration())
+        rendered = _declaration()
+        rendered['declaration']['http']['servers'][1]['rendered'] = True
+        current = _declaration()
+        current['declaration']['http']['upstreams'][1]['origin'] = [{'server': '10.0.0.9:80'}]
+
+        affected = graph.affectedNodes(graph.buildGraph(current),
+                                       graph.changedNodes(previousDigests, graph.nodeDigests(current)))
+        reused = graph.reuseNodes(d=current, previous=rendered, affected=affected)
+
+        assert current['declaration']['http']['servers'][1]['rendered'] is True
+        assert current['declaration']['http']['upstreams'][1]['origin'] == [{'server': '10.0.0.9:80'}]
+        assert reused == len(graph.getNodes(current)) - 1
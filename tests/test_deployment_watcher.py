@@ -0,0 +1,74 @@
+"""
+Tests for v5_6/DeploymentWatcher.py
+"""
+import threading
+import time
+
+import pytest
+
+import v5_6.DeploymentWatcher as watcher
+from NcgConfig import NcgConfig
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'controlplane': {'deployment_poll_max_interval': 0.2,
+                                                               'deployment_timeout': 2, 'deployment_workers': 2}})
+
+
+def _deployment(pendingChecks: int, result='succeeded'):
+    # Returns a check function reporting the deployment as pending for the given number of checks
+    checks = []
+
+    def check():
+        checks.append(time.monotonic())
+        return (True, result) if len(checks) > pendingChecks else (False, None)
+
+    return check, checks
+
+
+class TestDeploymentWatcher:
+    def test_completed_deployment(self):
+        check, checks = _deployment(pendingChecks=3)
+
+        future = watcher.watch(check=check, onDone=lambda status: f"deployment {status}",
+                               interval=0.01)
+
+        assert future.result(timeout=5) == 'deployment succeeded'
+        assert len(checks) == 4
+
+    def test_exponential_backoff(self, monkeypatch):
+        monkeypatch.setitem(NcgConfig.config['controlplane'], 'deployment_poll_max_interval', 0.4)
+        check, checks = _deployment(pendingChecks=4)
+
+        watcher.watch(check=check, onDone=lambda status: status, interval=0.02).result(timeout=5)
+
+        intervals = [b - a for a, b in zip(checks, checks[1:])]
+        assert intervals[0] < intervals[1] < intervals[2]
+        assert intervals[-1] == pytest.approx(0.4, abs=0.1)
+
+    def test_timeout(self, monkeypatch):
+        monkeypatch.setitem(NcgConfig.config['controlplane'], 'deployment_timeout', 0.3)
+        check, _ = _deployment(pendingChecks=1000)
+
+        assert watcher.watch(check=check, onDone=lambda status: status, interval=0.01).result(timeout=5) is None
+
+    def test_check_errors_retried(self):
+        failures = []
+
+        def check():
+            if len(failures) < 2:
+                failures.append(1)
+                raise ConnectionError("control plane unreachable")
+            return True, 'succeeded'
+
+        assert watcher.watch(check=check, onDone=lambda status: status, interval=0.01).result(timeout=5) == 'succeeded'
+
+    def test_many_deployments_few_workers(self):
+        futures = []
+        for i in range(50):
+            check, _ = _deployment(pendingChecks=2, result=i)
+            futures.append(watcher.watch(check=check, onDone=lambda status: status, interval=0.01))
+
+        assert [f.result(timeout=10) for f in futures] == list(range(50))
+        assert len([t for t in threading.enumerate() if t.name.startswith('ncg-deployment')]) <= 3
@@ -0,0 +1,174 @@
+"""
+Tests for v5_6/GitRepository.py and git:// / file:// objects in v5_6/GitOps.py
+"""
+import subprocess
+
+import pytest
+
+import v5_6.GitOps as gitops
+import v5_6.GitRepository as gitrepository
+from NcgConfig import NcgConfig
+
+
+def _git(*args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+                   check=True, capture_output=True)
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    # Bare repository with a snippets/server.conf file, changes are committed in a working tree and pushed
+    monkeypatch.setattr(NcgConfig, 'config', {'sourceoftruth': {'git': {'cache_dir': str(tmp_path / 'cache')},
+                                                                'file_roots': [str(tmp_path / 'work'),
+                                                                               str(tmp_path / 'repositories')]}})
+    work = tmp_path / 'work'
+    bare = tmp_path / 'repositories' / 'origin.git'
+
+    _git('init', '-q', '-b', 'main', str(work))
+    (work / 'snippets').mkdir()
+    (work / 'snippets' / 'server.conf').write_text('listen 80;')
+    (work / 'snippets' / 'location.conf').write_text('return 200;')
+    _git('-C', str(work), 'add', '.')
+    _git('-C', str(work), 'commit', '-q', '-m', 'initial')
+    _git('clone', '-q', '--bare', str(work), str(bare))
+    _git('-C', str(work), 'remote', 'add', 'origin', str(bare))
+
+    def push(fileName, content):
+        (work / fileName).write_text(content)
+        _git('-C', str(work), 'commit', '-q', '-am', 'update')
+        _git('-C', str(work), 'push', '-q', 'origin', 'main')
+
+    yield f"git+file://{bare}", work, push
+    gitops.endFetchSession()
+
+
+def _object(content):
+    return {'content': content, 'authentication': []}
+
+
+class TestParseUrl:
+    def test_repository_path_and_ref(self):
+        assert gitrepository.parseUrl('git+https://github.com/example/config.git//snippets/a.conf?ref=v1') == \
+               ('https://github.com/example/config.git', 'v1', 'snippets/a.conf')
+        assert gitrepository.parseUrl('git://git.example.com/config.git//a.conf') == \
+               ('git://git.example.com/config.git', 'HEAD', 'a.conf')
+        assert gitrepository.parseUrl('git+file:///srv/config.git//a.conf') == ('file:///srv/config.git', 'HEAD', 'a.conf')
+
+    def test_invalid_urls(self):
+        assert gitrepository.parseUrl('https://github.com/example/config.git//a.conf') is None
+        assert gitrepository.parseUrl('git+https://github.com/example/config.git') is None
+        assert gitrepository.parseUrl('git+https://github.com/example/config.git//') is None
+
+    def test_refs(self):
+        url = 'git+https://github.com/example/config.git//a.conf?ref='
+
+        assert gitrepository.parseUrl(url + 'release/v1.2')[1] == 'release/v1.2'
+        assert gitrepository.parseUrl(url + '4f36b30faacea4f024b8e38bd6cf9f887799db7c')[1] == \
+               '4f36b30faacea4f024b8e38bd6cf9f887799db7c'
+
+    @pytest.mark.parametrize('ref', ['--upload-pack=touch /tmp/pwned', '-h', 'main..dev', 'main~1', '@{-1}', 'a b',
+                                     '4f36b30', '4f36b30faacea4f024b8e38bd6cf9f887799db7'])
+    def test_invalid_refs(self, ref):
+        assert gitrepository.parseUrl(f'git+https://github.com/example/config.git//a.conf?ref={ref}') is None
+
+    def test_refs_checked_once(self, monkeypatch):
+        calls = []
+        git = gitrepository.__git__
+        monkeypatch.setattr(gitrepository, '__git__', lambda *args, **kwargs: calls.append(args) or git(*args, **kwargs))
+        gitrepository.__validRefs__.clear()
+
+        for _ in range(3):
+            assert gitrepository.parseUrl('git+https://github.com/example/config.git//a.conf?ref=release/v2')
+        assert gitrepository.parseUrl('git+https://github.com/example/config.git') is None
+
+        assert calls == [('check-ref-format', '--allow-onelevel', 'release/v2')]
+
+
+class TestGitObjects:
+    def test_file_read_from_repository(self, repository):
+        url, _, _ = repository
+
+        status, obj = gitops.getObjectFromRepo(_object(f"{url}//snippets/server.conf?ref=main"), base64Encode=False)
+
+        assert status == 200
+        assert obj['content'] == 'listen 80;'
+
+    def test_repository_synced_once_per_session(self, repository, monkeypatch):
+        url, _, _ = repository
+        syncs = []
+        sync = gitrepository.sync
+        monkeypatch.setattr(gitrepository, 'sync', lambda **kwargs: syncs.append(kwargs) or sync(**kwargs))
+
+        gitops.beginFetchSession()
+        gitops.getObjectFromRepo(_object(f"{url}//snippets/server.conf"))
+        gitops.getObjectFromRepo(_object(f"{url}//snippets/location.conf"))
+
+        assert len(syncs) == 1
+
+    def test_new_commits_fetched_by_next_session(self, repository):
+        url, _, push = repository
+
+        gitops.beginFetchSession()
+        gitops.getObjectFromRepo(_object(f"{url}//snippets/server.conf"))
+        push('snippets/server.conf', 'listen 8080;')
+
+        gitops.beginFetchSession()
+        status, obj = gitops.getObjectFromRepo(_object(f"{url}//snippets/server.conf"), base64Encode=False)
+
+        assert status == 200
+        assert obj['content'] == 'listen 8080;'
+
+    def test_missing_files_not_found(self, repository):
+        url, _, _ = repository
+
+        assert gitops.getObjectFromRepo(_object(f"{url}//snippets/missing.conf"))[0] == 404
+        assert gitops.getObjectFromRepo(_object(f"{url}//../../etc/passwd"))[0] == 404
+        assert gitops.getObjectFromRepo(_object(f"{url}//.git/config"))[0] == 404
+
+    def test_unreachable_repository(self, repository, tmp_path):
+        status, _ = gitops.getObjectFromRepo(_object(f"git+file://{tmp_path}/repositories/missing.git//a.conf"))
+
+        assert status == 408
+
+    def test_option_ref_not_run(self, repository, tmp_path):
+        url, _, _ = repository
+        marker = tmp_path / 'pwned'
+
+        status, _ = gitops.getObjectFromRepo(_object(f"{url}//snippets/server.conf?ref=--upload-pack=touch {marker}"))
+
+        assert status == 422
+        assert not marker.exists()
+
+    def test_option_ref_not_parsed_by_fetch(self, repository, tmp_path):
+        url, _, _ = repository
+        marker = tmp_path / 'pwned'
+        repositoryUrl, _, _ = gitrepository.parseUrl(f"{url}//snippets/server.conf")
+
+        status, _, _ = gitrepository.sync(repositoryUrl, ref=f"--upload-pack=touch {marker}")
+
+        assert status == 408
+        assert not marker.exists()
+
+    def test_repository_outside_allowed_roots(self, repository, tmp_path):
+        _, work, _ = repository
+        _git('clone', '-q', '--bare', str(work), str(tmp_path / 'other.git'))
+
+        assert gitops.getObjectFromRepo(_object(f"git+file://{tmp_path}/other.git//snippets/server.conf"))[0] == 403
+        assert gitops.getObjectFromRepo(
+            _object(f"git+file://{tmp_path}/repositories/../other.git//snippets/server.conf"))[0] == 403
+
+
+class TestFileObjects:
+    def test_file_in_allowed_root(self, repository):
+        _, work, _ = repository
+
+        status, obj = gitops.getObjectFromRepo(_object(f"file://{work}/snippets/server.conf"), base64Encode=False)
+
+        assert status == 200
+        assert obj['content'] == 'listen 80;'
+
+    def test_file_outside_allowed_roots(self, repository):
+        _, work, _ = repository
+
+        assert gitops.getObjectFromRepo(_object(f"file://{work}/../origin.git/config"))[0] == 403
+        assert gitops.getObjectFromRepo(_object("file:///etc/passwd"))[0] == 403
@@ -0,0 +1,288 @@
+"""
+Tests for remote objects prefetching and fetch sessions in v5_6/GitOps.py
+"""
+import contextvars
+import os
+import pickle
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import V5_6_CreateConfig
+import v5_6.GitOps as gitops
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
+
+
+@pytest.fixture(autouse=True)
+def noObjectCache(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {})
+    yield
+    gitops.endFetchSession()
+
+
+@pytest.fixture
+def repository():
+    # Serves the request path as content after a short delay, counting requests
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            requests.append((self.path, self.headers.get('Authorization')))
+            time.sleep(0.05)
+
+            body = self.path.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    # A templates set for API v5.6, returns the template file
+    os.makedirs(tmp_path / 'v5.6')
+    template = tmp_path / 'v5.6' / 'server.tmpl'
+    template.write_text('server {}')
+
+    monkeypatch.setattr(NcgTemplates, 'rootDir', str(tmp_path))
+    monkeypatch.setattr(NcgTemplates, 'environments', {})
+    monkeypatch.setattr(NcgTemplates, '_ncgConfigDigest', None)
+
+    return template
+
+
+class _Redis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value.encode('utf-8') if isinstance(value, str) else value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class _Declaration:
+    # Stands for the pickled ConfigDeclaration model
+    def __init__(self, d):
+        self.d = d
+
+    def model_dump(self):
+        return self.d
+
+
+def _object(content, profile=None):
+    return {'content': content, 'authentication': [{'profile': profile}] if profile else []}
+
+
+def _declaration(url):
+    return {
+        'declaration': {
+            'certificates': [{'name': 'cert', 'contents': _object(f"{url}/cert.pem")}],
+            'http': {
+                'snippet': _object(''),
+                'authentication': {'server': [{'name': 'repo', 'type': 'token',
+                                               'token': {'token': 'secret', 'type': 'bearer'}}]},
+                'servers': [
+                    {'snippet': _object(f"{url}/server0.conf", 'repo'),
+                     'locations': [{'snippet': _object(f"{url}/location.conf"), 'apigateway': {}},
+                                   {'snippet': {}, 'apigateway': {
+                                       'openapi_schema': _object(f"{url}/openapi.json"),
+                                       'api_gateway': {'enabled': True}, 'developer_portal': {}}}]},
+                    {'snippet': _object('inline'),
+                     'locations': [{'snippet': _object(f"{url}/location.conf"), 'apigateway': {}}]}
+                ]
+            },
+            'layer4': {'servers': [{'snippet': _object(f"{url}/stream.conf")}], 'upstreams': []}
+        }
+    }
+
+
+class TestRemoteObjects:
+    def test_only_remote_objects_returned(self, repository):
+        url, _ = repository
+        contents = [o['content'] for o in gitops.remoteObjects(_declaration(url))]
+
+        assert sorted(contents) == sorted([f"{url}/server0.conf", f"{url}/location.conf", f"{url}/openapi.json",
+                                           f"{url}/location.conf", f"{url}/stream.conf", f"{url}/cert.pem"])
+
+
+class TestPrefetchObjects:
+    def test_objects_fetched_concurrently_once(self, repository):
+        url, requests = repository
+        d = _declaration(url)
+
+        start = time.perf_counter()
+        assert gitops.prefetchObjects(d, workers=8) == 5
+        assert time.perf_counter() - start < 0.05 * 5
+
+        assert len(requests) == 5
+        assert (f"/server0.conf", 'Bearer secret') in requests
+
+    def test_prefetched_objects_used(self, repository):
+        url, requests = repository
+        d = _declaration(url)
+        gitops.prefetchObjects(d, workers=4)
+
+        status, snippet = gitops.getObjectFromRepo(d['declaration']['http']['servers'][0]['snippet'],
+                                                   authProfiles=d['declaration']['http']['authentication'],
+                                                   base64Encode=False)
+        assert status == 200
+        assert snippet['content'] == '/server0.conf'
+        assert len(requests) == 5
+
+    def test_cleared_objects_fetched_again(self, repository):
+        url, requests = repository
+        d = _declaration(url)
+        gitops.prefetchObjects(d, workers=4)
+        gitops.endFetchSession()
+
+        gitops.getObjectFromRepo(d['declaration']['layer4']['servers'][0]['snippet'])
+        assert len(requests) == 6
+
+
+class TestFetchSession:
+    def test_concurrent_fetches_share_one_request(self, repository):
+        url, requests = repository
+        gitops.beginFetchSession()
+
+        replies = []
+        threads = [threading.Thread(target=contextvars.copy_context().run,
+                                    args=(lambda: replies.append(gitops.getObjectFromRepo(
+                                        _object(f"{url}/openapi.json"), base64Encode=False)),))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert [r[1]['content'] for r in replies] == ['/openapi.json'] * 4
+        assert len(requests) == 1
+
+    def test_different_authentication_fetched_separately(self, repository):
+        url, requests = repository
+        authProfiles = {'server': [{'name': 'repo', 'type': 'token', 'token': {'token': 'secret', 'type': 'bearer'}}]}
+        gitops.beginFetchSession()
+
+        gitops.getObjectFromRepo(_object(f"{url}/cert.pem"), authProfiles=authProfiles)
+        gitops.getObjectFromRepo(_object(f"{url}/cert.pem", 'repo'), authProfiles=authProfiles)
+        gitops.getObjectFromRepo(_object(f"{url}/cert.pem", 'repo'), authProfiles=authProfiles)
+
+        assert requests == [('/cert.pem', None), ('/cert.pem', 'Bearer secret')]
+
+    def test_no_session_always_fetches(self, repository):
+        url, requests = repository
+
+        gitops.getObjectFromRepo(_object(f"{url}/cert.pem"))
+        gitops.getObjectFromRepo(_object(f"{url}/cert.pem"))
+
+        assert len(requests) == 2
+
+
+@pytest.mark.usefixtures('templates')
+class TestSourcesFingerprint:
+    def test_unchanged_sources_same_fingerprint(self, repository):
+        url, _ = repository
+
+        gitops.beginFetchSession()
+        first = gitops.sourcesFingerprint(_declaration(url), workers=4, apiVersion='v5.6')
+        gitops.beginFetchSession()
+
+        assert gitops.sourcesFingerprint(_declaration(url), workers=4, apiVersion='v5.6') == first
+
+    def test_changed_declaration_changes_fingerprint(self, repository):
+        url, _ = repository
+        d = _declaration(url)
+
+        gitops.beginFetchSession()
+        first = gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6')
+        d['declaration']['http']['servers'][1]['snippet']['content'] = 'changed'
+        gitops.beginFetchSession()
+
+        assert gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6') != first
+
+    def test_changed_object_changes_fingerprint(self, repository, monkeypatch):
+        url, _ = repository
+        d = _declaration(url)
+
+        gitops.beginFetchSession()
+        first = gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6')
+
+        fetch = gitops.__fetch__
+        monkeypatch.setattr(gitops, '__fetch__', lambda url, headers={}, cacheKey=None:
+                            (200, 'changed') if url.endswith('/cert.pem') else fetch(url, headers, cacheKey))
+        gitops.beginFetchSession()
+
+        assert gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6') != first
+
+    def test_fetched_objects_reused_in_session(self, repository):
+        url, requests = repository
+        d = _declaration(url)
+
+        gitops.beginFetchSession()
+        gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6')
+        gitops.getObjectFromRepo(d['declaration']['certificates'][0]['contents'])
+
+        assert len(requests) == 5
+
+    def test_changed_template_changes_fingerprint(self, repository, templates):
+        url, _ = repository
+        d = _declaration(url)
+
+        gitops.beginFetchSession()
+        first = gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6')
+        os.utime(templates, ns=(0, templates.stat().st_mtime_ns + 1_000_000_000))
+        gitops.beginFetchSession()
+
+        assert gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6') != first
+
+    def test_changed_config_changes_fingerprint(self, repository, monkeypatch):
+        url, _ = repository
+        d = _declaration(url)
+
+        gitops.beginFetchSession()
+        first = gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6')
+        monkeypatch.setattr(NcgConfig, 'config', {'nms': {'staged_config_publish_waittime': 1}})
+        monkeypatch.setattr(NcgTemplates, '_ncgConfigDigest', None)
+        gitops.beginFetchSession()
+
+        assert gitops.sourcesFingerprint(d, workers=4, apiVersion='v5.6') != first
+
+
+class TestConfigAutosync:
+    def test_changed_template_rendered_again(self, repository, templates, monkeypatch):
+        url, _ = repository
+        monkeypatch.setattr(NcgRedis, 'redis', _Redis(), raising=False)
+        NcgRedis.redis.set('ncg.declaration.uid', pickle.dumps(_Declaration(_declaration(url))))
+        NcgRedis.redis.set('ncg.apiversion.uid', 'v5.6')
+
+        renders = []
+        monkeypatch.setattr(V5_6_CreateConfig, '__createconfig__',
+                            lambda **kwargs: renders.append(kwargs['autosyncFingerprint']) or {'status_code': 200})
+
+        V5_6_CreateConfig.configautosync('uid')
+        V5_6_CreateConfig.configautosync('uid')
+        assert len(renders) == 1
+
+        os.utime(templates, ns=(0, templates.stat().st_mtime_ns + 1_000_000_000))
+        V5_6_CreateConfig.configautosync('uid')
+
+        assert len(renders) == 2
+        assert renders[1] != renders[0]
+        assert NcgRedis.redis.get('ncg.autosyncfingerprint.uid') == renders[1].encode('utf-8')
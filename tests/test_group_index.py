@@ -0,0 +1,149 @@
+"""
+Tests for v5_6/GroupIndex.py and instance group / config sync group resolution
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import v5_6.GroupIndex as groupindex
+import v5_6.NGINXOneClient
+import v5_6.NGINXOneUtils
+import v5_6.NIMClient
+import v5_6.NIMUtils
+from NcgConfig import NcgConfig
+from NcgHttpClient import NcgHttpClient
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'controlplane': {'group_cache_ttl': 300, 'group_page_size': 100}})
+    monkeypatch.setattr(groupindex, '__indexes__', {})
+    monkeypatch.setattr(v5_6.NIMClient, '__clients__', {})
+    monkeypatch.setattr(v5_6.NGINXOneClient, '__clients__', {})
+    monkeypatch.setattr(NcgHttpClient, 'settings', {})
+    return groupindex
+
+
+@pytest.fixture
+def controlPlane():
+    # 250 NIM instance groups, paginated with limit and page. 3 NGINX One config sync groups
+    state = {'groups': [{'name': f'ig{i}', 'uid': f'uid{i}'} for i in range(250)], 'paginated': True,
+             'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: int(v[0]) for k, v in parse_qs(url.query).items() if v[0].isdigit()}
+            state['requests'].append(self.path)
+
+            if url.path == '/api/platform/v1/instance-groups':
+                limit, page = query.get('limit', 100), query.get('page', 1) if state['paginated'] else 1
+                body = {'items': state['groups'][(page - 1) * limit:page * limit], 'count': len(state['groups'])}
+            else:
+                body = {'items': [{'name': f'csg{i}', 'object_id': f'csg_{i}'} for i in range(3)]}
+
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestGroupIndex:
+    def test_index_cached(self, cache):
+        loads = []
+        loader = lambda: loads.append(1) or (200, {'a': 'uid-a', 'b': 'uid-b'})
+
+        assert cache.resolve('cp', 'a', loader) == (200, 'uid-a')
+        assert cache.resolve('cp', 'b', loader) == (200, 'uid-b')
+        assert len(loads) == 1
+
+    def test_unknown_name_reloads(self, cache):
+        index = {'a': 'uid-a'}
+        loads = []
+        loader = lambda: loads.append(1) or (200, dict(index))
+
+        cache.resolve('cp', 'a', loader)
+        index['new'] = 'uid-new'
+
+        assert cache.resolve('cp', 'new', loader) == (200, 'uid-new')
+        assert cache.resolve('cp', 'missing', loader) == (200, None)
+        assert len(loads) == 3
+
+    def test_expired_index_reloaded(self, cache, monkeypatch):
+        loads = []
+        loader = lambda: loads.append(1) or (200, {'a': 'uid-a'})
+
+        cache.resolve('cp', 'a', loader)
+        cache.__indexes__['cp']['expires'] = 0
+        cache.resolve('cp', 'a', loader)
+
+        assert len(loads) == 2
+
+    def test_errors_not_cached(self, cache):
+        assert cache.resolve('cp', 'a', lambda: (401, 'authentication failed')) == (401, 'authentication failed')
+        assert cache.__indexes__ == {}
+
+    def test_disabled(self, cache, monkeypatch):
+        monkeypatch.setattr(NcgConfig, 'config', {})
+        loads = []
+        loader = lambda: loads.append(1) or (200, {'a': 'uid-a'})
+
+        cache.resolve('cp', 'a', loader)
+        cache.resolve('cp', 'a', loader)
+        assert len(loads) == 2
+
+
+class TestInstanceGroups:
+    def test_groups_past_first_page_found(self, controlPlane):
+        url, state = controlPlane
+
+        assert v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig249') == 'uid249'
+        assert len(state['requests']) == 3
+
+        assert v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig10') == 'uid10'
+        assert len(state['requests']) == 3
+
+    def test_unpaginated_api(self, controlPlane):
+        url, state = controlPlane
+        state['paginated'] = False
+
+        assert v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig99') == 'uid99'
+        assert v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig100') is None
+        assert len(state['requests']) == 4
+
+    def test_invalidate(self, controlPlane):
+        url, state = controlPlane
+
+        v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig1')
+        v5_6.NIMUtils.invalidateInstanceGroups(url, 'admin', 'secret')
+        v5_6.NIMUtils.getNIMInstanceGroupUid(url, 'admin', 'secret', 'ig1')
+
+        assert len(state['requests']) == 6
+
+
+class TestConfigSyncGroups:
+    def test_config_sync_groups_cached(self, controlPlane):
+        url, state = controlPlane
+
+        assert v5_6.NGINXOneUtils.getConfigSyncGroupId(url, 'token', 'default', 'csg1') == (200, 'csg_1')
+        assert v5_6.NGINXOneUtils.getConfigSyncGroupId(url, 'token', 'default', 'csg2') == (200, 'csg_2')
+        assert len(state['requests']) == 1
+
+    def test_config_sync_group_not_found(self, controlPlane):
+        url, _ = controlPlane
+
+        assert v5_6.NGINXOneUtils.getConfigSyncGroupId(url, 'token', 'default', 'missing') == \
+               (404, 'config sync group [missing] not found')
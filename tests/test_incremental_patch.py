@@ -0,0 +1,243 @@
+"""
+Tests for incremental PATCH rendering in V5_6_CreateConfig.py: re-rendering only the objects affected by a PATCH
+must stage the same configuration as rendering the patched declaration from scratch
+"""
+import copy
+import json
+import os
+
+import pytest
+import yaml
+
+import V5_6_CreateConfig
+import v5_6.MiscUtils
+import v5_6.NIMClient
+import v5_6.NIMNAPUtils
+import v5_6.NIMUtils
+import v5_6.Rollout
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+from NcgTemplates import NcgTemplates
+from V5_6_NginxConfigDeclaration import ConfigDeclaration
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+class _Redis(dict):
+    def get(self, key):
+        return dict.get(self, key)
+
+    def mget(self, keys):
+        return [dict.get(self, key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self[key] = value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def expire(self, key, ttl):
+        return key in self
+
+    def delete(self, *keys):
+        for key in keys:
+            self.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, redis: _Redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+
+        return results
+
+
+class _Reply:
+    def __init__(self, statusCode: int, body: dict):
+        self.status_code = statusCode
+        self.text = json.dumps(body)
+        self.body = self.text.encode('utf-8')
+
+
+class _NIMClient:
+    # Records the staged configurations published to NGINX Instance Manager, deployments complete right away
+    def __init__(self):
+        self.published = []
+
+    def post(self, path, data=None, headers=None):
+        self.published.append(json.loads(data))
+
+        return _Reply(202, {'links': {'rel': '/api/platform/v1/instance-groups/deployments/1'}})
+
+    def get(self, path):
+        return _Reply(200, {'details': {'pending': False, 'failure': []}})
+
+
+@pytest.fixture(autouse=True)
+def nim(monkeypatch):
+    with open(os.path.join(REPO_ROOT, 'etc', 'config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['nms']['staged_config_publish_waittime'] = 0
+    config['templates']['root_dir'] = os.path.join(REPO_ROOT, 'templates')
+
+    monkeypatch.setattr(NcgConfig, 'config', config)
+    monkeypatch.setattr(NcgTemplates, 'rootDir', config['templates']['root_dir'])
+    monkeypatch.setattr(NcgTemplates, 'environments', {})
+    monkeypatch.setattr(NcgTemplates, 'fragmentCache', None)
+    monkeypatch.setattr(NcgTemplates, 'renderExecutor', None)
+    monkeypatch.setattr(NcgRedis, 'redis', _Redis(), raising=False)
+    monkeypatch.setattr(NcgRedis, 'declarationsList', {})
+
+    client = _NIMClient()
+    monkeypatch.setattr(v5_6.NIMClient, 'getClient', lambda *args, **kwargs: client)
+    monkeypatch.setattr(v5_6.NIMUtils, 'getNIMInstanceGroupUid', lambda **kwargs: 'ig-uid')
+    monkeypatch.setattr(v5_6.NIMNAPUtils, 'provisionPolicies', lambda **kwargs: _Reply(
+        200, {'all_policy_names_and_versions': [], 'all_policy_active_names_and_uids': {}}))
+    monkeypatch.setattr(v5_6.NIMNAPUtils, 'makePolicyActive', lambda **kwargs: False)
+    monkeypatch.setattr(v5_6.MiscUtils, 'resolveFQDN', lambda fqdn: (True, ''))
+
+    return client
+
+
+def _declaration():
+    servers = [{'name': f"srv{i}", 'names': [f"s{i}.example.com"], 'resolver': 'r1', 'listen': {'address': '80'},
+                # Explicit empty objects, validated to their model defaults
+                'log': {}, 'headers': {},
+                'locations': [{'uri': '/', 'upstream': f"http://up{i % 2}", 'health_check': {}, 'headers': {}}]}
+               for i in range(3)]
+
+    return {
+        'output': {'type': 'nms', 'nms': {'url': 'http://nim.example.com', 'username': 'admin', 'password': 'nim',
+                                          'instancegroup': 'ig', 'synctime': 0}},
+        'declaration': {
+            'resolvers': [{'name': 'r1', 'address': '1.1.1.1'}],
+            'http': {'servers': servers,
+                     'upstreams': [{'name': f"up{i}", 'resolver': 'r1', 'origin': [{'server': f"10.0.0.{i}:80"}]}
+                                   for i in range(2)]},
+            'layer4': {'upstreams': [{'name': 'l4u', 'origin': [{'server': '10.1.1.1:53'}]}],
+                       'servers': [{'name': 'l4s', 'listen': {'address': '53'}, 'upstream': 'l4u'}]}
+        }
+    }
+
+
+def _create(d: dict):
+    # Publishes a new declaration and waits for its deployment, returns its configUid
+    reply = V5_6_CreateConfig.createconfig(declaration=ConfigDeclaration.model_validate(d), apiversion='v5.6')
+    assert reply['status_code'] == 202
+
+    configUid = reply['message']['message']['configUid']
+    assert v5_6.Rollout.waitRollout(configUid, timeout=10)
+
+    return configUid
+
+
+def _patch(d: dict, configUid: str):
+    response = V5_6_CreateConfig.patch_config(declaration=ConfigDeclaration.model_validate(d), configUid=configUid,
+                                              apiversion='v5.6')
+    assert response.status_code == 202
+    assert v5_6.Rollout.waitRollout(configUid, timeout=10)
+
+    return json.loads(response.body)
+
+
+def _staged(nim: _NIMClient):
+    stagedConfig = nim.published[-1]
+
+    return {f['name']: f['contents'] for f in stagedConfig['configFiles']['files']}, stagedConfig['auxFiles']
+
+
+def _upstreamPatch(d: dict):
+    patch = {'output': d['output'], 'declaration': {'http': {'upstreams': [
+        {'name': 'up1', 'resolver': 'r1', 'origin': [{'server': '10.9.9.9:80'}]}]}}}
+    d['declaration']['http']['upstreams'][1] = copy.deepcopy(patch['declaration']['http']['upstreams'][0])
+
+    return patch
+
+
+def _serverPatch(d: dict):
+    server = copy.deepcopy(d['declaration']['http']['servers'][1])
+    server['names'] = ['patched.example.com']
+    server['locations'][0]['uri'] = '/patched'
+    d['declaration']['http']['servers'][1] = copy.deepcopy(server)
+
+    return {'output': d['output'], 'declaration': {'http': {'servers': [server]}}}
+
+
+def _newUpstreamPatch(d: dict):
+    upstream = {'name': 'up9', 'resolver': 'r1', 'origin': [{'server': '10.9.9.9:80'}]}
+    server = copy.deepcopy(d['declaration']['http']['servers'][2])
+    server['locations'][0]['upstream'] = 'http://up9'
+    d['declaration']['http']['upstreams'].append(copy.deepcopy(upstream))
+    d['declaration']['http']['servers'][2] = copy.deepcopy(server)
+
+    return {'output': d['output'], 'declaration': {'http': {'upstreams': [upstream], 'servers': [server]}}}
+
+
+class TestIncrementalPatch:
+    @pytest.mark.parametrize('makePatch', [_upstreamPatch, _serverPatch, _newUpstreamPatch])
+    def test_same_as_full_render(self, nim, makePatch, monkeypatch):
+        d = _declaration()
+        configUid = _create(d)
+        patch = makePatch(d)
+
+        # The PATCH is applied twice to the same stored state: re-rendering only the affected objects, then all
+        snapshot = dict(NcgRedis.redis)
+        reply = _patch(patch, configUid)
+        incrementalFiles, incrementalAux = _staged(nim)
+
+        NcgRedis.redis.clear()
+        NcgRedis.redis.update(snapshot)
+        monkeypatch.setattr(V5_6_CreateConfig, '__incrementalState__', lambda **kwargs: None)
+        _patch(patch, configUid)
+        fullFiles, fullAux = _staged(nim)
+
+        assert reply['details']['message']['message']['pipeline']['stages']['render']['objects'] > 0
+        assert incrementalFiles == fullFiles
+        assert incrementalAux == fullAux
+
+        # The patched declaration published from scratch, validated without removing empty objects
+        _create(d)
+
+        assert _staged(nim) == (fullFiles, fullAux)
+
+    def test_expired_files_rendered_again(self, nim):
+        d = _declaration()
+        configUid = _create(d)
+        patch = _upstreamPatch(d)
+
+        # Shared staged files expire, see StagedConfig.storeFiles
+        for key in [key for key in NcgRedis.redis if key.startswith('ncg.stagedfile.')][::2]:
+            NcgRedis.redis.delete(key)
+
+        _patch(patch, configUid)
+        incremental = _staged(nim)
+        _create(d)
+
+        assert incremental == _staged(nim)
+
+    def test_unaffected_objects_not_rendered(self, nim):
+        d = _declaration()
+        configUid = _create(d)
+
+        reply = _patch(_upstreamPatch(d), configUid)
+        full = V5_6_CreateConfig.createconfig(declaration=ConfigDeclaration.model_validate(d), apiversion='v5.6')
+        v5_6.Rollout.waitRollout(full['message']['message']['configUid'], timeout=10)
+
+        incrementalRender = reply['details']['message']['message']['pipeline']['stages']['render']['objects']
+        fullRender = full['message']['message']['pipeline']['stages']['render']['objects']
+        assert incrementalRender < fullRender
+
+
+class TestRemoveEmptyDicts:
+    def test_declaration_unchanged(self):
+        # Empty objects are only removed where the model default is the same empty object
+        dump = ConfigDeclaration.model_validate(_declaration()).model_dump()
+
+        assert ConfigDeclaration.model_validate(v5_6.MiscUtils.removeEmptyDicts(dump)).model_dump() == dump
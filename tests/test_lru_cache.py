@@ -0,0 +1,66 @@
+"""
+Tests for v5_6/LRUCache.py
+"""
+import pytest
+
+from v5_6.LRUCache import LRUCache
+
+
+class TestLRUCache:
+    def test_put_and_get(self):
+        cache = LRUCache(maxBytes=100)
+        cache.put('a', 'value')
+        assert cache.get('a') == 'value'
+        assert cache.currentBytes == 5
+
+    def test_missing_key_returns_none(self):
+        cache = LRUCache(maxBytes=100)
+        assert cache.get('missing') is None
+        assert cache.stats()['misses'] == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxBytes=10)
+        cache.put('a', '12345')
+        cache.put('b', '12345')
+        # 'a' becomes the most recently used entry
+        cache.get('a')
+        cache.put('c', '12345')
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert cache.currentBytes == 10
+        assert cache.stats()['evictions'] == 1
+
+    def test_oversized_value_not_cached(self):
+        cache = LRUCache(maxBytes=4)
+        cache.put('a', '12345')
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_explicit_size(self):
+        cache = LRUCache(maxBytes=10)
+        cache.put('a', {'content': 'x'}, size=8)
+        assert cache.stats()['bytes'] == 8
+
+        cache.put('b', {'content': 'y'}, size=8)
+        assert 'a' not in cache
+
+    def test_replace_updates_size(self):
+        cache = LRUCache(maxBytes=100)
+        cache.put('a', '1234567890')
+        cache.put('a', '12')
+        assert cache.currentBytes == 2
+        assert len(cache) == 1
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(maxBytes=100)
+        cache.put('a', 'x')
+        cache.put('b', 'y')
+        cache.delete('a')
+        assert 'a' not in cache
+        assert cache.currentBytes == 1
+
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.currentBytes == 0
@@ -1,16 +1,23 @@
 """
-Tests for v5_5/MiscUtils.py and v5_4/MiscUtils.py
+Tests for v5_6/MiscUtils.py, v5_5/MiscUtils.py and v5_4/MiscUtils.py
 
 Covers pure utility functions that have no external service dependencies.
 """
 import io
 import base64
+import inspect
 import json
 import uuid
 import pytest
 
+from pydantic import BaseModel, create_model
+
+from urllib.parse import urlparse
+
+import v5_6.MiscUtils as utils_v56
 import v5_5.MiscUtils as utils_v55
 import v5_4.MiscUtils as utils_v54
+import V5_6_NginxConfigDeclaration
 
 
 # ---------------------------------------------------------------------------
@@ -177,6 +184,16 @@ class TestResolveFQDN:
         ok, _ = utils_v54.resolveFQDN('this.domain.does.not.exist.invalid')
         assert ok is False
 
+    # Control plane URLs with an explicit port are resolved by host name, as done by the output modules
+    @pytest.mark.parametrize('utils', [utils_v55, utils_v56])
+    def test_url_with_explicit_port(self, utils):
+        urlCheck = urlparse('https://localhost:8443/api')
+        ok, _ = utils.resolveFQDN(urlCheck.hostname)
+        assert ok is True
+
+        ok, _ = utils.resolveFQDN(urlCheck.netloc)
+        assert ok is False
+
 
 # ---------------------------------------------------------------------------
 # isBase64  (v5_5 only)
@@ -197,3 +214,59 @@ class TestIsBase64:
 
     def test_json_string_not_base64(self):
         assert utils_v55.isBase64('{"key": "value"}') is False
+
+
+# ---------------------------------------------------------------------------
+# digest  (v5_6 only)
+# ---------------------------------------------------------------------------
+
+class TestDigest:
+    def test_key_order_does_not_matter(self):
+        assert utils_v56.digest({'a': 1, 'b': [1, 2]}) == utils_v56.digest({'b': [1, 2], 'a': 1})
+
+    def test_different_values_differ(self):
+        assert utils_v56.digest({'a': 1}) != utils_v56.digest({'a': 2})
+
+    def test_str_and_bytes_match(self):
+        assert utils_v56.digest('hello') == utils_v56.digest(b'hello')
+
+    def test_sha256_hex(self):
+        assert len(utils_v56.digest({'a': 1})) == 64
+
+
+# ---------------------------------------------------------------------------
+# removeEmptyDicts  (v5_6 only)
+# ---------------------------------------------------------------------------
+
+class TestRemoveEmptyDicts:
+    def test_nested_empty_dicts_removed(self):
+        d = {'servers': [{'name': 's1', 'listen': {'address': '80', 'tls': {}}, 'log': {'access': {}}}]}
+        assert utils_v56.removeEmptyDicts(d) == {'servers': [{'name': 's1', 'listen': {'address': '80'}, 'log': {}}]}
+
+    def test_other_empty_values_kept(self):
+        d = {'a': [], 'b': '', 'c': None, 'd': 0}
+        assert utils_v56.removeEmptyDicts(d) == d
+
+    def test_source_not_modified(self):
+        d = {'a': {'b': {}}}
+        utils_v56.removeEmptyDicts(d)
+        assert d == {'a': {'b': {}}}
+
+    @pytest.mark.filterwarnings('ignore')
+    def test_removed_fields_default_to_empty_dict(self):
+        # Removing a field dumped as {} must not change its value when the declaration is validated again:
+        # fields that can be dumped as {} default to {}
+        for name, model in inspect.getmembers(V5_6_NginxConfigDeclaration, inspect.isclass):
+            if not issubclass(model, BaseModel) or model is BaseModel:
+                continue
+
+            for field, info in model.model_fields.items():
+                try:
+                    dumped = create_model('Field', __module__=model.__module__, value=(info.annotation, None))(
+                        value={}).model_dump()['value']
+                except ValueError:
+                    continue
+
+                if dumped == {}:
+                    assert not info.is_required() and info.get_default(call_default_factory=True) == {}, \
+                        f"{name}.{field}"
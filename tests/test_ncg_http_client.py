@@ -0,0 +1,80 @@
+"""
+Tests for NcgHttpClient.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from NcgHttpClient import NcgHttpClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(NcgHttpClient, '_instance', None)
+    monkeypatch.setattr(NcgHttpClient, 'settings', {})
+    monkeypatch.setattr(NcgHttpClient, 'sessions', {})
+    return NcgHttpClient
+
+
+@pytest.fixture
+def server():
+    # Replies 503 to the first request for each path, 200 afterwards
+    requests = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            requests[self.path] = requests.get(self.path, 0) + 1
+            code = 503 if requests[self.path] == 1 else 200
+            self.send_response(code)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestNcgHttpClient:
+    def test_settings_merged_with_defaults(self, client):
+        client(clients={'sourceoftruth': {'read_timeout': 10, 'pool_maxsize': 2}})
+
+        settings = client.getSettings('sourceoftruth')
+        assert settings['read_timeout'] == 10
+        assert settings['pool_maxsize'] == 2
+        assert settings['connect_timeout'] == NcgHttpClient.defaults['connect_timeout']
+        assert client.getTimeout('sourceoftruth') == (NcgHttpClient.defaults['connect_timeout'], 10)
+
+    def test_unconfigured_client_uses_defaults(self, client):
+        assert client.getSettings('other') == NcgHttpClient.defaults
+
+    def test_session_is_shared_and_pooled(self, client):
+        client(clients={'sourceoftruth': {'pool_maxsize': 4, 'retries': 2}})
+
+        session = client.getSession('sourceoftruth')
+        assert client.getSession('sourceoftruth') is session
+
+        adapter = session.get_adapter('https://example.com')
+        assert adapter._pool_maxsize == 4
+        assert adapter._pool_block is True
+        assert adapter.max_retries.total == 2
+
+    def test_retries_on_server_errors(self, client, server):
+        url, requests = server
+        client(clients={'sourceoftruth': {'retries': 2, 'backoff_factor': 0}})
+
+        reply = client.get('sourceoftruth', url=f"{url}/object")
+        assert reply.status_code == 200
+        assert requests['/object'] == 2
+
+    def test_last_reply_returned_when_retries_exhausted(self, client, server):
+        url, requests = server
+        client(clients={'sourceoftruth': {'retries': 0}})
+
+        assert client.get('sourceoftruth', url=f"{url}/object").status_code == 503
@@ -0,0 +1,159 @@
+"""
+Tests for NcgTemplates.py
+"""
+import base64
+import os
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from NcgConfig import NcgConfig
+from NcgTemplates import NcgTemplates
+from v5_6.LRUCache import LRUCache
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), '..', 'templates')
+
+
+@pytest.fixture(autouse=True)
+def templates(tmp_path, monkeypatch):
+    # A templates set for API v5.6, returns its directory
+    os.makedirs(tmp_path / 'v5.6')
+    (tmp_path / 'v5.6' / 'server.tmpl').write_text('server {{ name }} {{ ncgconfig.main.banner }}')
+
+    monkeypatch.setattr(NcgConfig, 'config', {'main': {'banner': 'ncg'}})
+    monkeypatch.setattr(NcgTemplates, 'rootDir', str(tmp_path))
+    monkeypatch.setattr(NcgTemplates, 'environments', {})
+    monkeypatch.setattr(NcgTemplates, 'fragmentCache', None)
+    monkeypatch.setattr(NcgTemplates, '_ncgConfigDigest', None)
+    monkeypatch.setattr(NcgTemplates, 'renderExecutor', None)
+    monkeypatch.setattr(NcgTemplates, 'renderWorkers', 0)
+
+    return tmp_path / 'v5.6'
+
+
+@pytest.fixture
+def fragmentCache(monkeypatch):
+    cache = LRUCache(maxBytes=1024)
+    monkeypatch.setattr(NcgTemplates, 'fragmentCache', cache)
+
+    return cache
+
+
+def _decode(b64Rendered):
+    return base64.b64decode(b64Rendered).decode('utf-8')
+
+
+def _renderAll(count: int):
+    # Queues count renders and renders them, returns the staged files
+    files = {'files': []}
+    renderQueue = []
+
+    for i in range(count):
+        NcgTemplates.queueRender(renderQueue, files, f"server-{i}.conf", 'v5.6', 'server.tmpl',
+                                 sharedContext={'shared': 'x' * 1000}, sharedDigest='shared', name=f"s{i}")
+
+    NcgTemplates.renderQueued(renderQueue)
+
+    return files['files']
+
+
+class TestRenderQueued:
+    def test_sequential(self):
+        stagedFiles = _renderAll(10)
+
+        assert [f['name'] for f in stagedFiles] == [f"server-{i}.conf" for i in range(10)]
+        assert [_decode(f['contents']) for f in stagedFiles] == [f"server s{i} ncg" for i in range(10)]
+
+    @pytest.mark.parametrize('executor', [ThreadPoolExecutor, ProcessPoolExecutor])
+    def test_render_pool_keeps_files_order(self, executor, templates, monkeypatch):
+        if executor is ProcessPoolExecutor:
+            pool = executor(max_workers=4, initializer=NcgTemplates._initWorker,
+                            initargs=(NcgConfig.config, str(templates.parent)))
+        else:
+            pool = executor(max_workers=4)
+
+        monkeypatch.setattr(NcgTemplates, 'renderExecutor', pool)
+        monkeypatch.setattr(NcgTemplates, 'renderWorkers', 4)
+
+        try:
+            stagedFiles = _renderAll(50)
+        finally:
+            pool.shutdown()
+
+        assert [f['name'] for f in stagedFiles] == [f"server-{i}.conf" for i in range(50)]
+        assert [_decode(f['contents']) for f in stagedFiles] == [f"server s{i} ncg" for i in range(50)]
+
+
+class TestFragmentCache:
+    def test_disabled(self):
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')
+
+        assert NcgTemplates._fragmentKey('v5.6', 'server.tmpl', {}, "", {'name': 'a'}) is None
+
+    def test_hit(self, fragmentCache):
+        first = NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')
+
+        assert NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a') == first
+        assert fragmentCache.stats()['hits'] == 1
+
+    def test_queued_renders_hit(self, fragmentCache):
+        _renderAll(3)
+        stagedFiles = _renderAll(3)
+
+        assert fragmentCache.stats()['hits'] == 3
+        assert _decode(stagedFiles[2]['contents']) == "server s2 ncg"
+
+    def test_context_change(self, fragmentCache):
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')
+
+        assert _decode(NcgTemplates.renderB64('v5.6', 'server.tmpl', name='b')) == "server b ncg"
+        assert _decode(NcgTemplates.renderB64('v5.6', 'server.tmpl', sharedContext={'shared': 1},
+                                              sharedDigest='1', name='a')) == "server a ncg"
+        assert fragmentCache.stats()['hits'] == 0
+
+    def test_template_change(self, fragmentCache, templates):
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')
+
+        template = templates / 'server.tmpl'
+        template.write_text('upstream {{ name }}')
+        os.utime(template, ns=(0, template.stat().st_mtime_ns + 1_000_000_000))
+
+        assert _decode(NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')) == "upstream a"
+        assert fragmentCache.stats()['hits'] == 0
+
+    def test_config_change(self, fragmentCache, monkeypatch):
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')
+
+        monkeypatch.setattr(NcgConfig, 'config', {'main': {'banner': 'updated'}})
+        monkeypatch.setattr(NcgTemplates, '_ncgConfigDigest', None)
+
+        assert _decode(NcgTemplates.renderB64('v5.6', 'server.tmpl', name='a')) == "server a updated"
+        assert fragmentCache.stats()['hits'] == 0
+
+    def test_evicted_by_size(self, monkeypatch):
+        cache = LRUCache(maxBytes=100)
+        monkeypatch.setattr(NcgTemplates, 'fragmentCache', cache)
+
+        for i in range(20):
+            NcgTemplates.renderB64('v5.6', 'server.tmpl', name=f"server-{i}")
+
+        assert cache.stats()['evictions'] > 0
+        assert cache.currentBytes <= 100
+
+        # The most recent render is still cached, the first one has been evicted
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='server-19')
+        NcgTemplates.renderB64('v5.6', 'server.tmpl', name='server-0')
+        assert cache.stats()['hits'] == 1
+
+
+class TestPrecompile:
+    @pytest.mark.parametrize('apiVersion', sorted(os.listdir(TEMPLATES_DIR)))
+    def test_all_templates_compiled(self, apiVersion, monkeypatch):
+        monkeypatch.setattr(NcgTemplates, 'rootDir', TEMPLATES_DIR)
+
+        templates = [name for _, _, names in os.walk(os.path.join(TEMPLATES_DIR, apiVersion))
+                     for name in names if name.endswith(('.tmpl', '.conf'))]
+
+        assert len(templates) > 0
+        assert NcgTemplates.precompile(apiVersion) == len(templates)
@@ -0,0 +1,81 @@
+"""
+Tests for v5_6/NGINXOneClient.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import v5_6.NGINXOneClient as nginxoneclient
+from NcgHttpClient import NcgHttpClient
+
+
+@pytest.fixture(autouse=True)
+def clients(monkeypatch):
+    monkeypatch.setattr(nginxoneclient, '__clients__', {})
+    monkeypatch.setattr(NcgHttpClient, 'settings', {})
+    return nginxoneclient
+
+
+@pytest.fixture
+def console():
+    # Replies 200 keeping connections alive. Counts connections and requests
+    state = {'connections': set(), 'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def __reply__(self):
+            state['connections'].add(self.client_address)
+            state['requests'].append((self.command, self.path, self.headers.get('Authorization')))
+
+            length = int(self.headers.get('Content-Length', 0))
+            if length:
+                self.rfile.read(length)
+
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        do_GET = do_PUT = do_PATCH = __reply__
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestNGINXOneClient:
+    def test_client_per_url_and_token(self):
+        client = nginxoneclient.getClient('https://one.example.com', 'token1')
+
+        assert nginxoneclient.getClient('https://one.example.com/', 'token1') is client
+        assert nginxoneclient.getClient('https://one.example.com', 'token2') is not client
+
+    def test_token_scoped_session(self, console):
+        url, state = console
+
+        nginxoneclient.getClient(url, 'token1').get('/api/nginx/one/namespaces/default/config-sync-groups')
+        nginxoneclient.getClient(url, 'token2').get('/api/nginx/one/namespaces/default/config-sync-groups')
+
+        assert [r[2] for r in state['requests']] == ['Bearer APIToken token1', 'Bearer APIToken token2']
+
+    def test_publication_polls_reuse_connection(self, console, clients):
+        url, state = console
+        client = clients.getClient(url, 'token1')
+
+        client.put('/api/nginx/one/namespaces/default/config-sync-groups/csg_1/config', data='{}')
+        for _ in range(5):
+            client.get('/api/nginx/one/namespaces/default/config-sync-groups/csg_1/publications/pub_1')
+
+        assert len(state['connections']) == 1
+
+        stats = clients.stats()
+        assert stats[0]['requests'] == 6
+        assert stats[0]['status_codes'] == {'200': 6}
+        assert 'token1' not in str(stats)
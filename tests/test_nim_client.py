@@ -0,0 +1,96 @@
+"""
+Tests for v5_6/NIMClient.py
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import v5_6.NIMClient as nimclient
+from NcgHttpClient import NcgHttpClient
+
+
+@pytest.fixture(autouse=True)
+def clients(monkeypatch):
+    monkeypatch.setattr(nimclient, '__clients__', {})
+    monkeypatch.setattr(NcgHttpClient, 'settings', {})
+    return nimclient
+
+
+@pytest.fixture
+def nim():
+    # Replies 200 with the request path, keeping connections alive. Counts connections and requests
+    state = {'connections': set(), 'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def __reply__(self):
+            state['connections'].add(self.client_address)
+            state['requests'].append((self.command, self.path, self.headers.get('Authorization')))
+
+            length = int(self.headers.get('Content-Length', 0))
+            if length:
+                self.rfile.read(length)
+
+            body = self.path.encode('utf-8')
+            self.send_response(404 if self.path.endswith('/missing') else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = __reply__
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestNIMClient:
+    def test_client_per_url_and_credentials(self):
+        client = nimclient.getClient('https://nim.example.com', 'admin', 'secret')
+
+        assert nimclient.getClient('https://nim.example.com/', 'admin', 'secret') is client
+        assert nimclient.getClient('https://nim.example.com', 'admin', 'other') is not client
+        assert nimclient.getClient('https://nim2.example.com', 'admin', 'secret') is not client
+
+    def test_connection_reused(self, nim):
+        url, state = nim
+        client = nimclient.getClient(url, 'admin', 'secret')
+
+        assert client.get('/api/platform/v1/instance-groups').text == '/api/platform/v1/instance-groups'
+        client.post('/api/platform/v1/security/policies', data='{}')
+        client.put('/api/platform/v1/security/policies/1', data='{}')
+        client.delete('/api/platform/v1/security/policies/1')
+
+        assert len(state['requests']) == 4
+        assert len(state['connections']) == 1
+        assert all(r[2].startswith('Basic ') for r in state['requests'])
+
+    def test_request_metrics(self, nim, clients):
+        url, _ = nim
+        client = clients.getClient(url, 'admin', 'secret')
+
+        client.get('/api/platform/v1/instance-groups')
+        client.get('/api/platform/v1/missing')
+
+        stats = clients.stats()
+        assert len(stats) == 1
+        assert stats[0]['requests'] == 2
+        assert stats[0]['status_codes'] == {'200': 1, '404': 1}
+        assert stats[0]['errors'] == 0
+        assert 'secret' not in str(stats)
+
+    def test_errors_counted(self, clients):
+        client = clients.getClient('http://127.0.0.1:1', 'admin', 'secret')
+        client.session.get_adapter('http://').max_retries.total = 0
+
+        with pytest.raises(Exception):
+            client.get('/api/platform/v1/instance-groups')
+
+        assert client.stats()['errors'] == 1
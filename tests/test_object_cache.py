@@ -0,0 +1,159 @@
+"""
+Tests for v5_6/ObjectCache.py and conditional fetches in v5_6/GitOps.py
+"""
+import random
+import string
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import v5_6.GitOps as gitops
+import v5_6.ObjectCache as objectcache
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'sourceoftruth': {'cache_size': 4096}})
+    monkeypatch.setattr(objectcache, '__cache__', None)
+    return objectcache
+
+
+class _Redis:
+    # Minimal in-memory redis client: stores values and their expiration
+    def __init__(self):
+        self.values = {}
+        self.expirations = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def set(self, name, value, ex=None):
+        self.values[name] = value
+        self.expirations[name] = ex
+
+
+@pytest.fixture
+def sharedCache(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'sourceoftruth': {
+        'cache_size': 4096, 'redis_cache': {'enabled': True, 'ttl': 60, 'max_object_size': 256}}})
+    monkeypatch.setattr(objectcache, '__cache__', None)
+    monkeypatch.setattr(NcgRedis, 'redis', _Redis(), raising=False)
+    return objectcache
+
+
+@pytest.fixture
+def repository():
+    # Serves an object with an ETag, replies 304 when the ETag matches
+    state = {'etag': '"v1"', 'content': 'server {}', 'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            state['requests'].append(dict(self.headers))
+
+            if self.headers.get('If-None-Match') == state['etag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            body = state['content'].encode('utf-8')
+            self.send_response(200)
+            self.send_header('ETag', state['etag'])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state['url'] = f"http://127.0.0.1:{httpd.server_address[1]}/snippet.conf"
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestObjectCache:
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.setattr(NcgConfig, 'config', {})
+        monkeypatch.setattr(objectcache, '__cache__', None)
+
+        objectcache.put('key', 'content', etag='"v1"')
+        assert objectcache.get('key') is None
+
+    def test_objects_without_validators_not_cached(self, cache):
+        cache.put('key', 'content')
+        assert cache.get('key') is None
+
+    def test_conditional_headers(self, cache):
+        cache.put('key', 'content', etag='"v1"', lastModified='Wed, 21 Oct 2015 07:28:00 GMT')
+
+        assert cache.conditionalHeaders(cache.get('key')) == {'If-None-Match': '"v1"',
+                                                             'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        assert cache.conditionalHeaders(None) == {}
+
+    def test_key_depends_on_authentication(self):
+        url = 'https://repo.example.com/cert.pem'
+
+        assert objectcache.cacheKey(url, {}) != objectcache.cacheKey(url, {'Authorization': 'Bearer t'})
+        assert objectcache.cacheKey(url, {}) == objectcache.cacheKey(url, {})
+
+
+class TestSharedObjectCache:
+    def test_objects_stored_compressed_with_ttl(self, sharedCache):
+        sharedCache.put('key', 'server {}' * 10, etag='"v1"')
+
+        assert len(NcgRedis.redis.values['ncg.objectcache.key']) < len('server {}' * 10)
+        assert NcgRedis.redis.expirations['ncg.objectcache.key'] == 60
+
+    def test_objects_shared_across_replicas(self, sharedCache):
+        sharedCache.put('key', 'content', etag='"v1"')
+
+        # Another replica starts with an empty in-process cache
+        sharedCache.__cache__ = None
+        assert sharedCache.get('key') == {'content': 'content', 'etag': '"v1"', 'last_modified': None}
+        assert sharedCache.getCache().stats()['entries'] == 1
+
+    def test_large_objects_not_stored(self, sharedCache):
+        content = ''.join(random.Random(0).choices(string.printable, k=1024))
+        sharedCache.put('key', content, etag='"v1"')
+
+        assert NcgRedis.redis.values == {}
+        assert sharedCache.get('key')['content'] == content
+
+    def test_replica_revalidates_shared_object(self, sharedCache, repository):
+        gitops.getObjectFromRepo({'content': repository['url'], 'authentication': []}, base64Encode=False)
+
+        sharedCache.__cache__ = None
+        status, obj = gitops.getObjectFromRepo({'content': repository['url'], 'authentication': []},
+                                               base64Encode=False)
+
+        assert status == 200
+        assert obj['content'] == 'server {}'
+        assert repository['requests'][1]['If-None-Match'] == '"v1"'
+
+
+class TestConditionalFetch:
+    def test_not_modified_reuses_cached_content(self, cache, repository):
+        for _ in range(2):
+            status, obj = gitops.getObjectFromRepo({'content': repository['url'], 'authentication': []},
+                                                   base64Encode=False)
+            assert status == 200
+            assert obj['content'] == 'server {}'
+
+        assert 'If-None-Match' not in repository['requests'][0]
+        assert repository['requests'][1]['If-None-Match'] == '"v1"'
+
+    def test_modified_object_is_fetched(self, cache, repository):
+        gitops.getObjectFromRepo({'content': repository['url'], 'authentication': []}, base64Encode=False)
+
+        repository['etag'], repository['content'] = '"v2"', 'server { listen 80; }'
+        status, obj = gitops.getObjectFromRepo({'content': repository['url'], 'authentication': []},
+                                               base64Encode=False)
+
+        assert status == 200
+        assert obj['content'] == 'server { listen 80; }'
+        assert cache.get(cache.cacheKey(repository['url'], {}))['etag'] == '"v2"'
@@ -0,0 +1,51 @@
+"""
+Tests for v5_6/PipelineStats.py
+"""
+import time
+
+from v5_6.PipelineStats import PipelineStats, STAGES
+
+
+class TestPipelineStats:
+    def test_all_stages_reported_in_order(self):
+        stats = PipelineStats().toDict()
+        assert list(stats['stages']) == STAGES
+        assert all(s == {'time_ms': 0.0, 'objects': 0, 'bytes': 0} for s in stats['stages'].values())
+
+    def test_context_manager_records_time_and_counters(self):
+        pipeline = PipelineStats()
+
+        with pipeline.stage('render') as stage:
+            time.sleep(0.01)
+            stage.add(objects=3, bytes=100)
+
+        render = pipeline.toDict()['stages']['render']
+        assert render['time_ms'] >= 10
+        assert render['objects'] == 3
+        assert render['bytes'] == 100
+
+    def test_stage_time_accumulates(self):
+        pipeline = PipelineStats()
+        stage = pipeline.stage('fetch')
+
+        with stage:
+            time.sleep(0.005)
+        first = stage.elapsed
+
+        with stage:
+            time.sleep(0.005)
+
+        assert stage.elapsed > first
+
+    def test_running_stage_included(self):
+        pipeline = PipelineStats()
+        pipeline.stage('publish').start()
+        time.sleep(0.005)
+
+        assert pipeline.toDict()['stages']['publish']['time_ms'] >= 5
+
+    def test_stop_without_start(self):
+        pipeline = PipelineStats()
+        pipeline.stage('diff').stop()
+
+        assert pipeline.toDict()['stages']['diff']['time_ms'] == 0.0
@@ -0,0 +1,176 @@
+"""
+Tests for v5_6/Rollout.py
+"""
+import threading
+import time
+
+from concurrent.futures import Future
+
+import pytest
+
+import v5_6.Rollout as rollout
+from NcgConfig import NcgConfig
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'controlplane': {'rollout_workers': 4}})
+
+
+def _publisher(failed=(), rejected=(), delay=0.0):
+    # Returns a publish function completing each group deployment in the background after the given delay
+    published = []
+    lock = threading.Lock()
+
+    def publish(group):
+        with lock:
+            published.append(group)
+
+        if group in rejected:
+            return rollout.outcome(400, f"{group} rejected", False)
+
+        future = Future()
+        statusCode = 422 if group in failed else 200
+        threading.Timer(delay, lambda: future.set_result((statusCode, {'group': group}, True))).start()
+
+        return future
+
+    return publish, published
+
+
+class TestWaves:
+    def test_single_wave(self):
+        assert rollout.waves(['a', 'b', 'c']) == [['a', 'b', 'c']]
+
+    def test_wave_size(self):
+        assert rollout.waves(['a', 'b', 'c', 'd', 'e'], waveSize=2) == [['a', 'b'], ['c', 'd'], ['e']]
+
+
+class TestAggregateStatus:
+    def test_all_succeeded(self):
+        assert rollout.aggregateStatus({'a': (200, {}, True), 'b': (200, {}, True)}) == 200
+
+    def test_partial(self):
+        assert rollout.aggregateStatus({'a': (200, {}, True), 'b': (422, {}, True)}) == 207
+
+    def test_all_failed(self):
+        assert rollout.aggregateStatus({'a': (504, {}, True), 'b': (rollout.SKIPPED, {}, False)}) == 504
+
+
+class TestRollout:
+    def test_single_group(self):
+        publish, published = _publisher()
+
+        outcomes = rollout.rollout(['a'], publish=publish, onDone=lambda o: o).result(timeout=5)
+
+        assert outcomes == {'a': (200, {'group': 'a'}, True)}
+
+    def test_concurrent_groups(self):
+        publish, published = _publisher(delay=0.3)
+
+        start = time.monotonic()
+        outcomes = rollout.rollout(['a', 'b', 'c', 'd'], publish=publish, onDone=lambda o: o).result(timeout=5)
+
+        assert list(outcomes) == ['a', 'b', 'c', 'd']
+        assert all(outcome[0] == 200 for outcome in outcomes.values())
+        assert time.monotonic() - start < 0.9
+
+    def test_waves(self):
+        publish, published = _publisher(delay=0.05)
+
+        outcomes = rollout.rollout(['a', 'b', 'c', 'd', 'e'], publish=publish, onDone=lambda o: o,
+                                   waveSize=2).result(timeout=5)
+
+        assert rollout.aggregateStatus(outcomes) == 200
+        assert sorted(published[:2]) == ['a', 'b'] and sorted(published[2:4]) == ['c', 'd']
+
+    def test_failed_wave_stops_rollout(self):
+        publish, published = _publisher(failed={'c'}, delay=0.05)
+
+        outcomes = rollout.rollout(['a', 'b', 'c', 'd', 'e'], publish=publish, onDone=lambda o: o,
+                                   waveSize=2).result(timeout=5)
+
+        assert sorted(published) == ['a', 'b', 'c', 'd']
+        assert outcomes['c'][0] == 422
+        assert outcomes['e'][0] == rollout.SKIPPED and outcomes['e'][2] is False
+        assert rollout.aggregateStatus(outcomes) == 207
+
+    def test_rejected_group(self):
+        publish, _ = _publisher(rejected={'a'})
+
+        future = rollout.rollout(['a'], publish=publish, onDone=lambda o: o)
+
+        assert future.done()
+        assert future.result() == {'a': (400, "a rejected", False)}
+
+    def test_publish_errors(self):
+        def publish(group):
+            raise ConnectionError("control plane unreachable")
+
+        outcomes = rollout.rollout(['a', 'b'], publish=publish, onDone=lambda o: o).result(timeout=5)
+
+        assert all(outcome[0] == 500 and outcome[2] is False for outcome in outcomes.values())
+
+    def test_on_done_result(self):
+        publish, _ = _publisher()
+
+        future = rollout.rollout(['a', 'b'], publish=publish, onDone=rollout.aggregateStatus)
+
+        assert future.result(timeout=5) == 200
+
+    def test_rolling_out_until_done(self):
+        publish, _ = _publisher(delay=0.2)
+        seen = []
+
+        future = rollout.rollout(['a', 'b'], publish=publish, key='uid',
+                                 onDone=lambda o: seen.append(rollout.isRollingOut('uid')), waveSize=1)
+
+        assert rollout.isRollingOut('uid')
+        future.result(timeout=5)
+
+        assert seen == [True]
+        assert not rollout.isRollingOut('uid')
+
+    def test_wait_rollout(self):
+        publish, _ = _publisher(delay=0.3)
+        seen = []
+
+        assert rollout.waitRollout('uid', timeout=0)
+
+        future = rollout.rollout(['a', 'b'], publish=publish, key='uid', onDone=lambda o: seen.append('done'),
+                                 waveSize=1)
+
+        assert not rollout.waitRollout('uid', timeout=0.1)
+        assert rollout.waitRollout('uid', timeout=5)
+        assert seen == ['done']
+        assert not rollout.isRollingOut('uid')
+        future.result(timeout=5)
+
+    def test_on_done_errors(self):
+        publish, _ = _publisher()
+
+        def onDone(outcomes):
+            raise ValueError("redis unavailable")
+
+        future = rollout.rollout(['a'], publish=publish, onDone=onDone, key='uid')
+
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+        assert not rollout.isRollingOut('uid')
+
+    def test_next_steps_not_run_by_completing_thread(self):
+        publish, _ = _publisher(delay=0.05)
+        threads = []
+
+        def tracingPublish(group):
+            threads.append((group, threading.current_thread().name))
+            return publish(group)
+
+        def onDone(outcomes):
+            threads.append(('done', threading.current_thread().name))
+            return outcomes
+
+        rollout.rollout(['a', 'b'], publish=tracingPublish, onDone=onDone, waveSize=1).result(timeout=5)
+
+        assert threads[0] == ('a', threading.current_thread().name)
+        assert all(name.startswith('ncg-rollout-steps') for _, name in threads[1:])
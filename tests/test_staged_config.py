@@ -0,0 +1,205 @@
+"""
+Tests for v5_6/StagedConfig.py
+"""
+import base64
+import hashlib
+
+import pytest
+
+import v5_6.StagedConfig as staged
+from NcgConfig import NcgConfig
+from NcgRedis import NcgRedis
+
+
+def _b64(text, urlsafe=False):
+    encode = base64.urlsafe_b64encode if urlsafe else base64.b64encode
+    return encode(text.encode('utf-8')).decode('utf-8')
+
+
+class _Redis:
+    def __init__(self):
+        self.values = {}
+        self.expirations = {}
+        self.commands = []
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.commands.append(('set', key))
+        self.values[key] = value.encode('utf-8') if isinstance(value, str) else value
+        self.expirations[key] = ex
+
+    def expire(self, key, ttl):
+        self.commands.append(('expire', key))
+        if key not in self.values:
+            return False
+
+        self.expirations[key] = ttl
+        return True
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, redis: _Redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+
+        return results
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    monkeypatch.setattr(NcgConfig, 'config', {'controlplane': {'staged_files_ttl': 60}})
+    monkeypatch.setattr(NcgRedis, 'redis', _Redis(), raising=False)
+
+    return NcgRedis.redis
+
+
+def _stagedFiles(**files):
+    return {'files': [{'name': name, 'contents': _b64(text)} for name, text in files.items()]}
+
+
+class TestDecodeContents:
+    def test_standard_base64(self):
+        assert staged.decodeContents(_b64('server {}')) == b'server {}'
+
+    def test_urlsafe_base64(self):
+        text = 'location ~ ^/api/v1/???>>> {}'
+        assert '-' in _b64(text, urlsafe=True) or '_' in _b64(text, urlsafe=True)
+        assert staged.decodeContents(_b64(text, urlsafe=True)) == text.encode('utf-8')
+
+    def test_plain_contents(self):
+        assert staged.decodeContents('not base64!') == b'not base64!'
+
+
+class TestBuildManifest:
+    def test_manifest(self):
+        configFiles = {'files': [{'name': '/etc/nginx/nginx.conf', 'contents': _b64('events {}', urlsafe=True)}]}
+        auxFiles = {'files': [{'name': '/etc/nginx/mime.types', 'contents': _b64('types {}')}]}
+
+        manifest = staged.buildManifest(configFiles, auxFiles)
+
+        assert manifest['files'] == 2
+        assert manifest['bytes'] == len('events {}') + len('types {}')
+        assert manifest['configFiles'] == [{'name': '/etc/nginx/nginx.conf', 'size': 9,
+                                            'sha256': hashlib.sha256(b'events {}').hexdigest()}]
+        assert manifest['auxFiles'][0]['sha256'] == hashlib.sha256(b'types {}').hexdigest()
+
+    def test_empty(self):
+        manifest = staged.buildManifest({'files': []}, {'files': []})
+        assert manifest == {'configFiles': [], 'auxFiles': [], 'files': 0, 'bytes': 0}
+
+
+class TestDigestManifest:
+    def test_digests(self):
+        configFiles = {'files': [{'name': '/etc/nginx/nginx.conf', 'contents': _b64('events {}')}]}
+        auxFiles = {'files': [{'name': '/etc/nginx/mime.types', 'contents': _b64('types {}', urlsafe=True)}]}
+
+        assert staged.digestManifest(configFiles, auxFiles) == {
+            '/etc/nginx/nginx.conf': hashlib.sha256(b'events {}').hexdigest(),
+            '/etc/nginx/mime.types': hashlib.sha256(b'types {}').hexdigest()}
+
+    def test_same_contents_any_encoding(self):
+        standard = {'files': [{'name': 'a.conf', 'contents': _b64('location ~ ^/api/v1/???>>> {}')}]}
+        urlsafe = {'files': [{'name': 'a.conf', 'contents': _b64('location ~ ^/api/v1/???>>> {}', urlsafe=True)}]}
+
+        assert staged.digestManifest(standard, {'files': []}) == staged.digestManifest(urlsafe, {'files': []})
+
+
+class TestDiffManifests:
+    def test_diff(self):
+        previous = {'a.conf': '1', 'b.conf': '2', 'c.conf': '3'}
+        current = {'a.conf': '1', 'b.conf': '20', 'd.conf': '4'}
+
+        assert staged.diffManifests(previous, current) == {'added': ['d.conf'], 'changed': ['b.conf'],
+                                                           'removed': ['c.conf']}
+
+    def test_unchanged(self):
+        manifest = {'a.conf': '1', 'b.conf': '2'}
+
+        assert staged.diffManifests(manifest, dict(manifest)) == {'added': [], 'changed': [], 'removed': []}
+
+    def test_new_declaration(self):
+        assert staged.diffManifests({}, {'a.conf': '1'})['added'] == ['a.conf']
+
+
+class TestDeltaFiles:
+    def test_delta(self):
+        stagedFiles = {'name': '/etc/nginx', 'files': [{'name': 'a.conf', 'contents': 'YQ=='},
+                                                       {'name': 'b.conf', 'contents': 'Yg=='},
+                                                       {'name': 'c.conf', 'contents': 'Yw=='}]}
+        changes = {'added': ['c.conf'], 'changed': ['a.conf'], 'removed': []}
+
+        delta = staged.deltaFiles(stagedFiles, changes)
+
+        assert delta['name'] == '/etc/nginx'
+        assert [f['name'] for f in delta['files']] == ['a.conf', 'c.conf']
+        assert len(stagedFiles['files']) == 3
+
+    def test_unchanged(self):
+        stagedFiles = {'files': [{'name': 'a.conf', 'contents': 'YQ=='}]}
+
+        assert staged.deltaFiles(stagedFiles, {'added': [], 'changed': [], 'removed': []})['files'] == []
+
+
+class TestStoredFiles:
+    def test_store_and_load(self, redis):
+        stagedFiles = _stagedFiles(a='server {}', b='upstream {}')
+        manifest = staged.digestManifest(stagedFiles, {'files': []})
+
+        staged.storeFiles(stagedFiles, manifest, {})
+
+        assert staged.loadFiles(manifest) == {'a': _b64('server {}'), 'b': _b64('upstream {}')}
+        assert set(redis.expirations.values()) == {60}
+
+    def test_shared_across_declarations(self, redis):
+        first = _stagedFiles(a='server {}', b='upstream {}')
+        second = _stagedFiles(c='server {}')
+
+        staged.storeFiles(first, staged.digestManifest(first, {'files': []}), {})
+        staged.storeFiles(second, staged.digestManifest(second, {'files': []}), {})
+
+        assert len(redis.values) == 2
+        assert staged.loadFiles(staged.digestManifest(second, {'files': []})) == {'c': _b64('server {}')}
+
+    def test_previous_files_refreshed(self, redis):
+        previous = _stagedFiles(a='server {}', b='upstream {}')
+        previousManifest = staged.digestManifest(previous, {'files': []})
+        staged.storeFiles(previous, previousManifest, {})
+        redis.commands.clear()
+
+        current = _stagedFiles(a='server {}', b='upstream { zone }')
+        staged.storeFiles(current, staged.digestManifest(current, {'files': []}), previousManifest)
+
+        assert redis.commands == [('expire', f"ncg.stagedfile.{previousManifest['a']}"),
+                                  ('set', f"ncg.stagedfile.{hashlib.sha256(b'upstream { zone }').hexdigest()}")]
+
+    def test_expired_files_stored(self, redis):
+        stagedFiles = _stagedFiles(a='server {}')
+        manifest = staged.digestManifest(stagedFiles, {'files': []})
+
+        staged.storeFiles(stagedFiles, manifest, manifest)
+
+        assert staged.loadFiles(manifest) == {'a': _b64('server {}')}
+
+    def test_missing_files_not_loaded(self, redis):
+        stagedFiles = _stagedFiles(a='server {}')
+        staged.storeFiles(stagedFiles, staged.digestManifest(stagedFiles, {'files': []}), {})
+
+        manifest = staged.digestManifest(_stagedFiles(a='server {}', b='upstream {}'), {'files': []})
+
+        assert staged.loadFiles(manifest) == {'a': _b64('server {}')}
+        assert staged.loadFiles({}) == {}